@@ -1,31 +1,33 @@
 # Signatures.py
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa, padding
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.backends import default_backend
+from utils.metrics import registry
 
-def generate_keys():
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=2048,
-        backend=default_backend()
-    )
-    public_key = private_key.public_key()
-    return private_key, public_key
+VERIFY_SECONDS = registry.histogram('bchealth_signature_verify_seconds',
+                                    "Time to check one signature (cache misses only)", ['scheme'])
 
-def sign(message, private_key):
-    return private_key.sign(
-        message,
-        padding.PSS(
-            mgf=padding.MGF1(hashes.SHA256()),
-            salt_length=padding.PSS.MAX_LENGTH
-        ),
-        hashes.SHA256()
-    )
+class RSAPSSScheme:
+    """RSA-2048 with PSS padding and SHA-256. Kept for existing keys and reports."""
+    name = 'rsa-pss'
 
-def verify(message, signature, public_key):
-    try:
-        public_key.verify(
-            signature,
+    def generate_keys(self):
+        private_key = rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048,
+            backend=default_backend()
+        )
+        return private_key, private_key.public_key()
+
+    def accepts(self, key):
+        return isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey))
+
+    def sign(self, message, private_key):
+        return private_key.sign(
             message,
             padding.PSS(
                 mgf=padding.MGF1(hashes.SHA256()),
@@ -33,8 +35,93 @@ def verify(message, signature, public_key):
             ),
             hashes.SHA256()
         )
-        return True
-    except:
+
+    def verify(self, message, signature, public_key):
+        try:
+            public_key.verify(
+                signature,
+                message,
+                padding.PSS(
+                    mgf=padding.MGF1(hashes.SHA256()),
+                    salt_length=padding.PSS.MAX_LENGTH
+                ),
+                hashes.SHA256()
+            )
+            return True
+        except Exception:
+            return False
+
+    def verify_batch(self, items):
+        """items: (message, signature, public_key) tuples. Returns a list of results."""
+        return [self.verify(message, signature, public_key) for message, signature, public_key in items]
+
+class Ed25519Scheme:
+    """
+    Ed25519: key generation in microseconds rather than RSA's tens of
+    milliseconds, several times faster signing and 64-byte signatures (RSA
+    uses 256). Verification is about 3x slower than RSA-PSS. The default for
+    new keys.
+    """
+    name = 'ed25519'
+
+    def generate_keys(self):
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        return private_key, private_key.public_key()
+
+    def accepts(self, key):
+        return isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey))
+
+    def sign(self, message, private_key):
+        return private_key.sign(message)
+
+    def verify(self, message, signature, public_key):
+        try:
+            public_key.verify(signature, message)
+            return True
+        except Exception:
+            return False
+
+    def verify_batch(self, items):
+        """
+        items: (message, signature, public_key) tuples. Returns a list of results.
+        The cryptography package has no native Ed25519 batch check, so this runs
+        the checks back to back in one call; HealthReport.verify_batch hands
+        each worker thread one such chunk. A backend with real batch
+        verification can replace this method without changing callers.
+        """
+        verify = self.verify
+        return [verify(message, signature, public_key) for message, signature, public_key in items]
+
+# Registered signature schemes by the tag stored in reports
+SCHEMES = {scheme.name: scheme for scheme in (RSAPSSScheme(), Ed25519Scheme())}
+DEFAULT_SCHEME = 'ed25519'
+# Reports signed before schemes were tagged are RSA-PSS
+LEGACY_SCHEME = 'rsa-pss'
+
+def get_scheme(name=None):
+    """Returns the scheme registered under name (the default scheme if None)."""
+    try:
+        return SCHEMES[name or DEFAULT_SCHEME]
+    except KeyError:
+        raise ValueError(f"Unknown signature scheme: {name}")
+
+def scheme_for_key(key):
+    """Returns the scheme a private or public key belongs to."""
+    for scheme in SCHEMES.values():
+        if scheme.accepts(key):
+            return scheme
+    raise ValueError(f"No signature scheme for key type {type(key).__name__}")
+
+def generate_keys(scheme=None):
+    return get_scheme(scheme).generate_keys()
+
+def sign(message, private_key):
+    return scheme_for_key(private_key).sign(message, private_key)
+
+def verify(message, signature, public_key):
+    try:
+        return scheme_for_key(public_key).verify(message, signature, public_key)
+    except ValueError:
         return False
 
 def serialize_public_key(public_key):
@@ -48,3 +135,145 @@ def deserialize_public_key(serialized_public_key):
         serialized_public_key,
         backend=default_backend()
     )
+
+class VerificationCache:
+    """
+    Bounded, thread-safe LRU cache of signature verification results.
+    Entries are keyed by a digest of (message, signature, serialized public key),
+    so a report that is checked by a miner, by the network vote and again when a
+    block is rendered only pays for signature verification once.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(message, signature, serialized_public_key):
+        digest = hashlib.sha256()
+        for part in (message, signature, serialized_public_key):
+            # Length-prefix each part so different splits can never collide
+            digest.update(len(part).to_bytes(8, 'big'))
+            digest.update(part)
+        return digest.digest()
+
+    def get(self, key):
+        """Returns the cached result for key, or None if it has not been verified yet."""
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._results), 'maxsize': self.maxsize}
+
+# Shared by every component that verifies report signatures
+verification_cache = VerificationCache()
+registry.counter('bchealth_signature_cache_hits_total', "Signature checks answered by the verification cache") \
+    .set_function(lambda: verification_cache.hits)
+registry.counter('bchealth_signature_cache_misses_total', "Signature checks not found in the verification cache") \
+    .set_function(lambda: verification_cache.misses)
+registry.gauge('bchealth_signature_cache_size', "Results held in the verification cache") \
+    .set_function(lambda: len(verification_cache._results))
+
+def verify_cached(message, signature, key_id, public_key, cache=verification_cache, scheme=None):
+    """
+    Same as verify(), but consults the verification cache first.
+    key_id identifies the public key in the cache key (a fingerprint from the
+    key registry); on a hit the signature check is skipped entirely.
+    scheme defaults to the one the public key belongs to.
+    """
+    key = cache.make_key(message, signature, key_id)
+    result = cache.get(key)
+    if result is None:
+        scheme = scheme or scheme_for_key(public_key)
+        start = time.perf_counter()
+        result = scheme.verify(message, signature, public_key)
+        VERIFY_SECONDS.labels(scheme.name).observe(time.perf_counter() - start)
+        cache.put(key, result)
+    return result
+
+def key_fingerprint(public_key):
+    """Short, stable id for a public key: truncated SHA-256 of its DER encoding."""
+    der = public_key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).hexdigest()[:32]
+
+class KeyRegistry:
+    """
+    In-memory registry of public keys indexed by fingerprint.
+    A doctor's key is registered once; reports then refer to it by fingerprint
+    and verification reuses the parsed key object instead of loading PEM again.
+    """
+    def __init__(self):
+        self._keys = {}        # fingerprint -> parsed public key
+        self._serialized = {}  # fingerprint -> PEM bytes
+        self._by_pem = {}      # PEM bytes -> fingerprint, for reports that embed the key
+        self._lock = threading.Lock()
+
+    def register_key(self, public_key):
+        """Registers a parsed public key and returns its fingerprint."""
+        fingerprint = key_fingerprint(public_key)
+        pem = serialize_public_key(public_key)
+        with self._lock:
+            self._keys.setdefault(fingerprint, public_key)
+            self._serialized.setdefault(fingerprint, pem)
+            self._by_pem.setdefault(pem, fingerprint)
+        return fingerprint
+
+    def register(self, serialized_public_key):
+        """
+        Registers a PEM-encoded public key (bytes) and returns its fingerprint.
+        Each distinct PEM is parsed only once.
+        """
+        with self._lock:
+            fingerprint = self._by_pem.get(serialized_public_key)
+        if fingerprint is not None:
+            return fingerprint
+        public_key = deserialize_public_key(serialized_public_key)
+        fingerprint = key_fingerprint(public_key)
+        with self._lock:
+            self._keys.setdefault(fingerprint, public_key)
+            self._serialized.setdefault(fingerprint, serialized_public_key)
+            self._by_pem[serialized_public_key] = fingerprint
+        return fingerprint
+
+    def get(self, fingerprint):
+        """Returns the parsed public key for fingerprint, or None if it is unknown."""
+        return self._keys.get(fingerprint)
+
+    def get_serialized(self, fingerprint):
+        """Returns the PEM bytes registered under fingerprint, or None."""
+        return self._serialized.get(fingerprint)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+# Process-wide registry used by wallets and report verification
+key_registry = KeyRegistry()
@@ -0,0 +1,238 @@
+# benchmarks/pipeline.py
+"""
+Throughput of each stage of the report pipeline, plus end-to-end report
+confirmation latency, written as JSON so runs can be compared.
+
+Stages:
+    generation   signed reports/s from the LoadGenerator
+    hashing      hashes/s from proof_of_work.mine_block (one thread)
+    verification signature verifications/s through HealthReport.verify_batch
+    admission    reports/s admitted by a validating Mempool
+    assembly     time for the BlockTemplateBuilder to take a block's reports
+                 (within the count and byte budgets) and build the block
+    consensus    time spent in NodeNetwork.broadcast_block per block
+    end_to_end   a MinerPool fed by the LoadGenerator at a fixed rate; latency
+                 is from submission to the mempool until the block is accepted.
+                 --e2e-max-wait seals partial blocks, bounding latency at low rates
+
+The signature cache is cleared before each stage that verifies, so every
+signature is checked.
+
+Run from the repository root:
+    python -m benchmarks.pipeline [--reports 2000] [--e2e-rate 50] [--output results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import threading
+import time
+from blockchain.block import Block
+from history.history_tracker import PatientHistoryTracker
+from mempool.mempool import Mempool
+from miner_app import BlockTemplateBuilder, MinerPool
+from network.node import NodeNetwork
+from proof_of_work import ThreadMiningBackend, mine_block
+from reports.health_report import HealthReport
+from reports.load_generator import LoadGenerator
+from Signatures import DEFAULT_SCHEME, verification_cache
+from utils.logger import configure_logging
+from wallets.doctor_wallet import DoctorWallet
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    def at(q):
+        return values[min(int(q * len(values)), len(values) - 1)]
+    return {'count': len(values), 'mean': sum(values) / len(values),
+            'p50': at(0.50), 'p90': at(0.90), 'p99': at(0.99), 'max': values[-1]}
+
+def genesis(difficulty):
+    block = Block(0, [], "0", difficulty)
+    block.timestamp = 0
+    block.hash = block.compute_hash()
+    return block
+
+def received_copies(reports):
+    """Reports decoded from bytes, as a node receives them: nothing verified or cached."""
+    return [HealthReport.from_bytes(report.to_bytes()) for report in reports]
+
+def bench_generation(generator, count):
+    reports = []
+    result = generator.run(reports.append, total=count)
+    return reports, {'reports': result['generated'], 'reports_per_s': result['rate'],
+                     'workers': generator.workers}
+
+def bench_hashing(seconds):
+    # Difficulty 64 is never met, so mine_block hashes until the timer stops it
+    block = Block(1, [], "0" * 64, 64)
+    stop_flag = threading.Event()
+    timer = threading.Timer(seconds, stop_flag.set)
+    start = time.perf_counter()
+    timer.start()
+    mine_block(block, 64, stop_flag)
+    elapsed = time.perf_counter() - start
+    return {'hashes': block.nonce, 'hashes_per_s': block.nonce / elapsed}
+
+def bench_verification(reports):
+    received = received_copies(reports)
+    verification_cache.clear()
+    start = time.perf_counter()
+    valid = sum(1 for result in HealthReport.verify_batch(received) if result)
+    elapsed = time.perf_counter() - start
+    return {'verifications_per_s': len(received) / elapsed, 'all_valid': valid == len(received)}
+
+def bench_admission(reports):
+    received = received_copies(reports)
+    mempool = Mempool(validate_on_admission=True)
+    verification_cache.clear()
+    start = time.perf_counter()
+    admitted = sum(1 for report in received if mempool.add_report(report))
+    elapsed = time.perf_counter() - start
+    return {'admitted': admitted, 'rejected': mempool.rejected, 'admissions_per_s': len(received) / elapsed}
+
+def bench_assembly(reports, per_block, max_bytes):
+    mempool = Mempool()
+    for report in reports:
+        mempool.add_report(report)
+    builder = BlockTemplateBuilder(mempool, per_block, max_bytes)
+    parent = genesis(1)
+    times, sizes = [], []
+    while mempool.size() >= per_block:
+        start = time.perf_counter()
+        block = builder.build(parent, builder.take(timeout=0), 1)
+        times.append(time.perf_counter() - start)
+        sizes.append(len(block.transactions))
+    return {'reports_per_block': per_block, 'max_block_bytes': max_bytes,
+            'reports_in_block': percentiles(sizes), 'block_ms': percentiles([t * 1000 for t in times])}
+
+def bench_consensus(reports, per_block, difficulty):
+    # Mine a chain first; only broadcast_block itself is timed
+    chain = [genesis(difficulty)]
+    blocks = []
+    never = threading.Event()
+    for i in range(0, len(reports) - per_block + 1, per_block):
+        parent = blocks[-1] if blocks else chain[0]
+        block = Block(parent.index + 1, received_copies(reports[i:i + per_block]), parent.hash, difficulty)
+        blocks.append(mine_block(block, difficulty, never))
+
+    node = NodeNetwork(num_miners=1, difficulty=difficulty)
+    node.blockchain = chain
+    history_tracker = PatientHistoryTracker()
+    verification_cache.clear()
+    times = []
+    accepted = 0
+    for block in blocks:
+        start = time.perf_counter()
+        accepted += node.broadcast_block(block, lambda report: report.verify_signature(), history_tracker)
+        times.append(time.perf_counter() - start)
+    return {'blocks': len(blocks), 'accepted': accepted, 'reports_per_block': per_block,
+            'broadcast_ms': percentiles([t * 1000 for t in times])}
+
+def bench_end_to_end(generator, duration, miners, per_block, difficulty, max_wait=None):
+    mempool = Mempool(validate_on_admission=True)
+    node = NodeNetwork(num_miners=miners, difficulty=difficulty)
+    node.blockchain = [genesis(difficulty)]
+    history_tracker = PatientHistoryTracker()
+    submitted = {}  # digest -> submission time
+    latencies = []
+
+    def on_block(block):
+        now = time.perf_counter()
+        for report in block.transactions:
+            sent = submitted.pop(report.digest(), None)
+            if sent is not None:
+                latencies.append(now - sent)
+
+    def submit(report):
+        submitted[report.digest()] = time.perf_counter()
+        mempool.add_report(report)
+
+    pool = MinerPool(miners, blockchain=node.blockchain, mempool=mempool, difficulty=difficulty,
+                     broadcast_fn=lambda b: node.broadcast_block(b, lambda r: mempool.is_admitted(r), history_tracker),
+                     mining_backend=ThreadMiningBackend(), max_reports_per_block=per_block,
+                     max_report_wait=max_wait)
+    node.add_tip_listener(on_block)
+    node.add_tip_listener(lambda block: mempool.confirm(block.transactions))
+    node.add_tip_listener(pool.on_new_tip)
+    pool.start()
+    result = generator.run(submit, duration=duration)
+    time.sleep(2.0) # Let the last full blocks confirm
+    pool.stop(timeout=5)
+    return {
+        'target_rate': generator.rate,
+        'max_report_wait': max_wait,
+        'offered_rate': result['rate'],
+        'submitted': result['generated'],
+        'confirmed': len(latencies),
+        'confirmed_per_s': len(latencies) / duration,
+        'blocks': len(node.blockchain) - 1,
+        'reorgs': node.reorgs,
+        'latency_s': percentiles(latencies),
+    }
+
+def run(reports=2000, workers=None, seed=1, doctors=5, patients=1000, per_block=100,
+        max_block_bytes=None, hash_seconds=3.0, consensus_difficulty=2, e2e_rate=50.0, e2e_duration=20.0,
+        e2e_miners=2, e2e_difficulty=3, e2e_per_block=10, e2e_max_wait=None):
+    """Runs every stage and returns the measurements as a dict."""
+    doctor_wallets = [DoctorWallet(f"doctor_{i}") for i in range(doctors)]
+    patient_ids = [f"patient_{i}" for i in range(patients)]
+    results = {
+        'config': {
+            'reports': reports, 'seed': seed, 'doctors': doctors, 'patients': patients,
+            'reports_per_block': per_block, 'scheme': DEFAULT_SCHEME,
+            'cpus': os.cpu_count(), 'python': platform.python_version(), 'started_at': time.time(),
+        },
+    }
+    generator = LoadGenerator(doctor_wallets, patient_ids, workers=workers, seed=seed)
+    try:
+        generated, results['generation'] = bench_generation(generator, reports)
+    finally:
+        generator.close()
+    results['hashing'] = bench_hashing(hash_seconds)
+    results['verification'] = bench_verification(generated)
+    results['admission'] = bench_admission(generated)
+    results['assembly'] = bench_assembly(generated, per_block, max_block_bytes)
+    results['consensus'] = bench_consensus(generated, per_block, consensus_difficulty)
+
+    # A different seed, so none of these reports were seen in the earlier stages
+    generator = LoadGenerator(doctor_wallets, patient_ids, rate=e2e_rate, workers=workers, seed=seed + 1)
+    try:
+        results['end_to_end'] = bench_end_to_end(generator, e2e_duration, e2e_miners,
+                                                 e2e_per_block, e2e_difficulty, e2e_max_wait)
+    finally:
+        generator.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--reports', type=int, default=2000, help="reports used by the per-stage benchmarks")
+    parser.add_argument('--workers', type=int, default=None, help="signing processes (0 signs in-process)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--per-block', type=int, default=100, help="reports per block for assembly and consensus")
+    parser.add_argument('--max-block-bytes', type=int, default=None, help="byte budget for assembly")
+    parser.add_argument('--hash-seconds', type=float, default=3.0)
+    parser.add_argument('--e2e-rate', type=float, default=50.0, help="reports per second offered end to end")
+    parser.add_argument('--e2e-duration', type=float, default=20.0)
+    parser.add_argument('--e2e-miners', type=int, default=2)
+    parser.add_argument('--e2e-difficulty', type=int, default=3)
+    parser.add_argument('--e2e-per-block', type=int, default=10)
+    parser.add_argument('--e2e-max-wait', type=float, default=None,
+                        help="seconds before a partial block is sealed end to end")
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    configure_logging(logging.WARNING)
+    results = run(reports=args.reports, workers=args.workers, seed=args.seed, per_block=args.per_block,
+                  max_block_bytes=args.max_block_bytes, hash_seconds=args.hash_seconds, e2e_rate=args.e2e_rate, e2e_duration=args.e2e_duration,
+                  e2e_miners=args.e2e_miners, e2e_difficulty=args.e2e_difficulty,
+                  e2e_per_block=args.e2e_per_block, e2e_max_wait=args.e2e_max_wait)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
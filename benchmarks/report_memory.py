@@ -0,0 +1,75 @@
+# benchmarks/report_memory.py
+"""
+Memory per million stored reports: plain dicts (the previous in-block and
+history representation) versus slotted, interned HealthReport objects.
+
+Run from the repository root:
+    python -m benchmarks.report_memory [num_reports]
+"""
+import base64
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from reports.health_report import HealthReport
+
+def make_payloads(count, seed=42):
+    """JSON payloads shaped like HealthReport.generate output, as they arrive from storage or peers."""
+    rng = random.Random(seed)
+    doctors = [(f"doctor_{i}", os.urandom(16).hex()) for i in range(3)]
+    payloads = []
+    for i in range(count):
+        doctor_id, fingerprint = rng.choice(doctors)
+        payloads.append(json.dumps({
+            'patient_id': f"patient_{rng.randrange(10000)}",
+            'doctor_id': doctor_id,
+            'symptoms': rng.choice(["cough", "fever", "fatigue", "headache", "nausea", "sore throat", "dizziness"]),
+            'diagnosis': rng.choice(["flu", "cold", "migraine", "infection", "gastritis", "bronchitis", "allergies"]),
+            'vitals': {
+                "BP": f"{rng.randint(110, 140)}/{rng.randint(70, 90)}",
+                "HR": rng.randint(60, 100),
+                "SpO2": f"{rng.randint(95, 100)}%",
+                "Temp": f"{rng.uniform(97.0, 102.0):.1f} F"
+            },
+            'notes': rng.choice(["Prescribed rest and fluids.", "Recommended blood test.", "No critical signs."]),
+            'medications': rng.choice(["Paracetamol", "Ibuprofen", "Amoxicillin", "None"]),
+            'allergies': rng.choice(["Pollen", "Dust", "Penicillin", "None"]),
+            'follow_up_date': time.time() + rng.randint(7, 30) * 86400,
+            'hospital_clinic': rng.choice(["City General Hospital", "Community Health Clinic",
+                                           "St. Jude's Medical Center", "Family Care Doctors"]),
+            'patient_age': rng.randint(18, 80),
+            'patient_gender': rng.choice(["Male", "Female", "Other"]),
+            'timestamp': time.time() + i,
+            'doctor_key_fingerprint': fingerprint,
+            'format_version': HealthReport.FORMAT_VERSION,
+            'signature': base64.b64encode(rng.randbytes(256)).decode('utf-8'),
+        }))
+    return payloads
+
+def measure(build, payloads):
+    """Returns bytes retained by the objects build() creates from the payloads."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    stored = [build(payload) for payload in payloads]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del stored
+    return after - before
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    payloads = make_payloads(count)
+    scale = 1000000 / count
+    results = {
+        'dict': measure(json.loads, payloads),
+        'HealthReport (slots, interned)': measure(lambda p: HealthReport.from_dict(json.loads(p)), payloads),
+    }
+    print(f"Reports stored: {count}")
+    for name, used in results.items():
+        print(f"  {name:32s}: {used / count:8.0f} B/report, {used * scale / 2**20:8.1f} MiB per million")
+    print(f"  Reduction: {1 - results['HealthReport (slots, interned)'] / results['dict']:.0%}")
+
+if __name__ == "__main__":
+    main()
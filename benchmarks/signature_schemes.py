@@ -0,0 +1,73 @@
+# benchmarks/signature_schemes.py
+"""
+Key generation, signing and verification throughput, and serialized block
+size, for each signature scheme in Signatures.SCHEMES.
+
+Verification is measured one report at a time (verify_signature) and through
+HealthReport.verify_batch, with the verification cache cleared before each
+run so every signature is actually checked.
+
+Run from the repository root:
+    python -m benchmarks.signature_schemes [num_reports] [reports_per_block]
+"""
+import sys
+import time
+from blockchain.block import Block
+from reports.health_report import HealthReport
+from Signatures import SCHEMES, verification_cache
+from wallets.doctor_wallet import DoctorWallet
+
+def rate(count, seconds):
+    return count / seconds if seconds > 0 else float('inf')
+
+def bench_scheme(name, count, per_block):
+    start = time.perf_counter()
+    wallets = [DoctorWallet(f"doctor_{i}", scheme=name) for i in range(10)]
+    for wallet in wallets:
+        wallet.get_public_key() # Wallets create their keys lazily; time the creation here
+    keygen = rate(len(wallets), time.perf_counter() - start)
+
+    start = time.perf_counter()
+    reports = [HealthReport.generate(f"patient_{i}", wallets[i % len(wallets)]) for i in range(count)]
+    sign_time = time.perf_counter() - start
+
+    # Reports decoded from bytes, as a node receives them: nothing cached on the objects
+    received = [HealthReport.from_bytes(report.to_bytes()) for report in reports]
+    verification_cache.clear()
+    start = time.perf_counter()
+    single_ok = sum(1 for report in received if report.verify_signature())
+    verify_single = rate(count, time.perf_counter() - start)
+
+    received = [HealthReport.from_bytes(report.to_bytes()) for report in reports]
+    verification_cache.clear()
+    start = time.perf_counter()
+    batch_ok = sum(1 for result in HealthReport.verify_batch(received) if result)
+    verify_batch = rate(count, time.perf_counter() - start)
+
+    block = Block(1, reports[:per_block], "0" * 64, 1)
+    return {
+        'keygen_per_s': keygen,
+        'sign_per_s': rate(count, sign_time),
+        'verify_per_s': verify_single,
+        'verify_batch_per_s': verify_batch,
+        'all_valid': single_ok == batch_ok == count,
+        'signature_bytes': len(reports[0].signature),
+        'report_bytes': len(reports[0].to_bytes()),
+        'block_bytes': len(block.serialize()),
+    }
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    per_block = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    results = {name: bench_scheme(name, count, per_block) for name in SCHEMES}
+
+    print(f"Reports: {count}, block size measured with {per_block} reports")
+    print(f"  {'scheme':10s} {'keygen/s':>10s} {'sign/s':>10s} {'verify/s':>10s} {'batch/s':>10s} "
+          f"{'sig B':>6s} {'report B':>9s} {'block B':>9s}")
+    for name, r in results.items():
+        print(f"  {name:10s} {r['keygen_per_s']:10.0f} {r['sign_per_s']:10.0f} {r['verify_per_s']:10.0f} "
+              f"{r['verify_batch_per_s']:10.0f} {r['signature_bytes']:6d} {r['report_bytes']:9d} {r['block_bytes']:9d}"
+              + ("" if r['all_valid'] else "  (VERIFICATION FAILURES)"))
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,103 @@
 import time
 import hashlib
 import json
-from reports.health_report import HealthReport # Import HealthReport to use its from_dict method
+from reports.health_report import HealthReport
+from blockchain.merkle import MerkleTree, leaf_hash
+from utils.encoding import encode, decode
+
+# First byte of Block.serialize() output; older stores hold JSON, which starts with '{'
+BLOCK_STORAGE_VERSION = 1
 
 class Block:
+    """
+    Version 2 blocks hash a canonical binary header and use report digests
+    (HealthReport.digest) as merkle leaves. Version 1 blocks, loaded from
+    older stores, keep the string header and JSON leaves they were mined with.
+    """
+    VERSION = 2
+
     def __init__(self, index, transactions, previous_hash, difficulty):
+        self.version = Block.VERSION
         self.index = index
         self.timestamp = time.time()
-        self.transactions = transactions  # list of health reports (dicts)
+        # HealthReport objects; dicts (e.g. imported JSON) are parsed once here
+        self.transactions = [HealthReport.from_dict(tx) for tx in transactions]
         self.previous_hash = previous_hash
         self.difficulty = difficulty
         self.nonce = 0
-        self.merkle_root = self.compute_merkle_root()
+        self.merkle_tree = MerkleTree(self.leaf_hashes())
+        self.merkle_root = self.merkle_tree.root
         self.hash = self.compute_hash()
 
+    def leaf_hashes(self):
+        """
+        Merkle leaves for the transactions: the report digest (SHA-256 of its
+        canonical bytes) for version 2 blocks, SHA-256 of key-sorted JSON for
+        version 1 blocks.
+        """
+        if self.version >= 2:
+            return [tx.digest() for tx in self.transactions]
+        return [leaf_hash(tx.to_dict()) for tx in self.transactions]
+
     def compute_merkle_root(self):
-        tx_hashes = [hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).hexdigest() for tx in self.transactions]
-        if not tx_hashes:
-            return ''
-        while len(tx_hashes) > 1:
-            temp = []
-            for i in range(0, len(tx_hashes), 2):
-                left = tx_hashes[i]
-                right = tx_hashes[i+1] if i + 1 < len(tx_hashes) else left
-                combined = left + right
-                temp.append(hashlib.sha256(combined.encode()).hexdigest())
-            tx_hashes = temp
-        return tx_hashes[0]
+        """Rebuilds the merkle tree from the transactions and returns its root."""
+        return MerkleTree(self.leaf_hashes()).root
+
+    def get_merkle_tree(self):
+        """
+        Returns the block's merkle tree, with all levels kept for inclusion proofs.
+        Built once per block; blocks loaded from storage build it on first use.
+        """
+        if self.merkle_tree is None:
+            self.merkle_tree = MerkleTree(self.leaf_hashes())
+        return self.merkle_tree
+
+    def merkle_proof(self, tx_index):
+        """Inclusion proof for one transaction; check it with blockchain.merkle.verify_proof."""
+        return self.get_merkle_tree().proof(tx_index)
+
+    def header_prefix(self):
+        """
+        Returns the fixed part of the block header as bytes: everything that
+        goes into the block hash except the nonce. Transactions are committed
+        through the merkle root, so the header size does not depend on how
+        many reports the block carries.
+        Version 2 headers use the canonical binary encoding (which is
+        self-delimiting, so the nonce can follow directly).
+        """
+        if self.version >= 2:
+            return b'BH' + encode([self.version, self.index, self.timestamp, self.merkle_root,
+                                   self.previous_hash, self.difficulty])
+        header = f"{self.index}|{self.timestamp!r}|{self.merkle_root}|{self.previous_hash}|{self.difficulty}|"
+        return header.encode('utf-8')
 
     def compute_hash(self):
-        block_data = {
-            'index': self.index,
-            'timestamp': self.timestamp,
-            'transactions': self.transactions,
-            'previous_hash': self.previous_hash,
-            'nonce': self.nonce,
-            'difficulty': self.difficulty
-        }
-        block_string = json.dumps(block_data, sort_keys=True)
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        """
+        Canonical block hash: SHA-256 over the header prefix followed by the nonce.
+        Used both when mining (see proof_of_work.mine_block) and when validating.
+        """
+        return hashlib.sha256(self.header_prefix() + str(self.nonce).encode('utf-8')).hexdigest()
+
+    def has_valid_proof(self):
+        """
+        Checks that the stored hash matches the header and meets the block's difficulty.
+        The merkle root is recomputed so tampered transactions are detected too.
+        """
+        if self.merkle_root != self.compute_merkle_root():
+            return False
+        return self.hash == self.compute_hash() and self.hash.startswith('0' * self.difficulty)
 
-    def to_dict(self):
+    def to_dict(self, transaction_fn=None):
+        """
+        JSON-friendly export of the block. Transactions are converted with
+        transaction_fn (default: HealthReport.to_dict).
+        """
+        transaction_fn = transaction_fn or (lambda tx: tx.to_dict())
         return {
+            'version': self.version,
             'index': self.index,
             'timestamp': self.timestamp,
-            'transactions': self.transactions,
+            'transactions': [transaction_fn(tx) for tx in self.transactions],
             'previous_hash': self.previous_hash,
             'nonce': self.nonce,
             'difficulty': self.difficulty,
@@ -52,12 +105,50 @@ class Block:
             'hash': self.hash
         }
 
+    @classmethod
+    def from_dict(cls, block_dict):
+        """
+        Rebuilds a Block from to_dict() output without recomputing anything.
+        The stored merkle root and hash are taken as-is; use has_valid_proof()
+        to check them.
+        """
+        block = cls.__new__(cls)
+        block.version = block_dict.get('version', 1)
+        block.index = block_dict['index']
+        block.timestamp = block_dict['timestamp']
+        block.transactions = [HealthReport.from_dict(tx) for tx in block_dict['transactions']]
+        block.previous_hash = block_dict['previous_hash']
+        block.difficulty = block_dict['difficulty']
+        block.nonce = block_dict['nonce']
+        block.merkle_root = block_dict['merkle_root']
+        block.merkle_tree = None
+        block.hash = block_dict['hash']
+        return block
+
+    def serialize(self):
+        """
+        Storage form for the block store: a version byte, then the canonical
+        encoding of the block with each report in its HealthReport.to_bytes()
+        form (raw signature bytes instead of base64).
+        """
+        block_data = self.to_dict(transaction_fn=HealthReport.to_bytes)
+        return bytes([BLOCK_STORAGE_VERSION]) + encode(block_data)
+
+    @classmethod
+    def deserialize(cls, data):
+        """Inverse of serialize(); also reads the JSON form written by older stores."""
+        if data[:1] == b'{':
+            return cls.from_dict(json.loads(bytes(data)))
+        if data[0] != BLOCK_STORAGE_VERSION:
+            raise ValueError(f"Unsupported block storage version {data[0]}")
+        block_data = decode(data, 1)
+        block_data['transactions'] = [HealthReport.from_bytes(tx) for tx in block_data['transactions']]
+        return cls.from_dict(block_data)
+
     def __str__(self):
         transactions_str = ""
         if self.transactions:
-            for i, tx_dict in enumerate(self.transactions, 1):
-                # Reconstruct HealthReport object to easily access its attributes
-                report = HealthReport.from_dict(tx_dict)
+            for i, report in enumerate(self.transactions, 1):
                 vitals_str = ", ".join(f"{k}: {v}" for k, v in report.vitals.items())
                 
                 follow_up_date_str = time.ctime(report.follow_up_date) if report.follow_up_date else 'N/A'
@@ -75,7 +166,7 @@ class Block:
                     f"      Allergies   : {report.allergies}\n"
                     f"      Follow-up   : {follow_up_date_str}\n"
                     f"      Notes       : {report.notes}\n"
-                    f"      Signed by   : {report.doctor_public_key_serialized[:10]}...\n"
+                    f"      Signed by   : {report.get_signer_id()[:10]}...\n"
                     f"      Signature Valid: {report.verify_signature()}\n" # Display signature validity
                 )
         else:
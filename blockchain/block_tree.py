@@ -0,0 +1,190 @@
+# blockchain/block_tree.py
+from collections import OrderedDict
+
+def difficulty_work(difficulty):
+    """Expected hashes to mine a block: 16 ** difficulty (leading hex zeros)."""
+    return 16 ** difficulty
+
+def block_work(block):
+    return difficulty_work(block.difficulty)
+
+class TreeEntry:
+    __slots__ = ('hash', 'previous_hash', 'height', 'total_work', 'on_main', 'block')
+
+    def __init__(self, block_hash, previous_hash, height, total_work, block=None):
+        self.hash = block_hash
+        self.previous_hash = previous_hash
+        self.height = height
+        self.total_work = total_work
+        self.on_main = block is None
+        # Side-branch blocks are held here; main-chain blocks are read from the chain
+        self.block = block
+
+    @classmethod
+    def side(cls, block, total_work):
+        return cls(block.hash, block.previous_hash, block.index, total_work, block)
+
+class TreeUpdate:
+    """
+    Result of BlockTree.add. status is one of 'connected' (the main chain
+    changed), 'side' (stored on a branch with no more work than the main
+    chain), 'orphan' (parent unknown), 'duplicate' or 'invalid'.
+    disconnected lists the blocks removed from the main chain, tip first;
+    connected lists the blocks added to it, in chain order.
+    """
+    def __init__(self, status, disconnected=None, connected=None):
+        self.status = status
+        self.disconnected = disconnected or []
+        self.connected = connected or []
+
+    def __repr__(self):
+        return (f"TreeUpdate({self.status!r}, disconnected={len(self.disconnected)}, "
+                f"connected={len(self.connected)})")
+
+class BlockTree:
+    """
+    Every known block indexed by hash, with fork choice by cumulative work.
+
+    The main chain is kept in `chain` (a list or a BlockStore; anything with
+    len(), indexing, append() and either truncate() or slice deletion).
+    Main-chain entries are built from the chain's headers() when it has them
+    (a BlockStore), so indexing a stored chain decodes no blocks; full blocks
+    are read only when a reorg disconnects them. Blocks on other branches
+    are held in their tree entries. The main chain is the branch with the
+    most cumulative work; on a tie the branch seen first stays. When another
+    branch overtakes it, add() truncates the chain back to the fork point
+    and appends the new branch.
+
+    Blocks whose parent is unknown wait in a bounded orphan pool and are
+    connected as soon as the parent arrives. Side-branch blocks more than
+    `prune_depth` below the tip are dropped. Blocks declaring a difficulty
+    below `min_difficulty` (the network's) are invalid: their proof of work
+    only meets their own claim, so they would add work almost for free.
+    """
+    def __init__(self, chain, max_orphans=256, prune_depth=100, min_difficulty=0):
+        self.chain = chain
+        self.min_difficulty = min_difficulty
+        self.max_orphans = max_orphans
+        self.prune_depth = prune_depth
+        self.entries = {}             # hash -> TreeEntry
+        self.orphans = OrderedDict()  # hash -> Block, oldest first
+        self.side = set()             # hashes of entries not on the main chain
+        if hasattr(chain, 'headers'):
+            headers = chain.headers()
+        else:
+            headers = ((block.hash, block.difficulty) for block in chain)
+        total_work = 0
+        previous_hash = None # The genesis block has no parent in the tree
+        for height, (block_hash, difficulty) in enumerate(headers):
+            total_work += difficulty_work(difficulty)
+            self.entries[block_hash] = TreeEntry(block_hash, previous_hash, height, total_work)
+            previous_hash = block_hash
+
+    def __contains__(self, block_hash):
+        return block_hash in self.entries or block_hash in self.orphans
+
+    def is_orphan(self, block_hash):
+        return block_hash in self.orphans
+
+    @property
+    def tip(self):
+        return self.entries[self.chain[-1].hash]
+
+    def get(self, block_hash):
+        """Returns any known block (main chain, side branch or orphan) by hash, or None."""
+        entry = self.entries.get(block_hash)
+        if entry is None:
+            return self.orphans.get(block_hash)
+        return self.chain[entry.height] if entry.on_main else entry.block
+
+    def main_chain_height(self, block_hash):
+        """Height of the block if it is on the main chain, else None."""
+        entry = self.entries.get(block_hash)
+        return entry.height if entry is not None and entry.on_main else None
+
+    def locator(self):
+        """Main-chain hashes from the tip back to genesis, with exponentially growing gaps."""
+        hashes, height, step = [], len(self.chain) - 1, 1
+        while height > 0:
+            hashes.append(self.chain[height].hash)
+            if len(hashes) >= 10:
+                step *= 2
+            height -= step
+        hashes.append(self.chain[0].hash)
+        return hashes
+
+    def add(self, block):
+        """Adds a block (already checked for proof of work and signatures). Returns a TreeUpdate."""
+        if block.hash in self:
+            return TreeUpdate('duplicate')
+        if block.difficulty < self.min_difficulty:
+            return TreeUpdate('invalid')
+        parent = self.entries.get(block.previous_hash)
+        if parent is None:
+            self.orphans[block.hash] = block
+            while len(self.orphans) > self.max_orphans:
+                self.orphans.popitem(last=False)
+            return TreeUpdate('orphan')
+        if block.index != parent.height + 1:
+            return TreeUpdate('invalid')
+
+        # Insert the block, then any orphans that were waiting for it (and their descendants)
+        added = []
+        pending = [(block, parent)]
+        while pending:
+            new_block, new_parent = pending.pop()
+            entry = TreeEntry.side(new_block, new_parent.total_work + block_work(new_block))
+            self.entries[entry.hash] = entry
+            self.side.add(entry.hash)
+            added.append(entry)
+            for orphan in [o for o in self.orphans.values() if o.previous_hash == entry.hash]:
+                del self.orphans[orphan.hash]
+                if orphan.index == entry.height + 1:
+                    pending.append((orphan, entry))
+
+        best = max(added, key=lambda e: e.total_work)
+        if best.total_work <= self.tip.total_work:
+            return TreeUpdate('side')
+        update = self._reorganize(best)
+        self._prune()
+        return update
+
+    def _reorganize(self, new_tip):
+        # Walk back from the new tip to the fork point on the main chain
+        branch = []
+        entry = new_tip
+        while not entry.on_main:
+            branch.append(entry)
+            entry = self.entries[entry.previous_hash]
+        fork_height = entry.height
+        branch.reverse()
+
+        disconnected = [self.chain[height] for height in range(len(self.chain) - 1, fork_height, -1)]
+        for old in disconnected:
+            old_entry = self.entries[old.hash]
+            old_entry.on_main = False
+            old_entry.block = old
+            self.side.add(old.hash)
+        if disconnected:
+            if hasattr(self.chain, 'truncate'):
+                self.chain.truncate(fork_height + 1)
+            else:
+                del self.chain[fork_height + 1:]
+
+        connected = []
+        for new_entry in branch:
+            self.chain.append(new_entry.block)
+            connected.append(new_entry.block)
+            new_entry.on_main = True
+            new_entry.block = None
+            self.side.discard(new_entry.hash)
+        return TreeUpdate('connected', disconnected, connected)
+
+    def _prune(self):
+        floor = self.tip.height - self.prune_depth
+        # Parents come before children in height order, so descendants of a
+        # pruned block are dropped in the same pass
+        for entry in sorted((self.entries[h] for h in self.side), key=lambda e: e.height):
+            if entry.height < floor or entry.previous_hash not in self.entries:
+                del self.entries[entry.hash]
+                self.side.discard(entry.hash)
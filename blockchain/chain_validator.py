@@ -0,0 +1,175 @@
+# blockchain/chain_validator.py
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from blockchain.block import Block
+from reports.health_report import HealthReport
+
+def next_state_hash(state_hash, block):
+    """Folds one accepted block into the running chain-state hash."""
+    return hashlib.sha256(bytes.fromhex(state_hash) + bytes.fromhex(block.hash)).hexdigest()
+
+def check_block_link(block, prev_index, prev_hash):
+    """Returns None if the block extends (prev_index, prev_hash) with a valid proof, else a reason."""
+    if block.index != prev_index + 1:
+        return f"expected height {prev_index + 1}, found {block.index}"
+    if block.previous_hash != prev_hash:
+        return "previous_hash does not match parent"
+    if not block.has_valid_proof():
+        return "merkle root or proof of work mismatch"
+    return None
+
+def check_block_range(prev_index, prev_hash, serialized_blocks):
+    """
+    Worker entry point for parallel validation: checks linkage, merkle roots and
+    proof of work for a contiguous run of serialized blocks.
+    Returns (offset of the first bad block, reason), or None if all are valid.
+    """
+    for offset, data in enumerate(serialized_blocks):
+        block = Block.deserialize(data)
+        reason = check_block_link(block, prev_index, prev_hash)
+        if reason is not None:
+            return offset, reason
+        prev_index, prev_hash = block.index, block.hash
+    return None
+
+def has_signature_majority(block):
+    """Same acceptance rule as NodeNetwork: at least half of the reports carry valid signatures."""
+    reports = block.transactions
+    votes = HealthReport.verify_batch(reports, quorum=math.ceil(len(reports) / 2))
+    return sum(1 for vote in votes if vote) >= len(reports) / 2
+
+class ValidationResult:
+    def __init__(self, valid, height, reason=None):
+        self.valid = valid
+        self.height = height # Last valid height, or the first invalid one
+        self.reason = reason
+
+    def __bool__(self):
+        return self.valid
+
+    def __repr__(self):
+        return f"ValidationResult(valid={self.valid}, height={self.height}, reason={self.reason!r})"
+
+class ChainValidator:
+    """
+    Validates a stored chain and records checkpoints of what has been verified.
+
+    A checkpoint is (height, tip hash, state hash), where the state hash folds in
+    every block hash up to that height. On the next start validation resumes
+    from the newest checkpoint whose tip hash still matches the store, so only
+    blocks added since then are checked again.
+
+    With workers > 1, block linkage, merkle roots and proof of work are checked
+    across worker processes; signatures are checked in this process with
+    HealthReport.verify_batch, which already runs in parallel threads.
+    """
+    def __init__(self, store, checkpoint_path, checkpoint_interval=1000, workers=1,
+                 verify_signatures=True, chunk_size=500):
+        self.store = store
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.workers = workers
+        self.verify_signatures = verify_signatures
+        self.chunk_size = chunk_size
+        self.validated_height = -1
+        self.state_hash = hashlib.sha256(b'').hexdigest()
+        self.tip_hash = None
+        self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return
+        with open(self.checkpoint_path) as f:
+            lines = f.read().splitlines()
+        # Newest first; ignore a torn last line or a checkpoint the store no longer matches
+        for line in reversed(lines):
+            try:
+                checkpoint = json.loads(line)
+            except ValueError:
+                continue
+            block = self.store.get(checkpoint['height'])
+            if block is not None and block.hash == checkpoint['tip_hash']:
+                self.validated_height = checkpoint['height']
+                self.tip_hash = checkpoint['tip_hash']
+                self.state_hash = checkpoint['state_hash']
+                return
+
+    def _write_checkpoint(self):
+        with open(self.checkpoint_path, 'a') as f:
+            f.write(json.dumps({
+                'height': self.validated_height,
+                'tip_hash': self.tip_hash,
+                'state_hash': self.state_hash
+            }) + '\n')
+
+    def _advance(self, block):
+        self.validated_height = block.index
+        self.tip_hash = block.hash
+        self.state_hash = next_state_hash(self.state_hash, block)
+        if self.validated_height % self.checkpoint_interval == 0:
+            self._write_checkpoint()
+
+    def _check_structure_parallel(self, start, end):
+        """Checks heights [start, end) across worker processes. Returns (height, reason) or None."""
+        prev = self.store.get(start - 1) if start > 0 else None
+        jobs = []
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for chunk_start in range(start, end, self.chunk_size):
+                chunk_end = min(chunk_start + self.chunk_size, end)
+                # Stored records go to the workers as they are; decoding happens there
+                serialized = [self.store.get_raw(h) for h in range(chunk_start, chunk_end)]
+                if chunk_start == 0:
+                    # Genesis has no parent; check it here and hand the rest to the pool
+                    genesis = Block.deserialize(serialized[0])
+                    if genesis.index != 0:
+                        return 0, "genesis block is not at height 0"
+                    prev_index, prev_hash = 0, genesis.hash
+                    serialized, first_height = serialized[1:], 1
+                else:
+                    # The parent of each chunk is the last block of the previous one
+                    parent = prev if chunk_start == start else self.store.get(chunk_start - 1)
+                    prev_index, prev_hash = parent.index, parent.hash
+                    first_height = chunk_start
+                jobs.append((first_height, pool.submit(check_block_range, prev_index, prev_hash, serialized)))
+            for first_height, job in jobs:
+                failure = job.result()
+                if failure is not None:
+                    offset, reason = failure
+                    return first_height + offset, reason
+        return None
+
+    def validate(self):
+        """
+        Validates every block after the last checkpoint (or from genesis).
+        Returns a ValidationResult; on success a checkpoint is written at the tip.
+        """
+        start = self.validated_height + 1
+        end = len(self.store)
+        if start >= end:
+            return ValidationResult(True, self.validated_height)
+
+        structure_checked = False
+        if self.workers > 1 and end - start > self.chunk_size:
+            failure = self._check_structure_parallel(start, end)
+            if failure is not None:
+                return ValidationResult(False, failure[0], failure[1])
+            structure_checked = True
+
+        for height in range(start, end):
+            block = self.store.get(height)
+            if not structure_checked:
+                if height == 0:
+                    reason = None if block.index == 0 else "genesis block is not at height 0"
+                else:
+                    reason = check_block_link(block, self.validated_height, self.tip_hash)
+                if reason is not None:
+                    return ValidationResult(False, height, reason)
+            if self.verify_signatures and block.transactions and not has_signature_majority(block):
+                return ValidationResult(False, height, "too few valid report signatures")
+            self._advance(block)
+
+        self._write_checkpoint()
+        return ValidationResult(True, self.validated_height)
@@ -0,0 +1,67 @@
+# blockchain/merkle.py
+import hashlib
+import json
+
+def leaf_hash(tx):
+    """Leaf hash of one transaction: SHA-256 of its key-sorted JSON form."""
+    return hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).hexdigest()
+
+def hash_pair(left, right):
+    return hashlib.sha256((left + right).encode()).hexdigest()
+
+class MerkleTree:
+    """
+    Merkle tree over a block's transactions that keeps every level, so the
+    root is computed once and inclusion proofs need no rehashing.
+    An odd node at the end of a level is paired with itself, as in
+    Block.compute_merkle_root.
+    """
+    def __init__(self, leaves):
+        self.levels = [list(leaves)] # levels[0] = leaf hashes, levels[-1] = [root]
+        level = self.levels[0]
+        while len(level) > 1:
+            level = [
+                hash_pair(level[i], level[i + 1] if i + 1 < len(level) else level[i])
+                for i in range(0, len(level), 2)
+            ]
+            self.levels.append(level)
+
+    @classmethod
+    def from_transactions(cls, transactions):
+        return cls([leaf_hash(tx) for tx in transactions])
+
+    @property
+    def root(self):
+        return self.levels[-1][0] if self.levels[0] else ''
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def proof(self, tx_index):
+        """
+        Returns the inclusion proof for the transaction at tx_index: a list of
+        [sibling_hash, side] pairs from the leaf up, where side is 'L' or 'R'
+        depending on which side the sibling sits.
+        """
+        if not 0 <= tx_index < len(self):
+            raise IndexError("transaction index out of range")
+        path = []
+        index = tx_index
+        for level in self.levels[:-1]:
+            if index % 2 == 0:
+                sibling = level[index + 1] if index + 1 < len(level) else level[index]
+                path.append([sibling, 'R'])
+            else:
+                path.append([level[index - 1], 'L'])
+            index //= 2
+        return path
+
+def verify_proof(leaf, proof, root):
+    """
+    Checks that the leaf hash is included under root, given a proof from
+    MerkleTree.proof. Runs in O(log n) without access to the block.
+    """
+    current = leaf
+    for sibling, side in proof:
+        current = hash_pair(sibling, current) if side == 'L' else hash_pair(current, sibling)
+    return current == root
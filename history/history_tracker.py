@@ -1,34 +1,247 @@
+import bisect
+import threading
 import time # Import time for ctime
+from reports.health_report import HealthReport
+from utils.metrics import registry
+
+# Report fields with a secondary index (value -> record ids)
+INDEXED_FIELDS = ('doctor_id', 'diagnosis', 'hospital_clinic', 'medications')
+
+REPORTS_INGESTED = registry.counter('bchealth_history_reports_ingested_total', "Reports added to patient histories")
+REPORTS_REMOVED = registry.counter('bchealth_history_reports_removed_total', "Reports taken out of patient histories by reorgs")
 
 class PatientHistoryTracker:
     """
     Tracks and displays the health history for patients.
     Now stores block hash with each report and displays more details.
+
+    Every record gets a numeric id. Besides the per-patient lists, records are
+    indexed by doctor, diagnosis, hospital/clinic and medication, and there are
+    timestamp-sorted id lists (per patient and global) so time ranges are
+    answered with binary search. query() combines these indexes.
+    If a vitals_store is given, each added report's vitals are also parsed
+    into it for numeric analytics.
+    remove_block() takes back the reports of one block (when a reorg
+    disconnects it) by updating these structures in place.
+
+    Per-patient lists are only ever appended to or replaced by a new list,
+    never edited in place, and each patient has a version number bumped after
+    every change. snapshot() relies on this to read a patient's history
+    without taking the lock, so lookups never hold up block ingestion.
     """
-    def __init__(self):
-        # Stores reports as: patient_id -> list of {'report': report_dict, 'block_hash': hash}
+    def __init__(self, vitals_store=None):
+        # Stores reports as: patient_id -> list of
+        # {'report': HealthReport, 'block_hash': hash, 'merkle_root': root, 'merkle_proof': proof}
         self.history = {}
+        self.versions = {} # patient_id -> number of changes to that patient's history
+        self.records = [] # record id -> entry (same dicts as in self.history); None once removed
+        self.block_records = {} # block hash -> [record ids]
+        self.vitals_rows = [] # record id -> row in vitals_store, or None
+        self.indexes = {field: {} for field in INDEXED_FIELDS} # field -> value -> [record ids]
+        self.patient_times = {} # patient_id -> ([timestamps], [record ids]), sorted by timestamp
+        self.all_times = ([], []) # same, across all patients
+        self.lock = threading.RLock()
+        self.vitals_store = vitals_store
 
-    def add_report(self, report_dict, block_hash=None): # This line needs to be updated in your file
+    def add_report(self, report, block_hash=None, merkle_root=None, merkle_proof=None):
         """
-        Adds a health report dictionary to the patient's history,
-        along with the hash of the block it was included in.
+        Adds a health report (a HealthReport; dicts are parsed) to the patient's history,
+        along with the hash of the block it was included in and, if given,
+        the block's merkle root and the report's inclusion proof. A client can
+        check the proof with blockchain.merkle.verify_proof without the block.
         """
-        pid = report_dict['patient_id']
-        if pid not in self.history:
-            self.history[pid] = []
-        self.history[pid].append({'report': report_dict, 'block_hash': block_hash})
+        report = HealthReport.from_dict(report) # Stored as the shared immutable object
+        pid = report.patient_id
+        entry = {
+            'report': report,
+            'block_hash': block_hash,
+            'merkle_root': merkle_root,
+            'merkle_proof': merkle_proof
+        }
+        with self.lock:
+            record_id = len(self.records)
+            self.records.append(entry)
+            if pid not in self.history:
+                self.history[pid] = []
+            self.history[pid].append(entry)
+            # Bumped after the write, so a reader that saw this version also sees the entry
+            self.versions[pid] = self.versions.get(pid, 0) + 1
+
+            for field, index in self.indexes.items():
+                values = getattr(report, field)
+                if values is None:
+                    continue
+                for value in (values if isinstance(values, (list, tuple)) else [values]):
+                    index.setdefault(value, []).append(record_id)
+
+            timestamp = report.timestamp
+            self._insert_time(self.patient_times.setdefault(pid, ([], [])), timestamp, record_id)
+            self._insert_time(self.all_times, timestamp, record_id)
+            if block_hash is not None:
+                self.block_records.setdefault(block_hash, []).append(record_id)
+
+            # Added under the lock so rows line up with records for remove_block
+            self.vitals_rows.append(self.vitals_store.add_report(report) if self.vitals_store is not None else None)
+        REPORTS_INGESTED.inc()
+
+    def add_block(self, block):
+        """
+        Adds every report of an accepted block, each with the block's hash,
+        merkle root and the report's inclusion proof.
+        """
+        merkle_tree = block.get_merkle_tree()
+        for i, report in enumerate(block.transactions): # Report objects are shared, not copied
+            self.add_report(report, block.hash, block.merkle_root, merkle_tree.proof(i))
+
+    def remove_block(self, block_hash):
+        """
+        Removes every report that was added with this block hash, keeping the
+        other records, their ids and all indexes intact. Returns the number of
+        reports removed.
+        """
+        with self.lock:
+            record_ids = self.block_records.pop(block_hash, [])
+            for record_id in record_ids:
+                entry = self.records[record_id]
+                report = entry['report']
+                pid = report.patient_id
+                # A new list, so lock-free readers keep a consistent view of the old one
+                self.history[pid] = [e for e in self.history[pid] if e is not entry]
+                if not self.history[pid]:
+                    del self.history[pid]
+                self.versions[pid] = self.versions.get(pid, 0) + 1
+
+                for field, index in self.indexes.items():
+                    values = getattr(report, field)
+                    if values is None:
+                        continue
+                    for value in (values if isinstance(values, (list, tuple)) else [values]):
+                        ids = index[value]
+                        ids.remove(record_id)
+                        if not ids:
+                            del index[value]
+
+                self._remove_time(self.patient_times[pid], report.timestamp, record_id)
+                if not self.patient_times[pid][0]:
+                    del self.patient_times[pid]
+                self._remove_time(self.all_times, report.timestamp, record_id)
+                self.records[record_id] = None
+
+            rows = sorted(self.vitals_rows[rid] for rid in record_ids if self.vitals_rows[rid] is not None)
+            if rows:
+                tail = rows[-1] + 1 == self.vitals_store.count
+                # Delete from the highest row down so lower row numbers stay valid
+                for row in reversed(rows):
+                    self.vitals_store.delete_rows(row, row + 1)
+                for record_id in record_ids:
+                    self.vitals_rows[record_id] = None
+                if not tail:
+                    # Rows after the deleted ones moved down; rare, since reorgs remove the newest blocks
+                    for record_id, row in enumerate(self.vitals_rows):
+                        if row is not None:
+                            self.vitals_rows[record_id] = row - bisect.bisect_left(rows, row)
+            REPORTS_REMOVED.inc(len(record_ids))
+            return len(record_ids)
+
+    @staticmethod
+    def _insert_time(time_index, timestamp, record_id):
+        times, ids = time_index
+        # Reports mostly arrive in time order, so this is usually an append
+        position = bisect.bisect_right(times, timestamp)
+        times.insert(position, timestamp)
+        ids.insert(position, record_id)
+
+    @staticmethod
+    def _remove_time(time_index, timestamp, record_id):
+        times, ids = time_index
+        position = bisect.bisect_left(times, timestamp)
+        while ids[position] != record_id:
+            position += 1
+        del times[position]
+        del ids[position]
+
+    @staticmethod
+    def _time_bounds(time_index, start_time, end_time):
+        times = time_index[0]
+        lo = 0 if start_time is None else bisect.bisect_left(times, start_time)
+        hi = len(times) if end_time is None else bisect.bisect_right(times, end_time)
+        return lo, hi
+
+    @staticmethod
+    def _matches(report, field, value):
+        stored = getattr(report, field)
+        if isinstance(stored, (list, tuple)):
+            return value in stored
+        return stored == value
 
     def get_history(self, patient_id):
         """Returns the list of reports for a given patient ID."""
-        return self.history.get(patient_id, [])
+        return list(self.snapshot(patient_id)[1])
+
+    def snapshot(self, patient_id):
+        """
+        Returns (version, entries) for a patient without taking the lock:
+        entries is a tuple of the history entries as of some moment no earlier
+        than `version`. Entries added later carry a higher version, so
+        (patient_id, version) can key a response cache.
+        """
+        # Version first: the entries can only be newer than it, never older
+        version = self.versions.get(patient_id, 0)
+        entries = self.history.get(patient_id, ())
+        return version, tuple(entries) # One C-level copy; an append cannot interleave with it
+
+    def query(self, patient_id=None, doctor_id=None, diagnosis=None, hospital_clinic=None,
+              medication=None, start_time=None, end_time=None, offset=0, limit=50):
+        """
+        Returns history entries matching every given predicate, ordered by report
+        timestamp, as {'total': n, 'offset': offset, 'limit': limit, 'results': [...]}.
+        start_time/end_time are inclusive bounds on the report timestamp.
+        The smallest matching index list (or time range) is walked and the other
+        predicates are checked per record, so no query scans the full history.
+        """
+        wanted = {field: value for field, value in (
+            ('doctor_id', doctor_id), ('diagnosis', diagnosis),
+            ('hospital_clinic', hospital_clinic), ('medications', medication)) if value is not None}
+        with self.lock:
+            # The time index (per patient if given) bounds the search with two binary searches
+            time_index = self.patient_times.get(patient_id, ([], [])) if patient_id is not None else self.all_times
+            lo, hi = self._time_bounds(time_index, start_time, end_time)
+
+            # Start from the smallest candidate list, then check the remaining
+            # predicates on each record directly: O(smallest list), no set building
+            base_field = min(wanted, key=lambda field: len(self.indexes[field].get(wanted[field], [])), default=None)
+            if base_field is not None and len(self.indexes[base_field].get(wanted[base_field], [])) < hi - lo:
+                matched = []
+                for record_id in self.indexes[base_field].get(wanted[base_field], []):
+                    report = self.records[record_id]['report']
+                    if patient_id is not None and report.patient_id != patient_id:
+                        continue
+                    if start_time is not None and report.timestamp < start_time:
+                        continue
+                    if end_time is not None and report.timestamp > end_time:
+                        continue
+                    if all(self._matches(report, f, v) for f, v in wanted.items() if f != base_field):
+                        matched.append(record_id)
+                matched.sort(key=lambda rid: (self.records[rid]['report'].timestamp, rid))
+            else:
+                # Walk the time range; results come out in timestamp order
+                matched = [record_id for record_id in time_index[1][lo:hi]
+                           if all(self._matches(self.records[record_id]['report'], f, v) for f, v in wanted.items())]
+
+            page = matched[offset:offset + limit]
+            return {
+                'total': len(matched),
+                'offset': offset,
+                'limit': limit,
+                'results': [self.records[record_id] for record_id in page]
+            }
 
     def print_history(self, patient_id):
         """
         Prints the detailed health history for a given patient ID.
         Includes new fields and block hash.
         """
-        reports_with_hashes = self.get_history(patient_id)
+        reports_with_hashes = self.snapshot(patient_id)[1]
         if not reports_with_hashes:
             print(f"\n❌ No records found for {patient_id}")
             return
@@ -37,32 +250,32 @@ class PatientHistoryTracker:
         for i, entry in enumerate(reports_with_hashes, 1):
             r = entry['report']
             block_hash = entry['block_hash']
-            vitals = ", ".join(f"{k}: {v}" for k, v in r['vitals'].items())
-            
-            # Safely get new fields using .get() for robustness
-            medications = r.get('medications', 'N/A')
-            allergies = r.get('allergies', 'N/A')
-            follow_up_date = r.get('follow_up_date')
-            hospital_clinic = r.get('hospital_clinic', 'N/A')
-            patient_age = r.get('patient_age', 'N/A')
-            patient_gender = r.get('patient_gender', 'N/A')
+            vitals = ", ".join(f"{k}: {v}" for k, v in r.vitals.items())
+
+            # Older reports may lack the newer fields
+            medications = r.medications if r.medications is not None else 'N/A'
+            allergies = r.allergies if r.allergies is not None else 'N/A'
+            follow_up_date = r.follow_up_date
+            hospital_clinic = r.hospital_clinic if r.hospital_clinic is not None else 'N/A'
+            patient_age = r.patient_age if r.patient_age is not None else 'N/A'
+            patient_gender = r.patient_gender if r.patient_gender is not None else 'N/A'
 
             follow_up_date_str = time.ctime(follow_up_date) if follow_up_date else 'N/A'
 
             print(
                 f"\n  📄 Report #{i}\n"
-                f"     Block Hash: {block_hash[:10]}...\n" if block_hash else "     Block Hash: N/A\n"
-                f"     Timestamp : {time.ctime(r['timestamp'])}\n"
-                f"     Doctor    : {r['doctor_id']}\n"
+                + (f"     Block Hash: {block_hash[:10]}...\n" if block_hash else "     Block Hash: N/A\n") +
+                f"     Timestamp : {time.ctime(r.timestamp)}\n"
+                f"     Doctor    : {r.doctor_id}\n"
                 f"     Hospital  : {hospital_clinic}\n" # New detail
                 f"     Age       : {patient_age}\n"     # New detail
                 f"     Gender    : {patient_gender}\n"   # New detail
-                f"     Symptoms  : {r['symptoms']}\n"
-                f"     Diagnosis : {r['diagnosis']}\n"
+                f"     Symptoms  : {r.symptoms}\n"
+                f"     Diagnosis : {r.diagnosis}\n"
                 f"     Vitals    : {vitals}\n"
                 f"     Medications : {medications}\n"
                 f"     Allergies   : {allergies}\n"
                 f"     Follow-up   : {follow_up_date_str}\n"
-                f"     Notes     : {r['notes']}\n"
+                f"     Notes     : {r.notes}\n"
             )
 
@@ -0,0 +1,225 @@
+# history/query_server.py
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+from utils.logger import setup_logger
+from utils.metrics import registry
+
+REQUESTS = registry.counter('bchealth_query_requests_total', "History query requests, by HTTP status", ['status'])
+CACHE_RESULTS = registry.counter('bchealth_query_cache_total', "History lookups by response cache result", ['result'])
+QUERY_SECONDS = registry.histogram('bchealth_query_seconds', "Time to answer a history query")
+
+MAX_HEADER_LINES = 100
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+def entry_to_dict(entry):
+    """JSON-ready form of one history entry: the report's fields plus where it was confirmed."""
+    result = entry['report'].to_dict()
+    result['block_hash'] = entry['block_hash']
+    result['merkle_root'] = entry['merkle_root']
+    result['merkle_proof'] = entry['merkle_proof']
+    return result
+
+class HistoryQueryServer:
+    """
+    Serves patient histories as JSON over HTTP/1.1 (TCP, or a Unix socket if
+    unix_path is given), with keep-alive so a client can send many lookups
+    on one connection:
+
+        GET /patients/<patient_id>/history?offset=0&limit=50
+        GET /health
+
+    Lookups read PatientHistoryTracker.snapshot(), which takes no lock, so
+    queries never wait on block ingestion. Encoded responses are cached by
+    (patient_id, offset, limit) together with the patient's history version;
+    the version is checked first, so a patient whose history has not changed
+    since the response was built is answered from the cache without copying
+    or touching the reports.
+
+    start()/stop() run the server on the current event loop; start_in_thread()
+    gives it a loop of its own for callers that are not asyncio-based.
+    """
+    def __init__(self, history_tracker, host='127.0.0.1', port=8080, unix_path=None,
+                 cache_size=4096, default_limit=50, max_limit=500, idle_timeout=30.0):
+        self.history_tracker = history_tracker
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.cache_size = cache_size
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+        self.idle_timeout = idle_timeout
+        self.cache = OrderedDict() # (patient_id, offset, limit) -> (version, body bytes)
+        self.cache_lock = threading.Lock()
+        self.logger = setup_logger("HistoryQueryServer")
+        self.server = None
+        self.loop = None
+        self._thread = None
+
+    # --- lookups ------------------------------------------------------------
+
+    def lookup(self, patient_id, offset=0, limit=None):
+        """Returns the JSON body (bytes) for one page of a patient's history."""
+        limit = self.default_limit if limit is None else min(limit, self.max_limit)
+        key = (patient_id, offset, limit)
+        # The version alone decides a hit, so the history is copied only on a miss
+        version = self.history_tracker.versions.get(patient_id, 0)
+        with self.cache_lock:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == version:
+                self.cache.move_to_end(key)
+                CACHE_RESULTS.labels('hit').inc()
+                return cached[1]
+        CACHE_RESULTS.labels('miss').inc()
+
+        version, entries = self.history_tracker.snapshot(patient_id)
+        body = json.dumps({
+            'patient_id': patient_id,
+            'version': version,
+            'total': len(entries),
+            'offset': offset,
+            'limit': limit,
+            'results': [entry_to_dict(entry) for entry in entries[offset:offset + limit]],
+        }).encode('utf-8')
+        with self.cache_lock:
+            self.cache[key] = (version, body)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return body
+
+    def _route(self, method, target):
+        """Returns (status, body bytes) for one request."""
+        if method != 'GET':
+            return 405, b'{"error": "only GET is supported"}'
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        if parts == ['health']:
+            with self.cache_lock:
+                cached = len(self.cache)
+            return 200, json.dumps({'status': 'ok', 'patients': len(self.history_tracker.versions),
+                                    'cached_responses': cached}).encode('utf-8')
+        if len(parts) == 3 and parts[0] == 'patients' and parts[2] == 'history':
+            params = parse_qs(url.query)
+            try:
+                offset = int(params.get('offset', ['0'])[0])
+                limit = int(params['limit'][0]) if 'limit' in params else None
+            except ValueError:
+                return 400, b'{"error": "offset and limit must be integers"}'
+            if offset < 0 or (limit is not None and limit < 1):
+                return 400, b'{"error": "offset must be >= 0 and limit >= 1"}'
+            return 200, self.lookup(parts[1], offset, limit)
+        return 404, b'{"error": "not found"}'
+
+    # --- HTTP ---------------------------------------------------------------
+
+    async def _read_request(self, reader):
+        """Returns (method, target, version, headers), or None when the client is done."""
+        line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode('latin-1').split()
+        except ValueError:
+            raise ValueError("Malformed request line")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError("Too many header lines")
+        # Requests are GETs; skip any body so the next request parses cleanly
+        length = int(headers.get('content-length', '0') or 0)
+        if length:
+            await reader.readexactly(length)
+        return method, target, version, headers
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError):
+                    request = None
+                    self._write(writer, 400, b'{"error": "malformed request"}', keep_alive=False)
+                    REQUESTS.labels('400').inc()
+                if request is None:
+                    break
+                method, target, version, headers = request
+                start = time.perf_counter()
+                status, body = self._route(method, target)
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+                self._write(writer, status, body, keep_alive)
+                QUERY_SECONDS.observe(time.perf_counter() - start)
+                REQUESTS.labels(str(status)).inc()
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass # Idle or vanished client
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _write(writer, status, body, keep_alive):
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+
+    # --- lifecycle ----------------------------------------------------------
+
+    async def start(self):
+        if self.unix_path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=self.unix_path)
+            self.logger.info(f"History queries served on unix:{self.unix_path}")
+        else:
+            self.server = await asyncio.start_server(self._handle, self.host, self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+            self.logger.info(f"History queries served on http://{self.host}:{self.port}")
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def start_in_thread(self):
+        """Runs the server on its own event loop in a daemon thread; returns once it is listening."""
+        started = threading.Event()
+        failure = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.loop.run_until_complete(self.start())
+            except Exception as e:
+                failure.append(e)
+                started.set()
+                return
+            started.set()
+            self.loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="HistoryQueryServer", daemon=True)
+        self._thread.start()
+        started.wait()
+        if failure:
+            raise failure[0]
+        return self
+
+    def stop_thread(self, timeout=5.0):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result(timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout)
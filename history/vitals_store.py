@@ -0,0 +1,216 @@
+# history/vitals_store.py
+import json
+import os
+import threading
+import numpy as np
+from reports.health_report import HealthReport
+
+VITAL_COLUMNS = ('systolic', 'diastolic', 'hr', 'spo2', 'temp')
+
+class VitalsStore:
+    """
+    Columnar store of numeric vitals for population analytics.
+
+    Each accepted report is parsed once (HealthReport.parse_vitals) and appended
+    as one row across NumPy columns: systolic, diastolic, hr, spo2 and temp
+    (float32), timestamp (float64), and patient/doctor ids stored as int32 codes
+    into per-store string tables. Filters and aggregations run vectorized over
+    the columns. save() writes one .npy file per column so load() can memory-map
+    them.
+    """
+    def __init__(self, capacity=1024):
+        self.count = 0
+        self.columns = {name: np.empty(capacity, dtype=np.float32) for name in VITAL_COLUMNS}
+        self.columns['timestamp'] = np.empty(capacity, dtype=np.float64)
+        self.columns['patient'] = np.empty(capacity, dtype=np.int32)
+        self.columns['doctor'] = np.empty(capacity, dtype=np.int32)
+        self.patient_ids = [] # code -> patient_id
+        self.doctor_ids = []  # code -> doctor_id
+        self._patient_codes = {}
+        self._doctor_codes = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _code(value, codes, names):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def _grow(self, needed):
+        capacity = len(self.columns['timestamp'])
+        # Read-only (memory-mapped) columns are copied into memory on the first append
+        if needed <= capacity and self.columns['timestamp'].flags.writeable:
+            return
+        capacity = max(capacity, 1)
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            self.columns[name] = grown
+
+    def add_report(self, report):
+        """Parses a report's vitals (HealthReport or dict) and appends them as one row. Returns the row."""
+        report = HealthReport.from_dict(report)
+        vitals = HealthReport.parse_vitals(report.vitals or {})
+        with self.lock:
+            self._grow(self.count + 1)
+            row = self.count
+            for name in VITAL_COLUMNS:
+                self.columns[name][row] = vitals[name]
+            self.columns['timestamp'][row] = report.timestamp
+            self.columns['patient'][row] = self._code(report.patient_id, self._patient_codes, self.patient_ids)
+            self.columns['doctor'][row] = self._code(report.doctor_id, self._doctor_codes, self.doctor_ids)
+            self.count += 1
+            return row
+
+    def delete_rows(self, start, end):
+        """Removes rows [start, end), shifting later rows down (e.g. when a reorg drops a block)."""
+        with self.lock:
+            removed = end - start
+            # Shifted into new columns, never in place, so views taken by _view stay unchanged
+            # (this also copies read-only memory-mapped columns into memory)
+            for name, column in self.columns.items():
+                shifted = np.empty(len(column), dtype=column.dtype)
+                shifted[:start] = column[:start]
+                shifted[start:self.count - removed] = column[end:self.count]
+                self.columns[name] = shifted
+            self.count -= removed
+
+    def column(self, name):
+        """Returns a view of the filled part of a column."""
+        with self.lock:
+            return self.columns[name][:self.count]
+
+    def _view(self, names, patient_id=None, doctor_id=None, start_time=None, end_time=None):
+        """
+        Returns ({name: filled part of the column}, row mask for the filters).
+        The row count, column references and id codes are read together under
+        the lock; the mask is computed on those slices after it is released.
+        The slices stay valid: appends write past them and delete_rows builds
+        new columns.
+        """
+        names = set(names)
+        if patient_id is not None:
+            names.add('patient')
+        if doctor_id is not None:
+            names.add('doctor')
+        if start_time is not None or end_time is not None:
+            names.add('timestamp')
+        with self.lock:
+            count = self.count
+            columns = {name: self.columns[name][:count] for name in names}
+            patient_code = self._patient_codes.get(patient_id, -1)
+            doctor_code = self._doctor_codes.get(doctor_id, -1)
+
+        selected = np.ones(count, dtype=bool)
+        if patient_id is not None:
+            selected &= columns['patient'] == patient_code
+        if doctor_id is not None:
+            selected &= columns['doctor'] == doctor_code
+        if start_time is not None:
+            selected &= columns['timestamp'] >= start_time
+        if end_time is not None:
+            selected &= columns['timestamp'] <= end_time
+        return columns, selected
+
+    def mask(self, patient_id=None, doctor_id=None, start_time=None, end_time=None):
+        """Boolean row mask for the given filters (time bounds are inclusive)."""
+        return self._view((), patient_id, doctor_id, start_time, end_time)[1]
+
+    def mean(self, name, **filters):
+        columns, selected = self._view((name,), **filters)
+        values = columns[name][selected]
+        return float(np.nanmean(values)) if values.size else float('nan')
+
+    def percentile(self, name, q, **filters):
+        """q may be a single percentile or a list of them."""
+        columns, selected = self._view((name,), **filters)
+        values = columns[name][selected]
+        if not values.size:
+            return float('nan')
+        result = np.nanpercentile(values, q)
+        return result.tolist() if np.ndim(result) else float(result)
+
+    def summary(self, **filters):
+        """Mean, 5th/50th/95th percentile and count for every vital under the filters."""
+        columns, selected = self._view(VITAL_COLUMNS, **filters)
+        result = {'count': int(selected.sum())}
+        for name in VITAL_COLUMNS:
+            values = columns[name][selected]
+            if values.size:
+                p5, p50, p95 = np.nanpercentile(values, [5, 50, 95])
+                result[name] = {'mean': float(np.nanmean(values)), 'p5': float(p5),
+                                'p50': float(p50), 'p95': float(p95)}
+            else:
+                result[name] = None
+        return result
+
+    def alerts(self, name, above=None, below=None, **filters):
+        """
+        Rows where the vital is above `above` or below `below`, within the filters.
+        Returns a list of {'patient_id', 'doctor_id', 'timestamp', name} dicts ordered by time.
+        """
+        columns, selected = self._view((name, 'patient', 'doctor', 'timestamp'), **filters)
+        values = columns[name]
+        out_of_range = np.zeros(len(values), dtype=bool)
+        if above is not None:
+            out_of_range |= values > above
+        if below is not None:
+            out_of_range |= values < below
+        rows = np.flatnonzero(selected & out_of_range)
+        rows = rows[np.argsort(columns['timestamp'][rows], kind='stable')]
+        # The id tables only grow, so every code in the view has its name
+        return [{
+            'patient_id': self.patient_ids[columns['patient'][row]],
+            'doctor_id': self.doctor_ids[columns['doctor'][row]],
+            'timestamp': float(columns['timestamp'][row]),
+            name: float(values[row]),
+        } for row in rows]
+
+    def windowed_mean(self, name, window, start_time, end_time, **filters):
+        """
+        Mean of a vital per time window of `window` seconds between start_time and
+        end_time. Returns (window start times, means); empty windows are NaN.
+        """
+        columns, selected = self._view((name, 'timestamp'), start_time=start_time, end_time=end_time, **filters)
+        values = columns[name][selected].astype(np.float64)
+        times = columns['timestamp'][selected]
+        buckets = int(np.ceil((end_time - start_time) / window)) or 1
+        slots = np.minimum(((times - start_time) // window).astype(np.int64), buckets - 1)
+        present = ~np.isnan(values)
+        sums = np.bincount(slots[present], weights=values[present], minlength=buckets)
+        counts = np.bincount(slots[present], minlength=buckets)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        return start_time + np.arange(buckets) * window, means
+
+    def save(self, directory):
+        """Writes each column as .npy plus the id tables, for memory-mapped loading."""
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            for name in self.columns:
+                np.save(os.path.join(directory, f"{name}.npy"), self.columns[name][:self.count])
+            with open(os.path.join(directory, 'ids.json'), 'w') as f:
+                json.dump({'patients': self.patient_ids, 'doctors': self.doctor_ids}, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Loads a store written by save(). With mmap=True the columns are
+        memory-mapped read-only; they are copied into memory on the next append.
+        """
+        store = cls(capacity=1)
+        for name in store.columns:
+            store.columns[name] = np.load(os.path.join(directory, f"{name}.npy"),
+                                          mmap_mode='r' if mmap else None)
+        store.count = len(store.columns['timestamp'])
+        with open(os.path.join(directory, 'ids.json')) as f:
+            ids = json.load(f)
+        store.patient_ids = ids['patients']
+        store.doctor_ids = ids['doctors']
+        store._patient_codes = {pid: code for code, pid in enumerate(store.patient_ids)}
+        store._doctor_codes = {did: code for code, did in enumerate(store.doctor_ids)}
+        return store
@@ -1,94 +1,154 @@
+import os
 import threading
 import time
 import random
-from miner_app import Miner
+from miner_app import MinerPool
 from blockchain.block import Block
 from mempool.mempool import Mempool
 from network.node import NodeNetwork
 from reports.health_report import HealthReport
-from utils.logger import setup_logger
+from reports.load_generator import LoadGenerator
+import logging
+from utils.logger import configure_logging, setup_logger
+from utils.metrics import MetricsServer, SnapshotWriter
 from wallets.patient_wallet import PatientWallet
 from wallets.doctor_wallet import DoctorWallet
+from wallets.keystore import KeyStore
 from history.history_tracker import PatientHistoryTracker
+from history.vitals_store import VitalsStore
+from history.query_server import HistoryQueryServer
+from proof_of_work import create_mining_backend
+from Signatures import verification_cache
+from storage.block_store import BlockStore
+from blockchain.chain_validator import ChainValidator
 
 NUM_MINERS = 5
 NUM_PATIENTS = 10
 DIFFICULTY = 3
+MINING_BACKEND = "process"  # "thread" keeps all nonce searching in this process
+CHAIN_DIR = "chain_data"  # Block store location; the chain survives restarts
+KEYSTORE_DIR = os.path.join(CHAIN_DIR, "keys")  # Wallet keys, so identities survive restarts too
+KEYSTORE_PASSPHRASE = os.environ.get("BCHEALTH_KEYSTORE_PASSPHRASE")  # Encrypts stored keys when set
+LOAD_RATE = None  # Reports/s from the multi-process load generator (0: as fast as possible); None: one every 1-2s
+LOAD_SEED = 0  # Seeds the load generator, so its report contents repeat across runs
+MAX_REPORTS_PER_BLOCK = 500  # Block size limits; the block is sealed when either is reached
+MAX_BLOCK_BYTES = 256 * 1024  # Serialized report bytes
+MAX_REPORT_WAIT = 10.0  # Seconds; seals a partial block so no report waits longer for a miner
+STATS_INTERVAL = 30  # Seconds between throughput reports
+QUERY_HOST = "127.0.0.1"  # History query server address
+QUERY_PORT = 8080
+QUERY_UNIX_SOCKET = None  # A socket path serves queries over a Unix socket instead of TCP
+METRICS_PORT = 9100  # Prometheus text at http://127.0.0.1:9100/metrics, JSON at /metrics.json; None disables
+METRICS_SNAPSHOT_PATH = os.path.join(CHAIN_DIR, "metrics.jsonl")  # One JSON snapshot per line; None disables
+METRICS_SNAPSHOT_INTERVAL = 60  # Seconds between snapshots
+LOG_LEVEL = logging.DEBUG  # INFO skips rendering full blocks altogether
+LOG_JSON = False  # True writes one JSON object per log line
+configure_logging(LOG_LEVEL, structured=LOG_JSON)
 logger = setup_logger("Main")
 
 def vote_fn(report):
     return report.verify_signature()
 
+def admitted_vote_fn(mempool):
+    """Votes for reports this node already verified on mempool admission without re-checking them."""
+    return lambda report: mempool.is_admitted(report) or vote_fn(report)
+
 def generate_reports(mempool, patient_wallets, doctor_wallets):
     while True:
         patient_wallet = random.choice(patient_wallets)
         doctor_wallet = random.choice(doctor_wallets)
 
         report = HealthReport.generate(patient_wallet.patient_id, doctor_wallet)
-        mempool.add_report(report.to_dict())
+        mempool.add_report(report)
 
         time.sleep(random.uniform(1, 2))
 
-def query_patient_history(history_tracker):
-    while True:
-        user_input = input("🔍 Enter patient_id to view history (or 'exit'): ").strip()
-        if user_input.lower() == 'exit':
-            break
-        history_tracker.print_history(user_input)
-
 def run_simulation():
-    blockchain = []
-    mempool = Mempool()
-    node = NodeNetwork(num_miners=NUM_MINERS)
-    history_tracker = PatientHistoryTracker()
-
-    patient_wallets = [PatientWallet(f"patient_{i}") for i in range(NUM_PATIENTS)]
-    doctor_wallets = [DoctorWallet(f"doctor_{i}") for i in range(3)]
-
-    genesis_block = Block(0, [], "0", DIFFICULTY)
-    genesis_block.hash = genesis_block.compute_hash()
-    blockchain.append(genesis_block)
+    blockchain = BlockStore(CHAIN_DIR)
+    mempool = Mempool(validate_on_admission=True)
+    node = NodeNetwork(num_miners=NUM_MINERS, difficulty=DIFFICULTY)
+    history_tracker = PatientHistoryTracker(vitals_store=VitalsStore())
+    mining_backend = create_mining_backend(MINING_BACKEND)
+
+    # Wallets create or load their keys on first use, so this does no key work per patient
+    keystore = KeyStore(KEYSTORE_DIR, passphrase=KEYSTORE_PASSPHRASE)
+    patient_wallets = [PatientWallet(f"patient_{i}", keystore=keystore) for i in range(NUM_PATIENTS)]
+    doctor_wallets = [DoctorWallet(f"doctor_{i}", keystore=keystore) for i in range(3)]
+
+    if len(blockchain) == 0:
+        genesis_block = Block(0, [], "0", DIFFICULTY)
+        genesis_block.hash = genesis_block.compute_hash()
+        blockchain.append(genesis_block)
+        logger.info("Initialized blockchain with genesis block.")
+    else:
+        logger.info(f"Loaded blockchain with {len(blockchain)} blocks from {CHAIN_DIR}.")
+        # Stored reports refer to doctor keys by fingerprint; load and register them before validating
+        for wallet in doctor_wallets:
+            wallet.get_key_fingerprint()
+        # Only blocks added since the last checkpoint are validated again
+        validator = ChainValidator(blockchain, os.path.join(CHAIN_DIR, "checkpoints.jsonl"))
+        result = validator.validate()
+        if result:
+            logger.info(f"Chain validated up to height {result.height}.")
+        elif result.height == 0:
+            logger.error(f"Stored genesis block is invalid ({result.reason}); refusing to start.")
+            return
+        else:
+            # Drop the invalid block and everything built on it, so miners and history follow the valid chain
+            logger.warning(f"Chain validation failed at height {result.height}: {result.reason}. "
+                           f"Truncating {len(blockchain) - result.height} block(s).")
+            blockchain.truncate(result.height)
+        # History and vitals live in memory; rebuild them from the stored blocks
+        for height in range(1, len(blockchain)):
+            history_tracker.add_block(blockchain[height])
+        logger.info(f"Replayed {len(blockchain) - 1} stored blocks into patient history.")
     node.blockchain = blockchain
-    logger.info("Initialized blockchain with genesis block.")
 
-    tx_thread = threading.Thread(target=generate_reports, args=(mempool, patient_wallets, doctor_wallets))
+    if LOAD_RATE is None:
+        tx_thread = threading.Thread(target=generate_reports, args=(mempool, patient_wallets, doctor_wallets))
+    else:
+        load_generator = LoadGenerator(doctor_wallets, [wallet.patient_id for wallet in patient_wallets],
+                                       rate=LOAD_RATE or None, seed=LOAD_SEED)
+        tx_thread = threading.Thread(target=load_generator.run, args=(mempool.add_report,))
     tx_thread.daemon = True
     tx_thread.start()
     logger.info("Health report generator started.")
 
-    query_thread = threading.Thread(target=query_patient_history, args=(history_tracker,))
-    query_thread.daemon = True
-    query_thread.start()
+    # History lookups, e.g. curl http://127.0.0.1:8080/patients/patient_3/history?limit=20
+    HistoryQueryServer(history_tracker, host=QUERY_HOST, port=QUERY_PORT, unix_path=QUERY_UNIX_SOCKET).start_in_thread()
+
+    # Miners stay up for the whole run; each accepted block moves them all to the new tip
+    miner_pool = MinerPool(
+        NUM_MINERS,
+        blockchain=node.blockchain,
+        mempool=mempool,
+        difficulty=DIFFICULTY,
+        broadcast_fn=lambda b: node.broadcast_block(b, admitted_vote_fn(mempool), history_tracker),
+        mining_backend=mining_backend,
+        max_reports_per_block=MAX_REPORTS_PER_BLOCK,
+        max_block_bytes=MAX_BLOCK_BYTES,
+        max_report_wait=MAX_REPORT_WAIT
+    )
+    # Reports in an accepted block leave the mempool; a reorg hands disconnected ones back
+    node.add_tip_listener(lambda block: mempool.confirm(block.transactions))
+    node.add_disconnect_listener(lambda block: mempool.restore(block.transactions))
+    node.add_tip_listener(miner_pool.on_new_tip)
+    miner_pool.start()
+
+    if METRICS_PORT is not None:
+        MetricsServer(port=METRICS_PORT).start()
+        logger.info(f"Metrics served at http://127.0.0.1:{METRICS_PORT}/metrics")
+    if METRICS_SNAPSHOT_PATH is not None:
+        SnapshotWriter(METRICS_SNAPSHOT_PATH, interval=METRICS_SNAPSHOT_INTERVAL).start()
 
     while True:
-        stop_flag = threading.Event()
-        miners = []
-        ids = list(range(NUM_MINERS))
-        random.shuffle(ids)
-
-        # Removed patient assignment logic for miners
-        # Miners will now pick up any transactions from the mempool
-
-        for i in ids:
-            miner = Miner(
-                miner_id=i,
-                blockchain=node.blockchain,
-                mempool=mempool,
-                difficulty=DIFFICULTY,
-                stop_flag=stop_flag,
-                broadcast_fn=lambda b: node.broadcast_block(b, stop_flag, vote_fn, history_tracker)
-                # Removed associated_patient_id parameter
-            )
-            miners.append(miner)
-            miner.start()
-            logger.info(f"Started Miner {i}") # Re-added this log as patient assignment log is removed
-            time.sleep(random.uniform(0.001, 0.01))
-
-        for miner in miners:
-            miner.join()
-
-        time.sleep(1)
-        logger.info("Starting next mining round...\n")
+        time.sleep(STATS_INTERVAL)
+        stats = miner_pool.stats.snapshot()
+        latency = "n/a" if stats['latency_mean'] is None else (
+            f"mean {stats['latency_mean']:.1f}s, p95 {stats['latency_p95']:.1f}s")
+        logger.info(f"Throughput: {stats['blocks_per_minute']:.2f} blocks/min "
+                    f"({stats['blocks']} blocks, {stats['reports']} reports); confirmation latency {latency}")
+        logger.info(f"Signature cache: {verification_cache.stats()}")
 
 if __name__ == "__main__":
     run_simulation()
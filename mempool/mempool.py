@@ -1,21 +1,282 @@
 # mempool/mempool.py
 import threading
+import time
+from collections import deque, OrderedDict
+from reports.health_report import HealthReport
+from utils.metrics import registry
+
+ADMISSIONS = registry.counter('bchealth_mempool_admissions_total',
+                              "Reports offered to the mempool, by result (accepted, duplicate, invalid)", ['result'])
+PUT_BACKS = registry.counter('bchealth_mempool_put_backs_total', "Reports returned to the mempool after being taken")
+CONFIRMED = registry.counter('bchealth_mempool_confirmed_total', "Reports confirmed by an accepted block")
+DEPTH = registry.gauge('bchealth_mempool_depth', "Reports waiting in the mempool")
 
 class Mempool:
-    def __init__(self):
-        self.reports = []
-        self.lock = threading.Lock()
+    """
+    Pool of pending health reports.
+    Reports are kept in one FIFO lane per priority level (lane 0 is served first),
+    so every queue operation is O(1). A threading.Condition lets miners block in
+    take() until enough reports are available, and reports are deduplicated by
+    digest so the same report can never sit in the pool twice.
+
+    With validate_on_admission=True, each incoming report is parsed and its
+    signature verified once in add_report. Invalid reports are rejected right
+    away; valid ones are stored as HealthReport objects marked verified, with
+    their canonical bytes and digest already computed, so miners do not need
+    to parse or verify them again.
+
+    confirm() drops reports that made it into an accepted block (e.g. one
+    mined by another node) and remembers their digests, so they are never
+    admitted or put back again.
+
+    Each entry also records the report's serialized size and when it arrived,
+    so take_template() can fill a block to a byte budget and seal a partial
+    block once the oldest report has waited long enough. Reports put back
+    keep their original arrival time.
+    """
+    def __init__(self, priority_fn=None, priority_levels=1, validate_on_admission=False,
+                 max_admitted_digests=100000, max_confirmed_digests=100000, max_taken_arrivals=10000):
+        self.priority_fn = priority_fn or (lambda report: 0)
+        self.lanes = [deque() for _ in range(priority_levels)]  # each entry: (digest, report, size, arrived)
+        self.digests = set()
+        self.condition = threading.Condition()
+        self.count = 0
+        self.pending_bytes = 0
+        # Arrival times of reports handed out, so put_back can restore them (bounded, oldest forgotten first;
+        # only reports still being mined need one, so the bound is a few blocks' worth)
+        self.taken_arrivals = OrderedDict()
+        self.max_taken_arrivals = max_taken_arrivals
+        self.validate_on_admission = validate_on_admission
+        self.rejected = 0
+        # Digests of reports that passed admission, remembered after they leave the pool
+        # so block validation can trust them (bounded, oldest forgotten first)
+        self.admitted = OrderedDict()
+        self.max_admitted_digests = max_admitted_digests
+        # Digests of reports already included in an accepted block (bounded, oldest forgotten first)
+        self.confirmed = OrderedDict()
+        self.max_confirmed_digests = max_confirmed_digests
+        # Read at collection time; with several pools in one process the newest one is reported
+        DEPTH.set_function(lambda: self.count)
+
+    @staticmethod
+    def report_digest(report):
+        """
+        Digest used for deduplication: HealthReport.digest(), the SHA-256 of the
+        report's canonical bytes. Dicts are parsed first, so a report and its
+        dict form collide.
+        """
+        if not isinstance(report, HealthReport):
+            report = HealthReport.from_dict(report)
+        return report.digest()
+
+    def _admit(self, report):
+        """Parses and verifies a report once. Returns the HealthReport, or None if invalid."""
+        if not isinstance(report, HealthReport):
+            report = HealthReport.from_dict(report)
+        if not report.verified:
+            report.verified = report.verify_signature()
+        if not report.verified:
+            return None
+        report.digest() # Computes and caches the canonical bytes as well
+        return report
+
+    def is_admitted(self, report):
+        """True if this report (dict or HealthReport) passed admission on this node."""
+        digest = self.report_digest(report)
+        with self.condition:
+            return digest in self.admitted
+
+    def _lane_for(self, report):
+        return self.lanes[min(max(self.priority_fn(report), 0), len(self.lanes) - 1)]
 
     def add_report(self, report):
-        with self.lock:
-            self.reports.append(report)
+        """
+        Appends a report to the back of its lane and wakes waiting miners.
+        Returns False if an identical report is already pending, or if
+        admission validation is on and the report's signature is invalid.
+        """
+        if self.validate_on_admission:
+            # Verification runs outside the lock so admissions do not serialize on RSA
+            admitted = self._admit(report)
+            if admitted is None:
+                with self.condition:
+                    self.rejected += 1
+                ADMISSIONS.labels('invalid').inc()
+                return False
+            report = admitted
+        digest = self.report_digest(report)
+        size = self.report_size(report)
+        lane = self._lane_for(report)
+        with self.condition:
+            if digest in self.digests or digest in self.confirmed:
+                ADMISSIONS.labels('duplicate').inc()
+                return False
+            self.digests.add(digest)
+            if self.validate_on_admission:
+                self.admitted[digest] = True
+                self.admitted.move_to_end(digest)
+                while len(self.admitted) > self.max_admitted_digests:
+                    self.admitted.popitem(last=False)
+            lane.append((digest, report, size, time.monotonic()))
+            self.count += 1
+            self.pending_bytes += size
+            self.condition.notify_all()
+        ADMISSIONS.labels('accepted').inc()
+        return True
+
+    def put_back(self, reports):
+        """
+        Returns previously taken reports to the front of their lanes, in their
+        original order, so they are the next ones handed out.
+        """
+        entries = [(self.report_digest(r), r, self.report_size(r)) for r in reports]
+        returned = 0
+        now = time.monotonic()
+        with self.condition:
+            for digest, report, size in reversed(entries):
+                arrived = self.taken_arrivals.pop(digest, now)
+                if digest in self.digests or digest in self.confirmed:
+                    continue
+                self.digests.add(digest)
+                self._lane_for(report).appendleft((digest, report, size, arrived))
+                self.count += 1
+                self.pending_bytes += size
+                returned += 1
+            self.condition.notify_all()
+        PUT_BACKS.inc(returned)
+
+    def confirm(self, reports):
+        """
+        Marks reports as included in an accepted block: any that are still
+        pending are removed from their lanes, and later add_report/put_back
+        calls for them are ignored.
+        """
+        digests = {self.report_digest(r) for r in reports}
+        CONFIRMED.inc(len(digests))
+        with self.condition:
+            for digest in digests:
+                self.confirmed[digest] = True
+                self.confirmed.move_to_end(digest)
+                self.taken_arrivals.pop(digest, None)
+            while len(self.confirmed) > self.max_confirmed_digests:
+                self.confirmed.popitem(last=False)
+            pending = digests & self.digests
+            if pending:
+                # Rare (another node confirmed reports we still hold), so an O(n) rebuild is fine
+                for i, lane in enumerate(self.lanes):
+                    self.pending_bytes -= sum(entry[2] for entry in lane if entry[0] in pending)
+                    self.lanes[i] = deque(entry for entry in lane if entry[0] not in pending)
+                self.digests -= pending
+                self.count -= len(pending)
+
+    def restore(self, reports):
+        """
+        Undoes confirm() for reports whose block was disconnected by a reorg
+        and puts them back at the front of the pool.
+        """
+        digests = [self.report_digest(r) for r in reports]
+        with self.condition:
+            for digest in digests:
+                self.confirmed.pop(digest, None)
+        self.put_back(reports)
+
+    def unconfirmed(self, reports):
+        """Returns the reports that have not been confirmed, in their original order."""
+        digests = [self.report_digest(r) for r in reports]
+        with self.condition:
+            return [r for r, digest in zip(reports, digests) if digest not in self.confirmed]
+
+    @staticmethod
+    def report_size(report):
+        """Bytes the report takes in a serialized block (its to_bytes() form, cached with the digest)."""
+        if not isinstance(report, HealthReport):
+            report = HealthReport.from_dict(report)
+        return len(report.to_bytes())
+
+    def _pop(self, count, max_bytes=None):
+        """
+        Removes up to count reports from the lane fronts, in priority order,
+        stopping at the first one that would take the total past max_bytes
+        (the first report is always taken). O(reports taken).
+        """
+        selected = []
+        total = 0
+        for lane in self.lanes:
+            while lane and len(selected) < count:
+                digest, report, size, arrived = lane[0]
+                if max_bytes is not None and selected and total + size > max_bytes:
+                    break
+                lane.popleft()
+                self.digests.discard(digest)
+                self.taken_arrivals[digest] = arrived
+                selected.append(report)
+                total += size
+            else:
+                continue
+            break # Byte budget reached; lower lanes must not jump ahead
+        while len(self.taken_arrivals) > self.max_taken_arrivals:
+            self.taken_arrivals.popitem(last=False)
+        self.count -= len(selected)
+        self.pending_bytes -= total
+        return selected
+
+    def oldest_wait(self):
+        """Seconds the longest-waiting pending report has been in the pool, or None if it is empty."""
+        with self.condition:
+            return self._oldest_wait(time.monotonic())
+
+    def _oldest_wait(self, now):
+        heads = [lane[0][3] for lane in self.lanes if lane]
+        return now - min(heads) if heads else None
+
+    def take(self, count, timeout=None, min_count=None):
+        """
+        Blocks until at least min_count reports (default: count) are pending,
+        then removes and returns up to count of them. Returns an empty list if
+        the timeout expires first; nothing is taken in that case.
+        """
+        needed = count if min_count is None else min_count
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while self.count < needed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return []
+                self.condition.wait(remaining)
+            return self._pop(count)
+
+    def take_template(self, max_reports, max_bytes=None, max_wait=None, timeout=None):
+        """
+        Takes the reports for one block: up to max_reports of them, totalling at
+        most max_bytes serialized bytes, from the lane fronts in priority order.
+
+        Waits until a full block is pending (max_reports reports or max_bytes
+        bytes) or, if max_wait is set, until the oldest pending report has
+        waited max_wait seconds; then takes what fits, so a partial block is
+        sealed rather than leaving reports waiting indefinitely. Returns an
+        empty list if the timeout expires first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                full = self.count >= max_reports or (max_bytes is not None and self.pending_bytes >= max_bytes)
+                oldest = self._oldest_wait(now)
+                if full or (max_wait is not None and oldest is not None and oldest >= max_wait):
+                    return self._pop(max_reports, max_bytes)
+                wait = None if deadline is None else deadline - now
+                if wait is not None and wait <= 0:
+                    return []
+                if max_wait is not None and oldest is not None:
+                    # Wake up when the oldest report reaches its deadline
+                    wait = max_wait - oldest if wait is None else min(wait, max_wait - oldest)
+                self.condition.wait(wait)
 
     def get_transactions(self, count):
-        with self.lock:
-            selected = self.reports[:count]
-            self.reports = self.reports[count:]
-            return selected
+        """Non-blocking: removes and returns up to count reports."""
+        with self.condition:
+            return self._pop(count)
 
     def size(self):
-        with self.lock:
-            return len(self.reports)
+        with self.condition:
+            return self.count
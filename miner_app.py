@@ -1,96 +1,255 @@
 import threading
 import time
 import random
+from collections import deque
 from blockchain.block import Block
-from proof_of_work import mine_block
+from proof_of_work import ThreadMiningBackend
 from utils.logger import setup_logger
+from utils.metrics import registry
 from reports.health_report import HealthReport # Import HealthReport
 
+NONCES_TRIED = registry.counter('bchealth_miner_nonces_total', "Nonces tried", ['miner'])
+HASH_RATE = registry.gauge('bchealth_miner_hash_rate', "Hashes per second over the miner's last attempt", ['miner'])
+BLOCKS_MINED = registry.counter('bchealth_miner_blocks_mined_total', "Blocks mined, by whether the network accepted them",
+                                ['miner', 'accepted'])
+STALE_ABORTS = registry.counter('bchealth_miner_stale_aborts_total', "Mining attempts cancelled because the tip moved",
+                                ['miner'])
+
+class BlockTemplateBuilder:
+    """
+    Chooses the reports for the next block and builds it.
+
+    A block holds at most max_reports reports and max_bytes bytes of
+    serialized reports (None: no byte limit). It is sealed as soon as that
+    much is pending or, with max_wait set, once the oldest pending report has
+    waited max_wait seconds, in which case whatever is pending goes in. A
+    small max_wait bounds confirmation latency at low traffic at the price of
+    smaller blocks; larger budgets carry more reports per block at high
+    traffic. Selection takes reports off the front of the mempool lanes, so
+    it costs O(reports taken).
+    """
+    def __init__(self, mempool, max_reports=10, max_bytes=None, max_wait=None):
+        self.mempool = mempool
+        self.max_reports = max_reports
+        self.max_bytes = max_bytes
+        self.max_wait = max_wait
+
+    def take(self, timeout=None):
+        """Waits for the next block's reports; returns an empty list on timeout."""
+        return self.mempool.take_template(self.max_reports, self.max_bytes, self.max_wait, timeout)
+
+    def build(self, parent, reports, difficulty):
+        """Returns an unmined block holding reports on top of parent."""
+        return Block(
+            index=parent.index + 1,
+            transactions=reports, # The same immutable report objects, no dict round-trip
+            previous_hash=parent.hash,
+            difficulty=difficulty
+        )
+
 class Miner(threading.Thread):
     """
     Represents a miner in the blockchain network.
-    Miners now pick up any available health reports from the mempool
-    and attempt to mine them through Proof of Work.
+    Miners are long-lived: each one blocks on the mempool until reports are
+    available, builds a block on the pool's current tip and mines it. When the
+    tip moves, the pool cancels the stale work and the miner rebuilds the same
+    reports on the new tip straight away.
     """
-    def __init__(self, miner_id, blockchain, mempool, difficulty, stop_flag, broadcast_fn,
-                 max_reports_per_block=10): # Removed associated_patient_id
+    def __init__(self, miner_id, pool, mempool, difficulty, broadcast_fn,
+                 max_reports_per_block=10, mining_backend=None, template_builder=None): # Removed associated_patient_id
         super().__init__()
         self.miner_id = miner_id
-        self.blockchain = blockchain
+        self.pool = pool
         self.mempool = mempool
         self.difficulty = difficulty
-        self.stop_flag = stop_flag
         self.broadcast_fn = broadcast_fn
         self.max_reports_per_block = max_reports_per_block
+        # Decides when to seal a block and which reports go in it
+        self.template_builder = template_builder or BlockTemplateBuilder(mempool, max_reports_per_block)
+        # The backend does the actual nonce search; stop flags must come from its new_stop_flag()
+        self.mining_backend = mining_backend or ThreadMiningBackend()
         self.logger = setup_logger(f"Miner {self.miner_id}")
         self.daemon = True
+        # Metric series are looked up once; recording is once per attempt, never per nonce
+        self.nonces_tried = NONCES_TRIED.labels(miner_id)
+        self.hash_rate = HASH_RATE.labels(miner_id)
+        self.stale_aborts = STALE_ABORTS.labels(miner_id)
+
+    def _take_valid_reports(self):
+        """Waits for the next block's reports and returns the ones with valid signatures."""
+        # The builder blocks until a block is due (full, or its oldest report has
+        # waited long enough) and hands the reports out atomically, so concurrent
+        # miners never split a batch between them.
+        potential_reports = self.template_builder.take(timeout=0.5)
+        if not potential_reports:
+            return []
+
+        # Reports admitted by a validating mempool arrive as verified HealthReport objects;
+        # anything else is reconstructed (bytes signature internally) and verified in parallel
+        reports = [HealthReport.from_dict(r) for r in potential_reports]
+        unchecked = [r for r in reports if not r.verified]
+        for report, is_valid in zip(unchecked, HealthReport.verify_batch(unchecked)):
+            report.verified = is_valid
+
+        valid_reports = []
+        for report in reports:
+            if report.verified:
+                valid_reports.append(report)
+            else:
+                self.logger.warning(f"🚨 Invalid signature for report from Doctor {report.doctor_id}. Skipping.")
+        return valid_reports
 
     def run(self):
         """
-        The main mining loop. Continuously tries to mine new blocks.
-        Now picks up any reports from the mempool.
+        The main mining loop. Runs until the pool is closed.
+        Reports held from cancelled work are re-mined on the new tip without
+        going back through the mempool.
         """
-        while True:
-            # Check if another miner has already found a block
-            if self.stop_flag.is_set():
-                self.logger.info("❌ Stopped: Another miner already mined the block.")
-                break
-
-            # Get transactions (health reports) from the mempool
-            # Miners now simply try to get max_reports_per_block transactions
-            potential_reports = self.mempool.get_transactions(self.max_reports_per_block)
-            
-            # If not enough reports, wait and try again
-            if len(potential_reports) < self.max_reports_per_block:
-                # Put back the reports if not enough to form a block
-                for r in potential_reports:
-                    self.mempool.add_report(r)
-                time.sleep(0.5)
-                continue
+        valid_reports = []
+        while not self.pool.closed.is_set():
+            if not valid_reports:
+                valid_reports = self._take_valid_reports()
+                # Nothing pending (or nothing valid); wait on the mempool again
+                if not valid_reports:
+                    continue
 
-            valid_reports = []
-            reports_for_next_round = [] # Reports that are valid but exceed max_reports_per_block
-
-            for report_dict in potential_reports: # Iterate over all potential reports
-                # Reconstruct HealthReport object to use its verification method
-                report = HealthReport.from_dict(report_dict) # This reconstructs with bytes signature internally
-                if report.verify_signature():
-                    # IMPORTANT FIX: Append the dictionary representation from the *reconstructed*
-                    # HealthReport object, which will ensure the signature is Base64 encoded.
-                    valid_reports.append(report.to_dict()) 
-                else:
-                    self.logger.warning(f"🚨 Invalid signature for report from Doctor {report.doctor_id}. Skipping.")
-            
-            # Put back valid reports that couldn't fit into this block
-            # This logic is simplified as we're not filtering by patient anymore
-            for r in reports_for_next_round:
-                self.mempool.add_report(r)
-
-            # If no valid reports were found from the fetched batch, wait and try again
-            if len(valid_reports) == 0:
-                time.sleep(0.5)
+            # The tip and its cancel flag are read together, so work started on
+            # this tip is always cancelled when the tip moves on
+            last_block, stop_flag = self.pool.current_work()
+            if stop_flag.is_set():
                 continue
 
-            last_block = self.blockchain[-1]
-
             # Create a new block with the valid reports
-            new_block = Block(
-                index=last_block.index + 1,
-                transactions=valid_reports, # This list now contains dicts with Base64 signatures
-                previous_hash=last_block.hash,
-                difficulty=self.difficulty
-            )
+            new_block = self.template_builder.build(last_block, valid_reports, self.difficulty)
 
-            self.logger.info(f"⛏️ Miner {self.miner_id} mining started...") # Removed patient ID from log
+            self.logger.info(f"⛏️ Miner {self.miner_id} mining block #{new_block.index}...")
             # Attempt to mine the block using Proof of Work
-            mined_block = mine_block(new_block, self.difficulty, self.stop_flag)
+            nonces_before = self.nonces_tried.value
+            mining_start = time.perf_counter()
+            mined_block = self.mining_backend.mine(new_block, self.difficulty, stop_flag,
+                                                   on_attempts=self.nonces_tried.inc)
+            mining_time = time.perf_counter() - mining_start
+            if mining_time > 0:
+                self.hash_rate.set((self.nonces_tried.value - nonces_before) / mining_time)
 
             if mined_block:
                 self.logger.info(f"✅ Block #{mined_block.index} mined by Miner {self.miner_id}") # Removed patient ID from log
-                # Print the full details of the mined block using its __str__ method
-                print(mined_block) # This line will print all the requested block and transaction details
+                # Full block details at DEBUG; rendered by the log writer thread, and only if DEBUG is enabled
+                self.logger.debug("%s", mined_block)
                 self.logger.info(f"🧾 Health Report Count: {len(mined_block.transactions)}")
                 # Broadcast the successfully mined block to the network
-                self.broadcast_fn(mined_block)
-                break # Stop mining for this round as a block has been found
+                accepted = self.broadcast_fn(mined_block)
+                BLOCKS_MINED.labels(self.miner_id, 'true' if accepted else 'false').inc()
+                if not accepted:
+                    # Lost a race for this height; the reports go back to the pool
+                    self.mempool.put_back(valid_reports)
+                valid_reports = []
+            else:
+                self.stale_aborts.inc()
+                # Drop any of our reports that the new tip (e.g. a peer's block) already includes
+                valid_reports = self.mempool.unconfirmed(valid_reports)
+                self.logger.info(f"↪️ Tip moved past #{last_block.index}; rebuilding on the new tip.")
+
+        # Return anything still held so it is not lost on shutdown
+        if valid_reports:
+            self.mempool.put_back(valid_reports)
+
+class ThroughputStats:
+    """
+    Tracks accepted blocks per minute and confirmation latency, the time from a
+    report's timestamp until the block containing it is accepted.
+    """
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.blocks = 0
+        self.reports = 0
+        self.latencies = deque(maxlen=window) # Most recent confirmation latencies, in seconds
+        self.lock = threading.Lock()
+
+    def record_block(self, block, accepted_at=None):
+        accepted_at = accepted_at if accepted_at is not None else time.time()
+        with self.lock:
+            self.blocks += 1
+            self.reports += len(block.transactions)
+            self.latencies.extend(accepted_at - report.timestamp for report in block.transactions)
+
+    def snapshot(self):
+        with self.lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            latencies = sorted(self.latencies)
+            blocks, reports = self.blocks, self.reports
+
+        def percentile(q):
+            return latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else None
+
+        return {
+            'blocks': blocks,
+            'reports': reports,
+            'blocks_per_minute': blocks * 60 / elapsed,
+            'latency_mean': sum(latencies) / len(latencies) if latencies else None,
+            'latency_p50': percentile(0.50),
+            'latency_p95': percentile(0.95),
+            'latency_max': latencies[-1] if latencies else None,
+        }
+
+class MinerPool:
+    """
+    A fixed set of long-lived Miner threads sharing one mining backend.
+
+    The pool holds the current work: the chain tip plus a stop flag for that
+    tip. on_new_tip() (registered with NodeNetwork.add_tip_listener) replaces
+    both and sets the old flag, which cancels every search still running on
+    the stale tip while the miners keep running. The miners share one
+    BlockTemplateBuilder, configured by max_reports_per_block,
+    max_block_bytes and max_report_wait.
+    """
+    def __init__(self, num_miners, blockchain, mempool, difficulty, broadcast_fn,
+                 mining_backend=None, max_reports_per_block=10, max_block_bytes=None, max_report_wait=None):
+        self.mining_backend = mining_backend or ThreadMiningBackend()
+        self.closed = threading.Event()
+        self.stats = ThroughputStats()
+        self.logger = setup_logger("MinerPool")
+        self._lock = threading.Lock()
+        self._work = (blockchain[-1], self.mining_backend.new_stop_flag())
+        self.template_builder = BlockTemplateBuilder(mempool, max_reports_per_block, max_block_bytes, max_report_wait)
+        ids = list(range(num_miners))
+        random.shuffle(ids)
+        self.miners = [
+            Miner(
+                miner_id=i,
+                pool=self,
+                mempool=mempool,
+                difficulty=difficulty,
+                broadcast_fn=broadcast_fn,
+                max_reports_per_block=max_reports_per_block,
+                mining_backend=self.mining_backend,
+                template_builder=self.template_builder
+            )
+            for i in ids
+        ]
+
+    def current_work(self):
+        """Returns (tip block, stop flag for work on that tip)."""
+        with self._lock:
+            return self._work
+
+    def on_new_tip(self, block):
+        """Moves all miners to the new tip and records it in the throughput stats."""
+        self.stats.record_block(block)
+        stop_flag = self.mining_backend.new_stop_flag()
+        with self._lock:
+            stale_flag = self._work[1]
+            self._work = (block, stop_flag)
+        stale_flag.set()
+
+    def start(self):
+        for miner in self.miners:
+            miner.start()
+            self.logger.info(f"Started Miner {miner.miner_id}")
 
+    def stop(self, timeout=None):
+        """Cancels current work and waits for the miners to exit."""
+        self.closed.set()
+        self.current_work()[1].set()
+        for miner in self.miners:
+            miner.join(timeout)
@@ -0,0 +1,165 @@
+# network/launcher.py
+"""
+Starts N P2PNode processes on this machine, feeds them health reports and
+measures how blocks and reports propagate.
+
+Node i listens on base_port + i and connects to the `degree` nodes before
+it (wrapping around), so the graph is connected for any degree >= 1. Each
+node generates reports at rate / N per second from its own doctor wallet;
+the first `miners` nodes mine. Competing miners create forks, which nodes
+resolve by cumulative work; the number of reorgs is reported per node.
+
+Run from the repository root:
+    python -m network.launcher --nodes 4 --duration 30 [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import random
+import statistics
+import time
+from utils.logger import configure_logging
+
+def _node_process(config, results):
+    configure_logging(logging.WARNING)
+    asyncio.run(_run_node(config, results))
+
+async def _run_node(config, results):
+    # Imported in the child so each node has its own key registry and caches
+    from network.p2p_node import P2PNode
+    from reports.health_report import HealthReport
+    from wallets.doctor_wallet import DoctorWallet
+
+    node = P2PNode(config['node_id'], port=config['port'], difficulty=config['difficulty'],
+                   mine=config['mine'], max_reports_per_block=config['reports_per_block'],
+                   max_report_wait=config['max_report_wait'])
+    await node.start()
+    for port in config['peer_ports']:
+        await node.connect('127.0.0.1', port)
+
+    rng = random.Random(config['seed'])
+    doctor = DoctorWallet(f"doctor_{config['node_id']}")
+    await asyncio.sleep(max(config['start_at'] - time.time(), 0))
+    end = config['start_at'] + config['duration']
+    interval = 1.0 / config['rate'] if config['rate'] > 0 else None
+    while interval is not None and time.time() < end:
+        report = HealthReport.generate(f"patient_{rng.randrange(config['patients'])}", doctor)
+        await node.submit_report(report)
+        await asyncio.sleep(interval)
+    await asyncio.sleep(max(end - time.time(), 0) + config['settle'])
+
+    results.put({
+        'stats': node.stats(),
+        'chain': [block.hash for block in node.chain],
+        'tx_counts': {block.hash: len(block.transactions) for block in node.chain},
+        'block_times': node.block_times,
+        'report_times': node.report_times,
+    })
+    await node.stop()
+
+def _propagation(times_by_node, ids, num_nodes):
+    """For ids seen by every node: time from the first to the last node accepting it."""
+    delays = []
+    for object_id in ids:
+        times = [node_times[object_id] for node_times in times_by_node if object_id in node_times]
+        if len(times) == num_nodes:
+            delays.append(max(times) - min(times))
+    return delays
+
+def _summary(delays):
+    if not delays:
+        return None
+    delays = sorted(delays)
+    return {
+        'count': len(delays),
+        'mean': statistics.fmean(delays),
+        'p50': delays[len(delays) // 2],
+        'p95': delays[min(int(0.95 * len(delays)), len(delays) - 1)],
+        'max': delays[-1],
+    }
+
+def run(nodes=4, degree=2, miners=2, duration=30.0, settle=5.0, rate=4.0, difficulty=3,
+        reports_per_block=10, max_report_wait=None, patients=50, base_port=9400, seed=1):
+    """Runs the network and returns the measurements as a dict."""
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    start_at = time.time() + 3.0 + 0.2 * nodes # Time for every process to start and connect
+    # Each undirected edge is dialled once, by its higher-numbered node
+    edges = {tuple(sorted((i, (i - k) % nodes))) for i in range(nodes) for k in range(1, degree + 1)
+             if (i - k) % nodes != i}
+    processes = []
+    for i in range(nodes):
+        config = {
+            'node_id': i,
+            'port': base_port + i,
+            'peer_ports': [base_port + low for low, high in sorted(edges) if high == i],
+            'difficulty': difficulty,
+            'mine': i < miners,
+            'reports_per_block': reports_per_block,
+            'max_report_wait': max_report_wait,
+            'rate': rate / nodes,
+            'patients': patients,
+            'seed': seed + i,
+            'start_at': start_at,
+            'duration': duration,
+            'settle': settle,
+        }
+        process = ctx.Process(target=_node_process, args=(config, results), daemon=True)
+        process.start()
+        processes.append(process)
+
+    outputs = [results.get() for _ in processes]
+    for process in processes:
+        process.join(10)
+    outputs.sort(key=lambda output: output['stats']['node_id'])
+
+    reference = outputs[0]['chain']
+    block_ids = reference[1:] # Genesis is not propagated
+    confirmed_reports = sum(outputs[0]['tx_counts'][block_hash] for block_hash in block_ids)
+    report_ids = set()
+    for output in outputs:
+        report_ids.update(output['report_times'])
+    return {
+        'nodes': nodes,
+        'degree': degree,
+        'miners': miners,
+        'duration': duration,
+        'report_rate': rate,
+        'blocks': len(block_ids),
+        'blocks_per_minute': len(block_ids) * 60 / duration,
+        'confirmed_reports_per_second': confirmed_reports / duration,
+        'nodes_on_reference_tip': sum(1 for output in outputs if output['chain'][-1] == reference[-1]),
+        'block_propagation': _summary(_propagation([o['block_times'] for o in outputs], block_ids, nodes)),
+        'report_propagation': _summary(_propagation([o['report_times'] for o in outputs], report_ids, nodes)),
+        'node_stats': [output['stats'] for output in outputs],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=4)
+    parser.add_argument('--degree', type=int, default=2, help="outbound connections per node")
+    parser.add_argument('--miners', type=int, default=2, help="number of nodes that mine")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds of report generation")
+    parser.add_argument('--settle', type=float, default=5.0, help="seconds to wait for propagation afterwards")
+    parser.add_argument('--rate', type=float, default=4.0, help="reports per second across all nodes")
+    parser.add_argument('--difficulty', type=int, default=3)
+    parser.add_argument('--reports-per-block', type=int, default=10)
+    parser.add_argument('--max-report-wait', type=float, default=None,
+                        help="seal a partial block once its oldest report has waited this many seconds")
+    parser.add_argument('--base-port', type=int, default=9400)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    result = run(nodes=args.nodes, degree=args.degree, miners=args.miners, duration=args.duration,
+                 settle=args.settle, rate=args.rate, difficulty=args.difficulty,
+                 reports_per_block=args.reports_per_block, max_report_wait=args.max_report_wait, base_port=args.base_port, seed=args.seed)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
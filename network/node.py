@@ -1,45 +1,132 @@
 # network/node.py
+import math
 import threading
-from collections import defaultdict
+import time
+from blockchain.block_tree import BlockTree
 from reports.health_report import HealthReport # Import HealthReport
 from utils.logger import setup_logger # Import setup_logger
+from utils.metrics import registry
+
+BLOCKS_RECEIVED = registry.counter('bchealth_blocks_received_total',
+                                   "Blocks passed to broadcast_block, by outcome", ['result'])
+VOTE_SECONDS = registry.histogram('bchealth_block_vote_seconds', "Time spent voting on a block's reports")
+REORGS = registry.counter('bchealth_reorgs_total', "Main-chain reorganizations")
+CHAIN_HEIGHT = registry.gauge('bchealth_chain_height', "Height of the main-chain tip")
 
 class NodeNetwork:
     """
     Simulates the blockchain network, handling block broadcasting and
     consensus for adding new blocks to the blockchain.
+
+    Accepted blocks go into a BlockTree over `blockchain`, which picks the
+    branch with the most cumulative work. A block that extends a side branch
+    is kept; if that branch overtakes the main chain, the chain reorganizes.
+    Disconnected blocks are taken out of the history tracker and reported to
+    the disconnect listeners, then the new blocks are added and reported to
+    the tip listeners, in chain order. A block whose parent has not arrived
+    waits in the tree's orphan pool. Signature voting runs outside the lock,
+    which only guards the tree and chain updates. Blocks mined below the
+    network's `difficulty` are rejected.
     """
-    def __init__(self, num_miners):
+    def __init__(self, num_miners, difficulty=0):
         self.miners = [f"miner_{i}" for i in range(num_miners)]
-        self.blockchain = []
+        self.difficulty = difficulty
         self.logger = setup_logger("NodeNetwork") # Add a logger for the network
+        self.lock = threading.Lock() # Guards the block tree and the chain it maintains
+        self.tip_listeners = [] # Called with each block added to the main chain
+        self.disconnect_listeners = [] # Called with each block a reorg removes from the main chain
+        self.reorgs = 0
+        self.blockchain = []
+
+    @property
+    def blockchain(self):
+        return self._blockchain
+
+    @blockchain.setter
+    def blockchain(self, chain):
+        """Sets the main chain (a list or BlockStore) and indexes it in a new block tree."""
+        self._blockchain = chain
+        self.block_tree = BlockTree(chain, min_difficulty=self.difficulty)
 
-    def broadcast_block(self, block, stop_flag, vote_fn, history_tracker):
+    def add_tip_listener(self, listener):
+        """Registers listener(block), called after each block is added to the main chain and indexed."""
+        self.tip_listeners.append(listener)
+
+    def add_disconnect_listener(self, listener):
+        """Registers listener(block), called for each block a reorg removes from the main chain, tip first."""
+        self.disconnect_listeners.append(listener)
+
+    def broadcast_block(self, block, vote_fn, history_tracker):
         """
         Broadcasts a newly mined block to the network.
         Other nodes (simulated by vote_fn) validate the block.
-        If accepted by majority, the block is added to the blockchain.
+        If accepted by majority, the block is added to the block tree; if that
+        changes the main chain, the history tracker and listeners are updated.
+        Returns True if the block is on the main chain afterwards.
         """
         self.logger.info(f"[Network] Broadcasting block {block.hash[:10]}...")
 
+        with self.lock:
+            known = block.hash in self.block_tree
+        if known:
+            self.logger.info(f"[Network] Block {block.hash[:10]}... already known.")
+            BLOCKS_RECEIVED.labels('duplicate').inc()
+            return False
+
+        # Recompute the canonical header hash; a block whose proof of work does not
+        # check out is dropped and mining on the current tip carries on.
+        if block.difficulty < self.difficulty or not block.has_valid_proof():
+            self.logger.warning(f"[Network] ❌ Block {block.hash[:10]}... rejected: invalid proof of work.")
+            BLOCKS_RECEIVED.labels('invalid_pow').inc()
+            return False
+
+        reports = block.transactions
+        # vote_fn verifies each report; votes run in parallel and stop once the majority is decided
+        vote_start = time.perf_counter()
+        votes = HealthReport.verify_batch(reports, check=vote_fn, quorum=math.ceil(len(reports) / 2))
+        VOTE_SECONDS.observe(time.perf_counter() - vote_start)
         valid_votes_count = 0
-        for tx_dict in block.transactions:
-            report = HealthReport.from_dict(tx_dict)
-            if vote_fn(report): # vote_fn now verifies the report
+        for report, vote in zip(reports, votes):
+            if vote:
                 valid_votes_count += 1
-            else:
+            elif vote is not None:
                 self.logger.warning(f"[Network] 🚨 Invalid report detected in block {block.hash[:10]}... from Doctor {report.doctor_id}. Vote against.")
 
-        if valid_votes_count >= len(block.transactions) / 2: # At least half of the reports must be valid
-            self.blockchain.append(block)
-            self.logger.info(f"[Network] ✅ Block {block.hash[:10]}... added to blockchain by majority (valid reports: {valid_votes_count}/{len(block.transactions)})")
-            # Add all reports from the accepted block to the patient history tracker,
-            # passing the block's hash.
-            for report_dict in block.transactions: # Iterate over the dictionaries stored in the block
-                history_tracker.add_report(report_dict, block.hash) # Pass the block.hash
-        else:
+        if valid_votes_count < len(block.transactions) / 2: # At least half of the reports must be valid
             self.logger.warning(f"[Network] ❌ Block {block.hash[:10]}... rejected due to insufficient valid reports ({valid_votes_count}/{len(block.transactions)}).")
-        
-        # Signal all miners to stop current mining round as a block has been processed
-        stop_flag.set()
+            BLOCKS_RECEIVED.labels('rejected_votes').inc()
+            return False
+
+        with self.lock:
+            update = self.block_tree.add(block)
+            BLOCKS_RECEIVED.labels(update.status).inc()
+            if update.status == 'orphan':
+                self.logger.info(f"[Network] Block {block.hash[:10]}... held as orphan: parent {block.previous_hash[:10]}... unknown.")
+                return False
+            if update.status == 'side':
+                self.logger.info(f"[Network] Block {block.hash[:10]}... stored on a side branch (height {block.index}).")
+                return False
+            if update.status != 'connected':
+                self.logger.warning(f"[Network] ❌ Block {block.hash[:10]}... rejected ({update.status}).")
+                return False
+
+            if update.disconnected:
+                self.reorgs += 1
+                REORGS.inc()
+                self.logger.warning(f"[Network] 🔀 Reorg: {len(update.disconnected)} block(s) replaced by {len(update.connected)} "
+                                    f"at height {update.disconnected[-1].index}.")
+            for old_block in update.disconnected:
+                history_tracker.remove_block(old_block.hash)
+                for listener in self.disconnect_listeners:
+                    listener(old_block)
 
+            for new_block in update.connected:
+                self.logger.info(f"[Network] ✅ Block {new_block.hash[:10]}... added to blockchain at height {new_block.index} (reports: {len(new_block.transactions)})")
+                # Add all reports from the accepted block to the patient history tracker,
+                # with the block's hash and each report's merkle inclusion proof.
+                history_tracker.add_block(new_block)
+                # Move miners onto the new tip; work on the old one is cancelled
+                CHAIN_HEIGHT.set(new_block.index)
+                for listener in self.tip_listeners:
+                    listener(new_block)
+            return any(new_block.hash == block.hash for new_block in update.connected)
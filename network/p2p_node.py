@@ -0,0 +1,496 @@
+# network/p2p_node.py
+import asyncio
+import time
+from collections import OrderedDict
+from blockchain.block import Block
+from history.history_tracker import PatientHistoryTracker
+from mempool.mempool import Mempool
+from miner_app import MinerPool
+from network import protocol
+from network.node import NodeNetwork
+from proof_of_work import ThreadMiningBackend
+from reports.health_report import HealthReport
+from Signatures import deserialize_public_key, key_fingerprint, key_registry
+from utils.logger import setup_logger
+
+# Most block ids returned for one getblocks request
+GETBLOCKS_LIMIT = 500
+# Most ids asked for in one getdata message
+FETCH_BATCH = 16
+
+def fixed_genesis(difficulty):
+    """Genesis block with a fixed timestamp, so every node starts from the same hash."""
+    genesis = Block(0, [], "0", difficulty)
+    genesis.timestamp = 0.0
+    genesis.hash = genesis.compute_hash()
+    return genesis
+
+def _remember(bounded, key, value=True, limit=100000):
+    bounded[key] = value
+    bounded.move_to_end(key)
+    while len(bounded) > limit:
+        bounded.popitem(last=False)
+
+class Peer:
+    """
+    One TCP connection to another node.
+
+    Outgoing messages go through a bounded queue drained by a writer task.
+    send() waits while the queue is full, which stops the caller (usually our
+    read loop for this or another peer) and so pushes back on whoever is
+    feeding us. announce() is used for inv gossip and drops the message
+    instead of waiting; the peer can still learn the object from other peers.
+    request_slots bounds how many getdata requests are in flight to the peer;
+    fetch tasks wait for a slot, never the read loop, since only the read loop
+    can deliver the data that frees one. queued holds the (kind, id) of every
+    object with a fetch task queued or running, at most max_queued_fetches.
+    """
+    def __init__(self, reader, writer, max_queued_messages=256, max_inflight_requests=8,
+                 max_queued_fetches=2 * GETBLOCKS_LIMIT):
+        self.reader = reader
+        self.writer = writer
+        self.node_id = None
+        self.height = -1
+        self.outbox = asyncio.Queue(max_queued_messages)
+        self.request_slots = asyncio.Semaphore(max_inflight_requests)
+        self.queued = set()
+        self.max_queued_fetches = max_queued_fetches
+        self.last_getblocks = None # our tip hash at the last sync request, to avoid repeating it
+        self.deferred_sync_height = None # next getblocks height, held back while the fetch queue is busy
+        self.dropped_announcements = 0
+        self.writer_task = asyncio.ensure_future(self._write_loop())
+
+    async def _write_loop(self):
+        try:
+            while True:
+                frame = await self.outbox.get()
+                self.writer.write(frame)
+                await self.writer.drain()
+        except ConnectionError:
+            # The read loop sees the same failure and drops the peer
+            self.writer.close()
+
+    def fetch_room(self):
+        return self.max_queued_fetches - len(self.queued)
+
+    def can_sync(self):
+        """True while the fetch queue is at most half full, so another sync batch can be asked for."""
+        return len(self.queued) <= self.max_queued_fetches // 2
+
+    async def send(self, message):
+        await self.outbox.put(protocol.encode_frame(message))
+
+    def announce(self, message):
+        try:
+            self.outbox.put_nowait(protocol.encode_frame(message))
+            return True
+        except asyncio.QueueFull:
+            self.dropped_announcements += 1
+            return False
+
+    def close(self):
+        self.writer_task.cancel()
+        self.writer.close()
+
+class P2PNode:
+    """
+    A full node that runs on an asyncio event loop and talks to peers over TCP.
+
+    Each node has its own chain, mempool (validating on admission) and patient
+    history; blocks are accepted through a local NodeNetwork, so the checks are
+    the same as in the single-process simulation. Reports and blocks are
+    gossiped announce-then-fetch: a node sends `inv` with ids, and peers that
+    do not have an object yet ask for it with `getdata`. Doctor public keys are
+    fetched from the announcing peer the same way when a report refers to an
+    unknown fingerprint (a fingerprint is the hash of its key, so it cannot be
+    answered with a different key).
+
+    Backpressure: a read loop never waits on fetches, since it alone reads
+    the replies that complete them. Announced objects are fetched by tasks
+    that wait for one of the peer's request slots; each peer has a capped
+    queue of such fetches, ids announced beyond it are dropped, and block
+    sync asks for its next batch only once that queue has drained to half.
+    Signature checking runs in worker threads under a node-wide limit. What
+    does block is sending: replies and requests wait while a peer's outbox
+    is full, which stops the read loop and lets TCP flow control slow down
+    whoever is feeding us.
+
+    Fork choice, the orphan pool and reorgs are handled by the NodeNetwork's
+    BlockTree. When a block arrives whose parent is unknown, the sender is
+    asked for the blocks we are missing with getblocks, which carries a
+    locator (hashes from our main chain) so the peer can find where our
+    chains diverge.
+
+    With mine=True a MinerPool mines on this node's tip; blocks it finds are
+    accepted locally and then announced.
+    """
+    def __init__(self, node_id, host='127.0.0.1', port=0, difficulty=3, mine=False, num_miners=1,
+                 mining_backend=None, max_reports_per_block=10, max_block_bytes=None, max_report_wait=None,
+                 max_inflight_requests=8, max_queued_fetches=2 * GETBLOCKS_LIMIT,
+                 max_pending_validations=16, max_queued_messages=256, request_timeout=10.0):
+        self.node_id = node_id
+        self.host = host
+        self.port = port
+        self.difficulty = difficulty
+        self.max_inflight_requests = max_inflight_requests
+        self.max_queued_fetches = max_queued_fetches
+        self.max_queued_messages = max_queued_messages
+        self.request_timeout = request_timeout
+        self.max_pending_validations = max_pending_validations
+        self.logger = setup_logger(f"Node {node_id}")
+
+        self.chain = [fixed_genesis(difficulty)]
+        self.mempool = Mempool(validate_on_admission=True)
+        self.history = PatientHistoryTracker()
+        self.network = NodeNetwork(num_miners=num_miners, difficulty=difficulty)
+        self.network.blockchain = self.chain
+        self.network.add_tip_listener(self._on_block_accepted)
+        self.network.add_disconnect_listener(self._on_block_disconnected)
+        self.block_tree = self.network.block_tree
+
+        self.peers = set()
+        self.inflight = {}                 # (kind, id) -> Future resolved with the item bytes
+        self.processing = set()            # (kind, id) fetched and being validated
+        self.seen_reports = OrderedDict()  # digests already processed (admitted or rejected)
+        self.recent_reports = OrderedDict() # digest -> HealthReport, served to peers
+        self.validation_slots = None       # created on the loop in start()
+        self.loop = None
+        self.server = None
+
+        # Acceptance times for measurement: block hash / report digest -> time.time()
+        self.block_times = {}
+        self.report_times = {}
+
+        self.miner_pool = None
+        if mine:
+            self.miner_pool = MinerPool(
+                num_miners, self.chain, self.mempool, difficulty,
+                broadcast_fn=lambda b: self.network.broadcast_block(b, self._vote, self.history),
+                mining_backend=mining_backend or ThreadMiningBackend(),
+                max_reports_per_block=max_reports_per_block,
+                max_block_bytes=max_block_bytes,
+                max_report_wait=max_report_wait
+            )
+            # Registered after _on_block_accepted, so confirmed reports are dropped before miners rebuild
+            self.network.add_tip_listener(self.miner_pool.on_new_tip)
+
+    # --- lifecycle ----------------------------------------------------------
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.validation_slots = asyncio.Semaphore(self.max_pending_validations)
+        self.server = await asyncio.start_server(self._on_inbound, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        if self.miner_pool is not None:
+            self.miner_pool.start()
+        self.logger.info(f"Listening on {self.host}:{self.port}")
+
+    async def connect(self, host, port, retries=20, delay=0.25):
+        """Opens an outbound connection, retrying while the peer is still starting up."""
+        for attempt in range(retries):
+            try:
+                reader, writer = await asyncio.open_connection(host, port)
+                break
+            except OSError:
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+        self._add_peer(reader, writer)
+
+    async def stop(self):
+        if self.miner_pool is not None:
+            await asyncio.to_thread(self.miner_pool.stop, 5)
+        if self.server is not None:
+            self.server.close()
+        for peer in list(self.peers):
+            peer.close()
+        self.peers.clear()
+
+    async def _on_inbound(self, reader, writer):
+        self._add_peer(reader, writer)
+
+    def _add_peer(self, reader, writer):
+        peer = Peer(reader, writer, self.max_queued_messages, self.max_inflight_requests, self.max_queued_fetches)
+        self.peers.add(peer)
+        asyncio.ensure_future(self._serve_peer(peer))
+
+    async def _serve_peer(self, peer):
+        tip = self.chain[-1]
+        await peer.send({'type': protocol.HELLO, 'node_id': str(self.node_id),
+                         'height': tip.index, 'tip': tip.hash})
+        handlers = {
+            protocol.HELLO: self._on_hello,
+            protocol.INV: self._on_inv,
+            protocol.GETDATA: self._on_getdata,
+            protocol.DATA: self._on_data,
+            protocol.NOTFOUND: self._on_notfound,
+            protocol.GETBLOCKS: self._on_getblocks,
+        }
+        try:
+            while True:
+                message = await protocol.read_message(peer.reader)
+                handler = handlers.get(message['type'])
+                if handler is not None:
+                    await handler(peer, message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except protocol.ProtocolError as e:
+            self.logger.warning(f"Dropping peer {peer.node_id}: {e}")
+        finally:
+            self.peers.discard(peer)
+            peer.close()
+
+    # --- message handlers ---------------------------------------------------
+
+    async def _on_hello(self, peer, message):
+        peer.node_id = message.get('node_id')
+        peer.height = message.get('height', -1)
+        if peer.height > self.chain[-1].index:
+            await self._request_blocks(peer)
+
+    async def _on_inv(self, peer, message):
+        kind = message['kind']
+        if kind == 'report':
+            known = self.seen_reports
+        elif kind == 'block':
+            known = self.block_tree
+        else:
+            return
+        wanted = [i for i in dict.fromkeys(message['ids']) if i not in known and (kind, i) not in peer.queued
+                  and (kind, i) not in self.inflight and (kind, i) not in self.processing]
+        if len(wanted) > peer.fetch_room():
+            # Fetch queue full: drop the rest rather than wait here, since only this loop
+            # reads the replies that drain the queue. They can be announced again.
+            wanted = wanted[:max(peer.fetch_room(), 0)]
+            if kind == 'block':
+                peer.last_getblocks = None
+        for start in range(0, len(wanted), FETCH_BATCH):
+            # The fetch task waits for a request slot; this loop must keep reading the replies
+            batch = wanted[start:start + FETCH_BATCH]
+            peer.queued.update((kind, object_id) for object_id in batch)
+            asyncio.ensure_future(self._fetch(peer, kind, batch))
+        next_height = message.get('next_height')
+        if kind == 'block' and next_height is not None:
+            # A sync batch with more after it; ask for the next one now if the fetch
+            # queue has room, otherwise once enough fetches have finished
+            if peer.can_sync():
+                await peer.send({'type': protocol.GETBLOCKS, 'from_height': next_height})
+            else:
+                peer.deferred_sync_height = next_height
+
+    async def _on_getdata(self, peer, message):
+        kind = message['kind']
+        items, missing = [], []
+        for object_id in message['ids'][:GETBLOCKS_LIMIT]:
+            item = self._lookup(kind, object_id)
+            if item is None:
+                missing.append(object_id)
+            else:
+                items.append(item)
+        if items:
+            await peer.send({'type': protocol.DATA, 'kind': kind, 'items': items})
+        if missing:
+            await peer.send({'type': protocol.NOTFOUND, 'kind': kind, 'ids': missing})
+
+    async def _on_data(self, peer, message):
+        kind = message['kind']
+        items = message['items']
+        if kind == 'key':
+            # A key's fingerprint is only known once it is parsed, so parse no
+            # more keys than we are waiting for
+            pending = sum(1 for (k, _), future in self.inflight.items() if k == 'key' and not future.done())
+            items = items[:pending]
+        elif kind not in ('report', 'block'):
+            return
+        for item in items:
+            try:
+                object_id = self._object_id(kind, item)
+            except Exception:
+                continue # Undecodable item; its request times out
+            future = self.inflight.get((kind, object_id))
+            # Unrequested objects are ignored
+            if future is not None and not future.done():
+                future.set_result(item)
+
+    async def _on_notfound(self, peer, message):
+        for object_id in message['ids']:
+            future = self.inflight.get((message['kind'], object_id))
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    async def _on_getblocks(self, peer, message):
+        with self.network.lock:
+            if message.get('from_height') is not None:
+                start = max(int(message['from_height']), 0)
+            else:
+                # Start after the newest locator hash that is on our main chain
+                start = 1
+                for block_hash in message.get('locator', []):
+                    height = self.block_tree.main_chain_height(block_hash)
+                    if height is not None:
+                        start = height + 1
+                        break
+            end = min(len(self.chain), start + GETBLOCKS_LIMIT)
+            ids = [self.chain[height].hash for height in range(start, end)]
+        if not ids:
+            return
+        await peer.send({'type': protocol.INV, 'kind': 'block', 'ids': ids,
+                         'next_height': end if end < len(self.chain) else None})
+
+    # --- objects ------------------------------------------------------------
+
+    def _lookup(self, kind, object_id):
+        """Returns the bytes of an object we can serve, or None."""
+        if kind == 'report':
+            report = self.recent_reports.get(object_id)
+            return report.to_bytes() if report is not None else None
+        if kind == 'block':
+            with self.network.lock:
+                block = self.block_tree.get(object_id)
+            return block.serialize() if block is not None else None
+        return key_registry.get_serialized(object_id)
+
+    @staticmethod
+    def _object_id(kind, item):
+        if kind == 'report':
+            return HealthReport.from_bytes(item).digest()
+        if kind == 'block':
+            return Block.deserialize(item).hash
+        # Parsed but not registered; _ensure_keys registers keys it asked for
+        return key_fingerprint(deserialize_public_key(bytes(item)))
+
+    async def _request(self, peer, kind, ids):
+        """Sends getdata and waits for the items. Returns {id: bytes} for those that arrived."""
+        futures = {}
+        for object_id in ids:
+            if (kind, object_id) not in self.inflight:
+                futures[object_id] = self.inflight[(kind, object_id)] = self.loop.create_future()
+        try:
+            if not futures:
+                return {}
+            await peer.send({'type': protocol.GETDATA, 'kind': kind, 'ids': list(futures)})
+            await asyncio.wait(futures.values(), timeout=self.request_timeout)
+            return {object_id: future.result() for object_id, future in futures.items()
+                    if future.done() and future.result() is not None}
+        finally:
+            for object_id in futures:
+                self.inflight.pop((kind, object_id), None)
+
+    async def _fetch(self, peer, kind, ids):
+        """Fetches announced objects from a peer and processes them, holding one request slot."""
+        async with peer.request_slots:
+            try:
+                items = await self._request(peer, kind, ids)
+                if kind == 'block' and len(items) < len(ids):
+                    # Some blocks never arrived; let the next inv start a fresh sync
+                    peer.last_getblocks = None
+                for object_id in ids:
+                    item = items.get(object_id)
+                    if item is None:
+                        continue
+                    if kind == 'report':
+                        await self._process_report(HealthReport.from_bytes(item), peer)
+                    else:
+                        await self._process_block(Block.deserialize(item), peer)
+            except Exception as e:
+                if kind == 'block':
+                    peer.last_getblocks = None
+                self.logger.warning(f"Fetching {kind}s from peer {peer.node_id} failed: {e}")
+            finally:
+                peer.queued.difference_update((kind, object_id) for object_id in ids)
+        if peer.deferred_sync_height is not None and peer.can_sync():
+            next_height, peer.deferred_sync_height = peer.deferred_sync_height, None
+            await peer.send({'type': protocol.GETBLOCKS, 'from_height': next_height})
+
+    async def _ensure_keys(self, reports, peer):
+        """Fetches unknown doctor keys from the peer. Returns False if some are still missing."""
+        missing = sorted({r.doctor_key_fingerprint for r in reports
+                          if r.doctor_key_fingerprint is not None and r.doctor_key_fingerprint not in key_registry})
+        if missing and peer is not None:
+            # _on_data only resolves a request with the key whose fingerprint was asked for
+            for pem in (await self._request(peer, 'key', missing)).values():
+                key_registry.register(bytes(pem))
+        return all(fingerprint in key_registry for fingerprint in missing)
+
+    def _vote(self, report):
+        return self.mempool.is_admitted(report) or report.verify_signature()
+
+    # --- reports ------------------------------------------------------------
+
+    async def submit_report(self, report):
+        """Admits a locally created report and announces it. Returns True if admitted."""
+        return await self._process_report(report, None)
+
+    async def _process_report(self, report, source):
+        digest = report.digest()
+        if digest in self.seen_reports or ('report', digest) in self.processing:
+            return False
+        self.processing.add(('report', digest))
+        try:
+            if not await self._ensure_keys([report], source):
+                return False
+            async with self.validation_slots:
+                # Signature checking runs off the event loop
+                admitted = await asyncio.to_thread(self.mempool.add_report, report)
+        finally:
+            self.processing.discard(('report', digest))
+        _remember(self.seen_reports, digest)
+        if admitted:
+            self.report_times.setdefault(digest, time.time())
+            _remember(self.recent_reports, digest, report, limit=10000)
+            self._announce({'type': protocol.INV, 'kind': 'report', 'ids': [digest]}, exclude=source)
+        return admitted
+
+    # --- blocks -------------------------------------------------------------
+
+    async def _process_block(self, block, source):
+        if block.hash in self.block_tree or ('block', block.hash) in self.processing:
+            return False
+        self.processing.add(('block', block.hash))
+        try:
+            if not await self._ensure_keys(block.transactions, source):
+                return False
+            async with self.validation_slots:
+                accepted = await asyncio.to_thread(self.network.broadcast_block, block, self._vote, self.history)
+        finally:
+            self.processing.discard(('block', block.hash))
+        if self.block_tree.is_orphan(block.hash) and source is not None:
+            await self._request_blocks(source)
+        return accepted
+
+    async def _request_blocks(self, peer):
+        with self.network.lock:
+            tip_hash = self.chain[-1].hash
+            locator = self.block_tree.locator()
+        if peer.last_getblocks == tip_hash:
+            return
+        peer.last_getblocks = tip_hash
+        await peer.send({'type': protocol.GETBLOCKS, 'locator': locator})
+
+    def _on_block_accepted(self, block):
+        """Tip listener; runs in whichever thread accepted the block."""
+        self.block_times.setdefault(block.hash, time.time())
+        self.mempool.confirm(block.transactions)
+        self.loop.call_soon_threadsafe(
+            self._announce, {'type': protocol.INV, 'kind': 'block', 'ids': [block.hash]})
+
+    def _on_block_disconnected(self, block):
+        """Disconnect listener: reports of a block dropped by a reorg become pending again."""
+        self.mempool.restore(block.transactions)
+
+    def _announce(self, message, exclude=None):
+        for peer in list(self.peers):
+            if peer is not exclude:
+                peer.announce(message)
+
+    def stats(self):
+        return {
+            'node_id': self.node_id,
+            'height': self.chain[-1].index,
+            'tip': self.chain[-1].hash,
+            'peers': len(self.peers),
+            'mempool': self.mempool.size(),
+            'orphans': len(self.block_tree.orphans),
+            'reorgs': self.network.reorgs,
+            'dropped_announcements': sum(peer.dropped_announcements for peer in self.peers),
+        }
@@ -0,0 +1,60 @@
+# network/protocol.py
+"""
+Wire protocol between P2PNode instances.
+
+Each message is a 4-byte big-endian length followed by a dict in the
+canonical encoding (utils.encoding) with a 'type' key:
+
+    hello      node_id, height, tip           sent by both sides on connect
+    inv        kind, ids[, next_height]       announces objects by id
+    getdata    kind, ids                      asks for announced objects
+    data       kind, items                    the objects, as bytes
+    notfound   kind, ids                      objects the peer no longer has
+    getblocks  locator | from_height          asks for main-chain block ids after the
+                                              newest locator hash we share, or from a height
+
+kind is 'report' (id: HealthReport.digest(), item: to_bytes()), 'block'
+(id: block hash, item: Block.serialize()) or 'key' (id: key fingerprint,
+item: PEM public key).
+"""
+import struct
+from utils.encoding import encode, decode
+
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+HELLO = 'hello'
+INV = 'inv'
+GETDATA = 'getdata'
+DATA = 'data'
+NOTFOUND = 'notfound'
+GETBLOCKS = 'getblocks'
+
+KINDS = ('report', 'block', 'key')
+
+class ProtocolError(ValueError):
+    """Raised for a malformed or oversized frame; the connection is dropped."""
+
+def encode_frame(message):
+    body = encode(message)
+    if len(body) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Message of {len(body)} bytes exceeds the frame limit")
+    return FRAME_HEADER.pack(len(body)) + body
+
+async def read_message(reader):
+    """Reads one message from an asyncio StreamReader. Raises IncompleteReadError on EOF."""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame of {length} bytes exceeds the limit")
+    body = await reader.readexactly(length)
+    try:
+        message = decode(body)
+    except ValueError as e:
+        raise ProtocolError(f"Undecodable frame: {e}")
+    if not isinstance(message, dict) or 'type' not in message:
+        raise ProtocolError("Frame is not a single message")
+    kind = message.get('kind')
+    if kind is not None and kind not in KINDS:
+        raise ProtocolError(f"Unknown object kind {kind!r}")
+    return message
@@ -1,21 +1,146 @@
 import hashlib
-import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
 def compute_hash(block):
-    block_string = (
-        f"{block.index}"
-        f"{block.timestamp}"
-        f"{json.dumps(block.transactions, sort_keys=True)}"
-        f"{block.previous_hash}"
-        f"{block.nonce}"
-    )
-    return hashlib.sha256(block_string.encode()).hexdigest()
+    """
+    Returns the canonical hash of the block. Kept as a module-level helper;
+    the header layout itself lives in Block.header_prefix.
+    """
+    return block.compute_hash()
+
+def header_midstate(block):
+    """
+    Returns a SHA-256 object that has already absorbed the fixed block header.
+    Copying it and feeding only the nonce bytes is much cheaper than
+    re-hashing the whole header on every attempt.
+    """
+    return hashlib.sha256(block.header_prefix())
 
 def mine_block(block, difficulty, stop_flag):
     prefix = '0' * difficulty
+    midstate = header_midstate(block)
+    nonce = block.nonce
     while not stop_flag.is_set():
-        block.hash = compute_hash(block)
-        if block.hash.startswith(prefix):
+        attempt = midstate.copy()
+        attempt.update(str(nonce).encode())
+        digest = attempt.hexdigest()
+        if digest.startswith(prefix):
+            block.nonce = nonce
+            block.hash = digest
             return block
-        block.nonce += 1
+        nonce += 1
+    block.nonce = nonce
     return None
+
+def mine_nonce_range(header_prefix, difficulty, start, end, stop_flag, found_flag, check_interval=20000):
+    """
+    Scans nonces in [start, end) against a fixed header prefix.
+    Runs inside a worker process, so the cancel flags are only polled every
+    `check_interval` attempts to keep cross-process round trips off the hot loop.
+    Returns (winning nonce, nonces tried); the nonce is None if the range is
+    exhausted or the search cancelled.
+    """
+    prefix = '0' * difficulty
+    midstate = hashlib.sha256(header_prefix)
+    chunk_start = start
+    while chunk_start < end:
+        if stop_flag.is_set() or found_flag.is_set():
+            return None, chunk_start - start
+        chunk_end = min(chunk_start + check_interval, end)
+        for nonce in range(chunk_start, chunk_end):
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            if attempt.hexdigest().startswith(prefix):
+                return nonce, nonce - start + 1
+        chunk_start = chunk_end
+    return None, end - start
+
+class ThreadMiningBackend:
+    """
+    Mines in the calling thread with mine_block. All miners share the GIL,
+    but no extra processes are started.
+    """
+    def new_stop_flag(self):
+        return threading.Event()
+
+    def mine(self, block, difficulty, stop_flag, on_attempts=None):
+        start = block.nonce
+        mined = mine_block(block, difficulty, stop_flag)
+        if on_attempts is not None:
+            on_attempts(block.nonce - start + (1 if mined else 0))
+        return mined
+
+    def close(self):
+        pass
+
+class ProcessMiningBackend:
+    """
+    Splits the nonce space across a process pool, one contiguous range per worker.
+    Stop flags come from a multiprocessing.Manager so that NodeNetwork can cancel
+    work running in other processes; the winning nonce is sent back to the
+    parent, which fills in the Block.
+
+    on_attempts, if given, is called with each worker's count of nonces tried
+    as that worker finishes, which may be shortly after mine() returns.
+    """
+    NONCE_SPACE = 2 ** 32
+
+    def __init__(self, workers=None, check_interval=20000):
+        self.workers = workers or os.cpu_count() or 1
+        self.check_interval = check_interval
+        self._manager = multiprocessing.Manager()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+
+    def new_stop_flag(self):
+        """Returns a cancel signal that can be shared with the worker processes."""
+        return self._manager.Event()
+
+    def mine(self, block, difficulty, stop_flag, on_attempts=None):
+        header_prefix = block.header_prefix()
+        found_flag = self._manager.Event()
+        span = self.NONCE_SPACE // self.workers
+        futures = []
+        for i in range(self.workers):
+            start = block.nonce + i * span
+            end = start + span if i < self.workers - 1 else block.nonce + self.NONCE_SPACE
+            future = self._pool.submit(
+                mine_nonce_range, header_prefix, difficulty, start, end,
+                stop_flag, found_flag, self.check_interval
+            )
+            if on_attempts is not None:
+                future.add_done_callback(
+                    lambda f: None if f.cancelled() or f.exception() else on_attempts(f.result()[1]))
+            futures.append(future)
+
+        winning_nonce = None
+        pending = set(futures)
+        while pending and winning_nonce is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                nonce, _ = future.result()
+                if nonce is not None:
+                    winning_nonce = nonce
+                    break
+        # Tell the remaining workers to give up their ranges
+        found_flag.set()
+
+        if winning_nonce is None:
+            return None
+        block.nonce = winning_nonce
+        block.hash = block.compute_hash()
+        return block
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._manager.shutdown()
+
+def create_mining_backend(name, workers=None):
+    """Returns a mining backend by name: 'thread' or 'process'."""
+    if name == 'thread':
+        return ThreadMiningBackend()
+    if name == 'process':
+        return ProcessMiningBackend(workers=workers)
+    raise ValueError(f"Unknown mining backend: {name}")
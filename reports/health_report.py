@@ -1,8 +1,58 @@
 import random
 import time
 import json
+import hashlib
 import base64 # Import base64 for encoding/decoding bytes
-from Signatures import sign, verify, deserialize_public_key, serialize_public_key
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from Signatures import get_scheme, verify_cached, key_registry, verification_cache, LEGACY_SCHEME
+from utils.encoding import encode, decode
+from utils.metrics import registry
+
+# First byte of HealthReport.to_bytes(); bump when the wire/storage layout changes
+REPORT_WIRE_VERSION = 1
+# Prefix of the binary signing message, so it can never be mistaken for other signed data
+SIGNING_DOMAIN = b'bchealth-report\x00'
+
+# Thread pool used by HealthReport.verify_batch. The cryptography RSA calls
+# release the GIL, so verifications on separate threads run in parallel.
+_verification_pool = None
+_verification_pool_lock = threading.Lock()
+VERIFICATION_WORKERS = os.cpu_count() or 1
+
+def configure_verification_pool(max_workers):
+    """Replaces the shared verification pool with one of max_workers threads."""
+    global _verification_pool, VERIFICATION_WORKERS
+    with _verification_pool_lock:
+        old_pool = _verification_pool
+        VERIFICATION_WORKERS = max_workers
+        _verification_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="verify")
+    if old_pool is not None:
+        old_pool.shutdown(wait=False)
+
+def get_verification_pool():
+    global _verification_pool
+    with _verification_pool_lock:
+        if _verification_pool is None:
+            _verification_pool = ThreadPoolExecutor(max_workers=VERIFICATION_WORKERS, thread_name_prefix="verify")
+        return _verification_pool
+
+BATCH_VERIFY_SECONDS = registry.histogram('bchealth_signature_batch_verify_seconds',
+                                          "Time to check one chunk of signatures in verify_signatures", ['scheme'])
+BATCH_VERIFIED = registry.counter('bchealth_signature_batch_verified_total',
+                                  "Signatures checked through the batch path", ['scheme'])
+
+def _timed_verify_batch(scheme, items):
+    start = time.perf_counter()
+    results = scheme.verify_batch(items)
+    BATCH_VERIFY_SECONDS.labels(scheme.name).observe(time.perf_counter() - start)
+    BATCH_VERIFIED.labels(scheme.name).inc(len(items))
+    return results
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
 
 class HealthReport:
     """
@@ -10,25 +60,65 @@ class HealthReport:
     and public key to ensure authenticity and integrity.
     Added new fields: medications, allergies, follow_up_date,
     hospital_clinic, patient_age, patient_gender.
+
+    Reports with format_version 2 are signed over the canonical binary
+    encoding (utils.encoding). Older reports have no format_version and stay
+    signed over key-sorted JSON. JSON (to_dict/from_dict) is only an
+    import/export format; to_bytes/from_bytes is the wire and storage form
+    and keeps the signature as raw bytes.
+
+    Reports are immutable once built, so blocks, the mempool and the history
+    tracker share the same objects instead of converting to and from dicts.
+
+    signature_scheme names the signature backend in Signatures.SCHEMES
+    ('ed25519' or 'rsa-pss') and is part of the signed message. Reports
+    without it were signed with RSA-PSS.
     """
+    FORMAT_VERSION = 2
+
+    # Report content; read-only once the report is constructed
+    FIELDS = ('patient_id', 'doctor_id', 'symptoms', 'diagnosis', 'vitals', 'notes',
+              'medications', 'allergies', 'follow_up_date', 'hospital_clinic', 'patient_age',
+              'patient_gender', 'timestamp', 'doctor_public_key_serialized',
+              'doctor_key_fingerprint', 'signature', 'format_version', 'signature_scheme')
+    # __slots__ keeps each report compact: no per-instance __dict__
+    __slots__ = FIELDS + ('verified', '_signing_message', '_canonical_bytes', '_digest')
+
     def __init__(self, patient_id, doctor_id, symptoms, diagnosis, vitals, notes,
                  medications, allergies, follow_up_date, hospital_clinic, patient_age, patient_gender,
-                 doctor_public_key_serialized=None, signature=None, timestamp=None):
-        self.patient_id = patient_id
-        self.doctor_id = doctor_id
-        self.symptoms = symptoms
-        self.diagnosis = diagnosis
-        self.vitals = vitals
-        self.notes = notes
-        self.medications = medications
-        self.allergies = allergies
-        self.follow_up_date = follow_up_date
-        self.hospital_clinic = hospital_clinic # New field
-        self.patient_age = patient_age       # New field
-        self.patient_gender = patient_gender   # New field
-        self.timestamp = timestamp if timestamp is not None else time.time()
-        self.doctor_public_key_serialized = doctor_public_key_serialized
-        self.signature = signature # This can be bytes or a base64 string initially
+                 doctor_public_key_serialized=None, signature=None, timestamp=None,
+                 doctor_key_fingerprint=None, format_version=None, signature_scheme=None):
+        # Fields are set with object.__setattr__ because __setattr__ rejects changes.
+        # Repeated strings (ids, hospitals, diagnoses, ...) are interned so that
+        # millions of stored reports share one copy of each value.
+        init = object.__setattr__
+        init(self, 'patient_id', _intern(patient_id))
+        init(self, 'doctor_id', _intern(doctor_id))
+        init(self, 'symptoms', _intern(symptoms))
+        init(self, 'diagnosis', _intern(diagnosis))
+        init(self, 'vitals', {_intern(k): _intern(v) for k, v in vitals.items()})
+        init(self, 'notes', _intern(notes))
+        init(self, 'medications', _intern(medications))
+        init(self, 'allergies', _intern(allergies))
+        init(self, 'follow_up_date', follow_up_date)
+        init(self, 'hospital_clinic', _intern(hospital_clinic))
+        init(self, 'patient_age', patient_age)
+        init(self, 'patient_gender', _intern(patient_gender))
+        init(self, 'timestamp', timestamp if timestamp is not None else time.time())
+        init(self, 'doctor_public_key_serialized', _intern(doctor_public_key_serialized)) # Legacy: full PEM embedded in the report
+        init(self, 'doctor_key_fingerprint', _intern(doctor_key_fingerprint)) # Key registry id; replaces the embedded PEM
+        init(self, 'signature', signature) # This can be bytes or a base64 string initially
+        init(self, 'format_version', format_version) # None for legacy JSON-signed reports
+        init(self, 'signature_scheme', _intern(signature_scheme)) # None for untagged (RSA-PSS) reports
+        init(self, 'verified', False) # Set once the signature has been checked (e.g. on mempool admission)
+        init(self, '_signing_message', None)
+        init(self, '_canonical_bytes', None)
+        init(self, '_digest', None)
+
+    def __setattr__(self, name, value):
+        if name in HealthReport.FIELDS:
+            raise AttributeError(f"HealthReport is immutable; cannot set {name}")
+        object.__setattr__(self, name, value)
 
     def to_dict(self, include_signature=True):
         """
@@ -51,8 +141,17 @@ class HealthReport:
             'patient_age': self.patient_age,       # New field
             'patient_gender': self.patient_gender,   # New field
             'timestamp': self.timestamp,
-            'doctor_public_key_serialized': self.doctor_public_key_serialized,
         }
+        # Reports refer to the doctor's key by fingerprint. Older reports embed the
+        # PEM instead, and keep doing so, since it is part of what they signed.
+        if self.doctor_key_fingerprint is not None:
+            report_dict['doctor_key_fingerprint'] = self.doctor_key_fingerprint
+        else:
+            report_dict['doctor_public_key_serialized'] = self.doctor_public_key_serialized
+        if self.format_version is not None:
+            report_dict['format_version'] = self.format_version
+        if self.signature_scheme is not None:
+            report_dict['signature_scheme'] = self.signature_scheme
         if include_signature and self.signature:
             # Convert signature bytes to base64 string for JSON serialization
             report_dict['signature'] = base64.b64encode(self.signature).decode('utf-8')
@@ -62,55 +161,245 @@ class HealthReport:
 
     def get_message_for_signing(self):
         """
-        Generates a consistent message string for signing,
-        excluding the signature itself.
+        Generates a consistent message for signing, excluding the signature itself.
+        Binary (canonical encoding) for format_version 2 reports, key-sorted
+        JSON for legacy ones. Cached after the first call.
         """
-        # Create a dictionary without the signature field
-        report_data = self.to_dict(include_signature=False)
-        # Convert to a JSON string and encode to bytes for signing
-        return json.dumps(report_data, sort_keys=True).encode('utf-8')
+        if self._signing_message is None:
+            # Create a dictionary without the signature field
+            report_data = self.to_dict(include_signature=False)
+            if self.format_version is not None and self.format_version >= 2:
+                self._signing_message = SIGNING_DOMAIN + encode(report_data)
+            else:
+                self._signing_message = json.dumps(report_data, sort_keys=True).encode('utf-8')
+        return self._signing_message
+
+    def _signature_bytes(self):
+        if isinstance(self.signature, str):
+            return base64.b64decode(self.signature.encode('utf-8'))
+        return self.signature
+
+    def to_bytes(self):
+        """
+        Versioned wire/storage form: one version byte followed by the canonical
+        encoding of every field, with the signature as raw bytes.
+        """
+        if self._canonical_bytes is None:
+            fields = self.to_dict(include_signature=False)
+            fields['signature'] = self._signature_bytes()
+            self._canonical_bytes = bytes([REPORT_WIRE_VERSION]) + encode(fields)
+        return self._canonical_bytes
+
+    @staticmethod
+    def from_bytes(data):
+        """
+        Inverse of to_bytes(). Raises ValueError unless data is exactly the
+        report's canonical form (no extra fields or alternative encodings),
+        so the digest does not depend on how the sender encoded it.
+        """
+        if not data or data[0] != REPORT_WIRE_VERSION:
+            raise ValueError(f"Unsupported report wire version {data[:1]!r}")
+        report = HealthReport.from_dict(decode(data, 1))
+        if report.to_bytes() != data:
+            raise ValueError("Report is not in canonical form")
+        return report
+
+    def canonical_bytes(self):
+        """
+        Canonical encoding of the full report, signature included (same as
+        to_bytes()). Computed once and cached; the report must not be modified
+        afterwards.
+        """
+        return self.to_bytes()
+
+    def digest(self):
+        """SHA-256 hex digest of canonical_bytes(), cached after the first call."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.canonical_bytes()).hexdigest()
+        return self._digest
 
     def sign_report(self, doctor_private_key):
         """
         Signs the health report using the doctor's private key.
-        Sets the signature and the serialized public key of the doctor.
+        The doctor's key fingerprint (or legacy PEM) must be set beforehand,
+        as it is part of the signed message.
         """
+        scheme = self.get_scheme()
+        if not scheme.accepts(doctor_private_key):
+            raise ValueError(f"Key does not match the report's signature scheme {scheme.name}")
         message = self.get_message_for_signing()
-        self.signature = sign(message, doctor_private_key)
-        # Ensure public key is serialized and stored with the report
-        if self.doctor_public_key_serialized is None:
-            pass # It should be set during generation
+        # Signing completes construction, so it is the one place the signature is set
+        object.__setattr__(self, 'signature', scheme.sign(message, doctor_private_key))
+        self._canonical_bytes = None
+        self._digest = None
+
+    def get_scheme(self):
+        """The signature backend for this report (RSA-PSS for untagged reports)."""
+        return get_scheme(self.signature_scheme or LEGACY_SCHEME)
+
+    def get_signer_id(self):
+        """Returns a short label for the signing key, for display purposes."""
+        if self.doctor_key_fingerprint is not None:
+            return self.doctor_key_fingerprint
+        return self.doctor_public_key_serialized or ''
+
+    def _verification_inputs(self):
+        """
+        Returns (scheme, message, signature bytes, key fingerprint, public key),
+        or None if the report cannot be verified on this node (no signature,
+        unknown key, or a key that belongs to a different scheme).
+        """
+        if not self.signature:
+            return None # Cannot verify without signature
+        if self.doctor_key_fingerprint is None and not self.doctor_public_key_serialized:
+            return None # Cannot verify without a public key
+
+        # Decodes a base64 string signature; bytes are used as-is
+        signature_bytes = self._signature_bytes()
+
+        fingerprint = self.doctor_key_fingerprint
+        if fingerprint is None:
+            # Legacy report: the registry parses each distinct PEM only once
+            fingerprint = key_registry.register(self.doctor_public_key_serialized.encode('utf-8'))
+        public_key = key_registry.get(fingerprint)
+        if public_key is None:
+            return None # Key was never registered with this node
+
+        scheme = self.get_scheme()
+        if not scheme.accepts(public_key):
+            return None # The tag and the key must agree
+        return scheme, self.get_message_for_signing(), signature_bytes, fingerprint, public_key
 
     def verify_signature(self):
         """
-        Verifies the digital signature of the health report.
+        Verifies the digital signature of the health report with its scheme's backend.
         Returns True if the signature is valid, False otherwise.
         """
-        if not self.signature or not self.doctor_public_key_serialized:
-            return False # Cannot verify without signature or public key
-
         try:
-            # If signature is a base64 string, decode it back to bytes
-            if isinstance(self.signature, str):
-                signature_bytes = base64.b64decode(self.signature.encode('utf-8'))
-            else: # Assume it's already bytes if not a string (e.g., just signed)
-                signature_bytes = self.signature
-
-            public_key = deserialize_public_key(self.doctor_public_key_serialized.encode('utf-8'))
-            message = self.get_message_for_signing()
-            return verify(message, signature_bytes, public_key)
+            inputs = self._verification_inputs()
+            if inputs is None:
+                return False
+            scheme, message, signature_bytes, fingerprint, public_key = inputs
+            # Goes through the shared verification cache, so repeated checks of the
+            # same report (miner, network vote, block rendering) skip the signature work
+            return verify_cached(message, signature_bytes, fingerprint.encode('utf-8'), public_key, scheme=scheme)
         except Exception as e:
             # Log the error for debugging, but return False for verification failure
             print(f"Error verifying signature: {e}")
             return False
 
     @staticmethod
-    def generate(patient_id, doctor_wallet):
+    def verify_signatures(reports):
+        """
+        Verifies the signatures of many reports at once. Reports already in the
+        verification cache are answered from it; the rest are grouped by
+        signature scheme and handed to the scheme's verify_batch in one chunk
+        per worker of the shared verification pool. Returns a list of results
+        in the same order as reports.
+        """
+        results = [False] * len(reports)
+        pending = {} # scheme name -> [(index, cache key, (message, signature, public key))]
+        for i, report in enumerate(reports):
+            try:
+                inputs = report._verification_inputs()
+            except Exception:
+                continue
+            if inputs is None:
+                continue
+            scheme, message, signature_bytes, fingerprint, public_key = inputs
+            cache_key = verification_cache.make_key(message, signature_bytes, fingerprint.encode('utf-8'))
+            cached = verification_cache.get(cache_key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(scheme.name, []).append((i, cache_key, (message, signature_bytes, public_key)))
+
+        pool = get_verification_pool()
+        jobs = []
+        for name, items in pending.items():
+            chunk_size = -(-len(items) // VERIFICATION_WORKERS) # ceil
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                jobs.append((chunk, pool.submit(_timed_verify_batch, get_scheme(name), [item[2] for item in chunk])))
+        for chunk, job in jobs:
+            for (i, cache_key, _), result in zip(chunk, job.result()):
+                verification_cache.put(cache_key, result)
+                results[i] = result
+        return results
+
+    @staticmethod
+    def verify_batch(reports, check=None, quorum=None):
+        """
+        Verifies a list of reports on the shared verification pool.
+        Returns a list of results in the same order as reports.
+        `check` replaces verify_signature as the per-report test (e.g. a vote function).
+        If `quorum` is given, verification stops as soon as the number of valid
+        reports either reaches quorum or can no longer reach it; reports that were
+        not checked by then get None in the result list.
+        """
+        if check is None and quorum is None:
+            # Plain signature checks over the whole list: use the per-scheme batch path
+            return HealthReport.verify_signatures(reports)
+        check = check or HealthReport.verify_signature
+        results = [None] * len(reports)
+        if not reports:
+            return results
+
+        pool = get_verification_pool()
+        futures = {pool.submit(check, report): i for i, report in enumerate(reports)}
+        valid_count = 0
+        remaining = len(futures)
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[futures[future]] = result
+                remaining -= 1
+                if result:
+                    valid_count += 1
+            if quorum is not None and (valid_count >= quorum or valid_count + remaining < quorum):
+                # Decision is settled; drop work that has not started yet
+                for future in pending:
+                    future.cancel()
+                break
+        return results
+
+    @staticmethod
+    def parse_vitals(vitals):
+        """
+        Parses display-form vitals ("BP": "120/80", "HR": 72, "SpO2": "97%",
+        "Temp": "99.1 F") into numbers. Returns a dict with keys systolic,
+        diastolic, hr, spo2 and temp; missing or unreadable values are NaN.
+        """
+        def number(value):
+            try:
+                return float(str(value).rstrip('%F ').strip())
+            except (TypeError, ValueError):
+                return float('nan')
+
+        systolic = diastolic = float('nan')
+        bp = vitals.get('BP')
+        if isinstance(bp, str) and '/' in bp:
+            top, bottom = bp.split('/', 1)
+            systolic, diastolic = number(top), number(bottom)
+        return {
+            'systolic': systolic,
+            'diastolic': diastolic,
+            'hr': number(vitals.get('HR')),
+            'spo2': number(vitals.get('SpO2')),
+            'temp': number(vitals.get('Temp')),
+        }
+
+    @staticmethod
+    def generate(patient_id, doctor_wallet, rng=None):
         """
         Generates a random health report and signs it using the provided doctor's wallet.
         Includes new fields: medications, allergies, follow_up_date,
         hospital_clinic, patient_age, patient_gender.
+        rng (a random.Random) makes the contents repeatable; defaults to the random module.
         """
+        rng = rng or random
         symptoms_list = ["cough", "fever", "fatigue", "headache", "nausea", "sore throat", "dizziness"]
         diagnosis_list = ["flu", "cold", "migraine", "infection", "gastritis", "bronchitis", "allergies"]
         medications_list = ["Paracetamol", "Ibuprofen", "Amoxicillin", "Antihistamine", "Cough Syrup", "None", "Antibiotics"]
@@ -118,22 +407,22 @@ class HealthReport:
         hospital_clinic_list = ["City General Hospital", "Community Health Clinic", "St. Jude's Medical Center", "Family Care Doctors"]
         gender_list = ["Male", "Female", "Other"]
 
-        symptoms = random.choice(symptoms_list)
-        diagnosis = random.choice(diagnosis_list)
-        medications = random.choice(medications_list)
-        allergies = random.choice(allergies_list)
-        follow_up_date = (time.time() + random.randint(7, 30) * 24 * 3600) # 7 to 30 days from now
-        hospital_clinic = random.choice(hospital_clinic_list)
-        patient_age = random.randint(18, 80)
-        patient_gender = random.choice(gender_list)
+        symptoms = rng.choice(symptoms_list)
+        diagnosis = rng.choice(diagnosis_list)
+        medications = rng.choice(medications_list)
+        allergies = rng.choice(allergies_list)
+        follow_up_date = (time.time() + rng.randint(7, 30) * 24 * 3600) # 7 to 30 days from now
+        hospital_clinic = rng.choice(hospital_clinic_list)
+        patient_age = rng.randint(18, 80)
+        patient_gender = rng.choice(gender_list)
 
         vitals = {
-            "BP": f"{random.randint(110, 140)}/{random.randint(70, 90)}",
-            "HR": random.randint(60, 100),
-            "SpO2": f"{random.randint(95, 100)}%",
-            "Temp": f"{random.uniform(97.0, 102.0):.1f} F"
+            "BP": f"{rng.randint(110, 140)}/{rng.randint(70, 90)}",
+            "HR": rng.randint(60, 100),
+            "SpO2": f"{rng.randint(95, 100)}%",
+            "Temp": f"{rng.uniform(97.0, 102.0):.1f} F"
         }
-        notes = random.choice([
+        notes = rng.choice([
             "Prescribed rest and fluids.",
             "Advised follow-up after 3 days.",
             "Recommended blood test.",
@@ -158,7 +447,9 @@ class HealthReport:
             hospital_clinic=hospital_clinic,
             patient_age=patient_age,
             patient_gender=patient_gender,
-            doctor_public_key_serialized=doctor_wallet.get_public_key_serialized()
+            doctor_key_fingerprint=doctor_wallet.get_key_fingerprint(),
+            format_version=HealthReport.FORMAT_VERSION,
+            signature_scheme=doctor_wallet.signature_scheme
         )
         # Sign the report with the doctor's private key
         report.sign_report(doctor_wallet.get_private_key())
@@ -170,8 +461,10 @@ class HealthReport:
         Reconstructs a HealthReport object from a dictionary,
         useful when loading from blockchain data.
         Decodes signature from base64 string back to bytes.
-        Includes new fields.
+        Includes new fields. A HealthReport is returned unchanged.
         """
+        if isinstance(report_dict, HealthReport):
+            return report_dict
         signature = report_dict.get('signature')
         # Decode signature from base64 string to bytes if it exists and is a string
         if isinstance(signature, str):
@@ -193,7 +486,10 @@ class HealthReport:
             patient_age=report_dict.get('patient_age'),       # New field
             patient_gender=report_dict.get('patient_gender'),   # New field
             timestamp=report_dict['timestamp'],
-            doctor_public_key_serialized=report_dict['doctor_public_key_serialized'],
-            signature=signature
+            doctor_public_key_serialized=report_dict.get('doctor_public_key_serialized'),
+            signature=signature,
+            doctor_key_fingerprint=report_dict.get('doctor_key_fingerprint'),
+            format_version=report_dict.get('format_version'),
+            signature_scheme=report_dict.get('signature_scheme')
         )
 
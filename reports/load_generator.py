@@ -0,0 +1,129 @@
+# reports/load_generator.py
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from cryptography.hazmat.primitives import serialization
+from reports.health_report import HealthReport
+from wallets.doctor_wallet import DoctorWallet
+
+# Set in each signing process by _init_worker
+_worker_wallets = None
+_worker_patient_ids = None
+
+def _generate_batch(wallets, patient_ids, seed, batch_index, count):
+    # Each batch has its own RNG, so the contents do not depend on which worker signs it
+    rng = random.Random(seed * 1000003 + batch_index)
+    return [HealthReport.generate(rng.choice(patient_ids), rng.choice(wallets), rng=rng) for _ in range(count)]
+
+def _init_worker(doctor_keys, patient_ids):
+    global _worker_wallets, _worker_patient_ids
+    _worker_wallets = [
+        DoctorWallet.from_private_key(doctor_id, serialization.load_der_private_key(der, password=None))
+        for doctor_id, der in doctor_keys
+    ]
+    _worker_patient_ids = patient_ids
+
+def _sign_batch(seed, batch_index, count):
+    return [report.to_bytes() for report in
+            _generate_batch(_worker_wallets, _worker_patient_ids, seed, batch_index, count)]
+
+class LoadGenerator:
+    """
+    Produces signed HealthReports at a target rate (reports per second) or,
+    with rate=None, as fast as signing allows.
+
+    Signing is spread over `workers` processes (0 signs in the calling
+    thread), each holding copies of the doctors' private keys. Reports are
+    made in batches of `batch_size`; batch i always uses the RNG seeded from
+    (seed, i), so a run with the same seed produces the same report contents
+    (timestamps aside) whatever the number of workers.
+    """
+    def __init__(self, doctor_wallets, patient_ids, rate=None, workers=None, batch_size=50, seed=0):
+        self.doctor_wallets = list(doctor_wallets)
+        self.patient_ids = list(patient_ids)
+        self.rate = rate
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.batch_size = batch_size
+        self.seed = seed
+        self.generated = 0
+        self._pool = None
+        if self.workers > 0:
+            doctor_keys = [
+                (wallet.doctor_id, wallet.get_private_key().private_bytes(
+                    encoding=serialization.Encoding.DER,
+                    format=serialization.PrivateFormat.PKCS8,
+                    encryption_algorithm=serialization.NoEncryption()))
+                for wallet in self.doctor_wallets
+            ]
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             initargs=(doctor_keys, self.patient_ids))
+        else:
+            for wallet in self.doctor_wallets:
+                wallet.get_key_fingerprint() # Registers the keys so the reports verify here
+
+    def batches(self, total=None, stop_event=None):
+        """
+        Yields lists of signed HealthReports until `total` reports have been
+        produced or stop_event is set. Only a few batches per worker are signed
+        ahead of the consumer.
+        """
+        batch_index = 0
+        remaining = total
+        if self._pool is None:
+            while (remaining is None or remaining > 0) and not (stop_event and stop_event.is_set()):
+                count = self.batch_size if remaining is None else min(self.batch_size, remaining)
+                yield _generate_batch(self.doctor_wallets, self.patient_ids, self.seed, batch_index, count)
+                batch_index += 1
+                remaining = None if remaining is None else remaining - count
+            return
+
+        in_flight = deque()
+        try:
+            while True:
+                while len(in_flight) < 2 * self.workers and (remaining is None or remaining > 0):
+                    count = self.batch_size if remaining is None else min(self.batch_size, remaining)
+                    in_flight.append(self._pool.submit(_sign_batch, self.seed, batch_index, count))
+                    batch_index += 1
+                    remaining = None if remaining is None else remaining - count
+                if not in_flight or (stop_event and stop_event.is_set()):
+                    return
+                yield [HealthReport.from_bytes(data) for data in in_flight.popleft().result()]
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def run(self, sink, total=None, duration=None, stop_event=None):
+        """
+        Calls sink(report) for each generated report, paced to the target rate.
+        Stops after `total` reports, `duration` seconds or when stop_event is
+        set. Returns {'generated', 'elapsed', 'rate'}; rate falls short of the
+        target when signing (or the sink) cannot keep up.
+        """
+        stop_event = stop_event or threading.Event()
+        start = time.perf_counter()
+        sent = 0
+        for batch in self.batches(total, stop_event):
+            for report in batch:
+                now = time.perf_counter()
+                if duration is not None and now - start >= duration:
+                    stop_event.set()
+                    break
+                if self.rate:
+                    due = start + sent / self.rate
+                    if due > now:
+                        time.sleep(due - now)
+                sink(report)
+                sent += 1
+            if stop_event.is_set():
+                break
+        elapsed = time.perf_counter() - start
+        self.generated += sent
+        return {'generated': sent, 'elapsed': elapsed, 'rate': sent / elapsed if elapsed > 0 else 0.0}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
@@ -1,46 +1,189 @@
 #utxo_set.py
-from Signatures import serialize_public_key
-from collections import defaultdict
+from Signatures import deserialize_public_key, key_fingerprint
+from collections import deque
+from functools import lru_cache
 import threading
 
-class UTXOSet:
+FINGERPRINT_LENGTH = 32  # hex characters, as produced by Signatures.key_fingerprint
+
+@lru_cache(maxsize=4096)
+def _fingerprint_of_pem(pem):
+    return key_fingerprint(deserialize_public_key(pem))
+
+def balance_key(owner):
+    """
+    Fixed-size balance key for an owner, given as a key fingerprint, a PEM
+    public key (bytes or str) or a public key object.
+    """
+    if isinstance(owner, str):
+        if len(owner) == FINGERPRINT_LENGTH and not owner.startswith('-----'):
+            return owner
+        owner = owner.encode()
+    if isinstance(owner, bytes):
+        return _fingerprint_of_pem(owner)
+    return key_fingerprint(owner)
+
+class _Stripe:
+    __slots__ = ('lock', 'balances', 'version', 'frozen', 'frozen_version')
+
     def __init__(self):
-        self.utxos = defaultdict(float)  # {public_key_str: balance}
         self.lock = threading.Lock()
+        self.balances = {}       # fingerprint -> balance
+        self.version = 0         # bumped on every write
+        self.frozen = {}         # copy of balances handed out by snapshot()
+        self.frozen_version = 0
+
+class UTXOSet:
+    """
+    Balances keyed by public key fingerprint, split over `stripes` independently
+    locked shards so callers touching different keys do not contend.
+
+    apply_block() checks and applies a block's transactions in one pass, all or
+    nothing, and keeps the previous balances of every key it touched in an undo
+    log so rollback_block() can undo the latest blocks on a reorg.
+    snapshot() copies only the stripes written since the previous snapshot.
+    """
+    def __init__(self, stripes=16, max_undo=100):
+        self.stripes = [_Stripe() for _ in range(stripes)]
+        self.undo_log = deque(maxlen=max_undo)  # (block_id, {fingerprint: previous balance or None})
+        self.undo_lock = threading.Lock()
+        self._snapshot = {}
+        self._snapshot_versions = None
+        self._snapshot_lock = threading.Lock()
+
+    def _stripe_index(self, key):
+        return hash(key) % len(self.stripes)
+
+    def _stripe(self, key):
+        return self.stripes[self._stripe_index(key)]
 
-    def add_utxo(self, public_key, amount):
-        key = serialize_public_key(public_key).decode()
-        with self.lock:
-            self.utxos[key] += amount
+    def _lock_stripes(self, indices):
+        # Always in index order, so concurrent multi-stripe callers cannot deadlock
+        ordered = sorted(indices)
+        for index in ordered:
+            self.stripes[index].lock.acquire()
+        return ordered
 
-    def spend_utxo(self, public_key, amount):
-        key = serialize_public_key(public_key).decode()
-        with self.lock:
-            if self.utxos[key] >= amount:
-                self.utxos[key] -= amount
+    def _unlock_stripes(self, ordered):
+        for index in reversed(ordered):
+            self.stripes[index].lock.release()
+
+    def add_utxo(self, owner, amount):
+        key = balance_key(owner)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.balances[key] = stripe.balances.get(key, 0.0) + amount
+            stripe.version += 1
+
+    def spend_utxo(self, owner, amount):
+        key = balance_key(owner)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            balance = stripe.balances.get(key, 0.0)
+            if balance >= amount:
+                stripe.balances[key] = balance - amount
+                stripe.version += 1
                 return True
             return False
 
-    def get_balance(self, public_key):
-        key = serialize_public_key(public_key).decode()
-        with self.lock:
-            return self.utxos.get(key, 0.0)
+    def get_balance(self, owner):
+        key = balance_key(owner)
+        stripe = self._stripe(key)
+        with stripe.lock:
+            return stripe.balances.get(key, 0.0)
 
     def is_valid_transaction(self, tx):
-        key = tx.sender_pub
-        with self.lock:
-            if self.utxos[key] >= tx.amount:
-                return True
-            return False
+        return tx.amount >= 0 and self.get_balance(tx.sender_pub) >= tx.amount
 
     def apply_transaction(self, tx):
-        with self.lock:
-            if self.utxos[tx.sender_pub] >= tx.amount:
-                self.utxos[tx.sender_pub] -= tx.amount
-                self.utxos[tx.recipient_pub] += tx.amount
-                return True
-            return False
+        return self.apply_block([tx], record_undo=False)
+
+    def apply_block(self, transactions, block_id=None, record_undo=True):
+        """
+        Applies every transaction in order, or none of them. A sender may spend
+        funds received earlier in the same block. Returns True if the block was
+        applied, False if any transaction overspends or has a negative amount.
+        """
+        moves = []
+        for tx in transactions:
+            if tx.amount < 0:
+                return False
+            moves.append((balance_key(tx.sender_pub), balance_key(tx.recipient_pub), tx.amount))
+        if not moves:
+            return True
+
+        touched = {key for move in moves for key in move[:2]}
+        locked = self._lock_stripes({self._stripe_index(key) for key in touched})
+        try:
+            # Work on a local view of the touched balances; nothing is written until all pass
+            view = {}
+            for key in touched:
+                view[key] = self._stripe(key).balances.get(key)
+            for sender, recipient, amount in moves:
+                if (view[sender] or 0.0) < amount:
+                    return False
+                view[sender] = (view[sender] or 0.0) - amount
+                view[recipient] = (view[recipient] or 0.0) + amount
+
+            undo = {}
+            for key, balance in view.items():
+                stripe = self._stripe(key)
+                undo[key] = stripe.balances.get(key)
+                stripe.balances[key] = balance
+            for index in locked:
+                self.stripes[index].version += 1
+            if record_undo:
+                with self.undo_lock:
+                    self.undo_log.append((block_id, undo))
+            return True
+        finally:
+            self._unlock_stripes(locked)
+
+    def rollback_block(self, block_id=None):
+        """
+        Restores the balances from before the most recently applied block.
+        If block_id is given it must match that block. Returns False if there is
+        nothing to undo (or the ids differ), True otherwise.
+        """
+        with self.undo_lock:
+            if not self.undo_log or (block_id is not None and self.undo_log[-1][0] != block_id):
+                return False
+            _, undo = self.undo_log.pop()
+        locked = self._lock_stripes({self._stripe_index(key) for key in undo})
+        try:
+            for key, balance in undo.items():
+                stripe = self._stripe(key)
+                if balance is None:
+                    stripe.balances.pop(key, None)
+                else:
+                    stripe.balances[key] = balance
+            for index in locked:
+                self.stripes[index].version += 1
+        finally:
+            self._unlock_stripes(locked)
+        return True
 
     def snapshot(self):
-        with self.lock:
-            return dict(self.utxos)
+        """
+        Returns {fingerprint: balance}. The result is shared between callers
+        until the next write, so treat it as read-only; only stripes that changed
+        since the last call are copied.
+        """
+        with self._snapshot_lock:
+            locked = self._lock_stripes(range(len(self.stripes)))
+            try:
+                versions = tuple(stripe.version for stripe in self.stripes)
+                if versions == self._snapshot_versions:
+                    return self._snapshot
+                for stripe in self.stripes:
+                    if stripe.frozen_version != stripe.version:
+                        stripe.frozen = dict(stripe.balances)
+                        stripe.frozen_version = stripe.version
+            finally:
+                self._unlock_stripes(locked)
+            merged = {}
+            for stripe in self.stripes:
+                merged.update(stripe.frozen)
+            self._snapshot = merged
+            self._snapshot_versions = versions
+            return merged
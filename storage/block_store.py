@@ -0,0 +1,340 @@
+# storage/block_store.py
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from blockchain.block import Block
+
+# Segment record: 4-byte big-endian length, then Block.serialize() bytes
+RECORD_HEADER = struct.Struct('>I')
+# Height index entry (entry number == height): segment number, offset, length, raw block hash
+INDEX_ENTRY = struct.Struct('>IQI32s')
+# Hash table: header of (capacity, number of heights inserted), then slots of
+# (first 8 hash bytes, height + 1); 0 marks an empty slot
+HASH_HEADER = struct.Struct('>QQ')
+HASH_SLOT = struct.Struct('>QQ')
+# Difficulty index entry (entry number == height): the block's difficulty
+DIFFICULTY_ENTRY = struct.Struct('>B')
+
+class BlockStore:
+    """
+    Persistent, append-only block storage.
+
+    Blocks are appended to numbered segment files (blk00000.dat, ...). A
+    fixed-width index file maps height to (segment, offset, length), and an
+    open-addressing hash table file maps block hash to height. Both indexes
+    and all segments are read through mmap, so opening a store and looking up
+    a block costs the same whatever the chain length. Only the most recent
+    `hot_window` blocks are kept in memory. A one-byte-per-height difficulty
+    index lets headers() describe the chain without decoding any block.
+
+    Supports the list operations the rest of the code uses on a chain:
+    len(), store[-1], iteration and append(). truncate() drops blocks from
+    the top when a reorg disconnects them.
+    """
+    def __init__(self, directory, segment_size=64 * 1024 * 1024, hot_window=64, sync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.hot_window = hot_window
+        self.sync = sync
+        self.hot = OrderedDict() # height -> Block, most recent last
+        self.lock = threading.RLock()
+        self._segment_maps = {} # segment number -> mmap
+        self._stale_slots = 0 # hash slots left behind by truncate(), cleared on the next rebuild
+        os.makedirs(directory, exist_ok=True)
+
+        self._index_path = os.path.join(directory, 'index.dat')
+        self._hashes_path = os.path.join(directory, 'hashes.idx')
+        self._difficulties_path = os.path.join(directory, 'difficulties.idx')
+        self._index_file = open(self._index_path, 'a+b')
+        self._index_map = None
+        self._recover()
+        self._open_hash_table()
+        self._open_difficulty_index()
+
+    # --- file helpers -------------------------------------------------------
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"blk{segment:05d}.dat")
+
+    def _recover(self):
+        """Drops a torn index entry and any segment bytes (or later segments) not covered by the index."""
+        index_size = os.path.getsize(self._index_path)
+        self.count = index_size // INDEX_ENTRY.size
+        if index_size % INDEX_ENTRY.size:
+            self._index_file.truncate(self.count * INDEX_ENTRY.size)
+
+        if self.count:
+            segment, offset, length, _ = self._read_index_entry(self.count - 1)
+            self.active_segment = segment
+            self.active_offset = offset + RECORD_HEADER.size + length
+        else:
+            self.active_segment = 0
+            self.active_offset = 0
+        path = self._segment_path(self.active_segment)
+        if os.path.exists(path) and os.path.getsize(path) > self.active_offset:
+            with open(path, 'r+b') as f:
+                f.truncate(self.active_offset)
+        # A crash just after a rollover leaves a segment no index entry points into
+        number = self.active_segment + 1
+        while os.path.exists(self._segment_path(number)):
+            os.remove(self._segment_path(number))
+            number += 1
+        self._segment_file = open(path, 'ab')
+
+    def _read_index_entry(self, height):
+        position = height * INDEX_ENTRY.size
+        if self._index_map is None or len(self._index_map) < position + INDEX_ENTRY.size:
+            if self._index_map is not None:
+                self._index_map.close()
+            self._index_file.flush()
+            self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return INDEX_ENTRY.unpack_from(self._index_map, position)
+
+    def _segment_view(self, segment, end):
+        """Returns an mmap of the segment that covers at least `end` bytes."""
+        segment_map = self._segment_maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            if segment_map is not None:
+                segment_map.close()
+            if segment == self.active_segment:
+                self._segment_file.flush()
+            with open(self._segment_path(segment), 'rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._segment_maps[segment] = segment_map
+        return segment_map
+
+    # --- hash table ---------------------------------------------------------
+
+    def _open_hash_table(self):
+        if not os.path.exists(self._hashes_path):
+            self._rebuild_hash_table(max(1024, self.count * 4))
+            return
+        self._hashes_file = open(self._hashes_path, 'r+b')
+        self._hashes_map = mmap.mmap(self._hashes_file.fileno(), 0)
+        self.hash_capacity, indexed = HASH_HEADER.unpack_from(self._hashes_map, 0)
+        # Catch up on blocks whose hash slot was not written before a crash.
+        # Slots for heights dropped by _recover are ignored on lookup (height >= count).
+        for height in range(min(indexed, self.count), self.count):
+            self._insert_slot(self._hashes_map, self.hash_capacity, self._read_index_entry(height)[3], height)
+        HASH_HEADER.pack_into(self._hashes_map, 0, self.hash_capacity, self.count)
+
+    def _rebuild_hash_table(self, capacity):
+        """Writes a fresh table of the given capacity from the height index, then swaps it in."""
+        tmp_path = self._hashes_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HASH_HEADER.pack(capacity, self.count))
+            f.truncate(HASH_HEADER.size + capacity * HASH_SLOT.size)
+        with open(tmp_path, 'r+b') as f:
+            table = mmap.mmap(f.fileno(), 0)
+            for height in range(self.count):
+                raw_hash = self._read_index_entry(height)[3]
+                self._insert_slot(table, capacity, raw_hash, height)
+            table.flush()
+            table.close()
+        self._stale_slots = 0
+        if getattr(self, '_hashes_map', None) is not None:
+            self._hashes_map.close()
+            self._hashes_file.close()
+        os.replace(tmp_path, self._hashes_path)
+        self._hashes_file = open(self._hashes_path, 'r+b')
+        self._hashes_map = mmap.mmap(self._hashes_file.fileno(), 0)
+        self.hash_capacity = capacity
+
+    @staticmethod
+    def _insert_slot(table, capacity, raw_hash, height):
+        prefix = int.from_bytes(raw_hash[:8], 'big')
+        slot = prefix % capacity
+        while True:
+            position = HASH_HEADER.size + slot * HASH_SLOT.size
+            if HASH_SLOT.unpack_from(table, position)[1] == 0:
+                HASH_SLOT.pack_into(table, position, prefix, height + 1)
+                return
+            slot = (slot + 1) % capacity
+
+    def _lookup_height(self, raw_hash):
+        prefix = int.from_bytes(raw_hash[:8], 'big')
+        slot = prefix % self.hash_capacity
+        while True:
+            position = HASH_HEADER.size + slot * HASH_SLOT.size
+            slot_prefix, stored = HASH_SLOT.unpack_from(self._hashes_map, position)
+            if stored == 0:
+                return None
+            height = stored - 1
+            # Prefixes can collide; confirm against the full hash in the height index
+            if slot_prefix == prefix and height < self.count and self._read_index_entry(height)[3] == raw_hash:
+                return height
+            slot = (slot + 1) % self.hash_capacity
+
+    # --- difficulty index ---------------------------------------------------
+
+    def _open_difficulty_index(self):
+        self._difficulties_file = open(self._difficulties_path, 'a+b')
+        self._difficulties_file.seek(0)
+        self.difficulties = bytearray(self._difficulties_file.read())
+        if len(self.difficulties) > self.count:
+            del self.difficulties[self.count:]
+            self._difficulties_file.truncate(self.count * DIFFICULTY_ENTRY.size)
+        # Catch up on blocks appended before a crash, or by a store without this index
+        for height in range(len(self.difficulties), self.count):
+            self._append_difficulty(self.get(height).difficulty)
+        self._difficulties_file.flush()
+
+    def _append_difficulty(self, difficulty):
+        self._difficulties_file.write(DIFFICULTY_ENTRY.pack(difficulty))
+        self.difficulties.append(difficulty)
+
+    # --- public API ---------------------------------------------------------
+
+    def append(self, block):
+        """Appends the next block of the chain and returns its height."""
+        with self.lock:
+            if block.index != self.count:
+                raise ValueError(f"Expected block at height {self.count}, got {block.index}")
+            data = block.serialize()
+            if self.active_offset and self.active_offset + RECORD_HEADER.size + len(data) > self.segment_size:
+                self._segment_file.close()
+                self.active_segment += 1
+                self.active_offset = 0
+                # 'wb': a new segment starts empty, whatever a crash may have left behind
+                self._segment_file = open(self._segment_path(self.active_segment), 'wb')
+
+            offset = self.active_offset
+            self._segment_file.write(RECORD_HEADER.pack(len(data)))
+            self._segment_file.write(data)
+            self._segment_file.flush()
+            raw_hash = bytes.fromhex(block.hash)
+            self._index_file.write(INDEX_ENTRY.pack(self.active_segment, offset, len(data), raw_hash))
+            self._index_file.flush()
+            self._append_difficulty(block.difficulty)
+            self._difficulties_file.flush()
+            if self.sync:
+                os.fsync(self._segment_file.fileno())
+                os.fsync(self._index_file.fileno())
+                os.fsync(self._difficulties_file.fileno())
+            self.active_offset = offset + RECORD_HEADER.size + len(data)
+
+            height = self.count
+            self.count += 1
+            if (self.count + self._stale_slots) * 2 > self.hash_capacity:
+                self._rebuild_hash_table(self.hash_capacity * 2 if self.count * 2 > self.hash_capacity
+                                         else self.hash_capacity)
+            else:
+                self._insert_slot(self._hashes_map, self.hash_capacity, raw_hash, height)
+                HASH_HEADER.pack_into(self._hashes_map, 0, self.hash_capacity, self.count)
+
+            self.hot[height] = block
+            while len(self.hot) > self.hot_window:
+                self.hot.popitem(last=False)
+            return height
+
+    def truncate(self, height):
+        """Drops every block at or above height."""
+        with self.lock:
+            if height >= self.count:
+                return
+            segment, offset, _, _ = self._read_index_entry(max(height, 0))
+            # Views past the new end would point beyond the truncated files
+            for number in [n for n in self._segment_maps if n >= segment]:
+                self._segment_maps.pop(number).close()
+            self._index_map.close()
+            self._index_map = None
+            self._segment_file.close()
+            for number in range(segment + 1, self.active_segment + 1):
+                if os.path.exists(self._segment_path(number)):
+                    os.remove(self._segment_path(number))
+            with open(self._segment_path(segment), 'r+b') as f:
+                f.truncate(offset)
+            self._segment_file = open(self._segment_path(segment), 'ab')
+            self.active_segment = segment
+            self.active_offset = offset
+
+            self._index_file.truncate(max(height, 0) * INDEX_ENTRY.size)
+            self._index_file.flush()
+            del self.difficulties[max(height, 0):]
+            self._difficulties_file.truncate(max(height, 0) * DIFFICULTY_ENTRY.size)
+            if self.sync:
+                os.fsync(self._index_file.fileno())
+                os.fsync(self._difficulties_file.fileno())
+            # Slots of dropped heights stay in the table; lookups skip them because
+            # the height index no longer holds their hash
+            self._stale_slots += self.count - max(height, 0)
+            self.count = max(height, 0)
+            HASH_HEADER.pack_into(self._hashes_map, 0, self.hash_capacity, self.count)
+            for dropped in [h for h in self.hot if h >= self.count]:
+                del self.hot[dropped]
+
+    def get(self, height):
+        """Returns the block at the given height, or None if there is none."""
+        with self.lock:
+            if height < 0 or height >= self.count:
+                return None
+            block = self.hot.get(height)
+            if block is not None:
+                return block
+            return Block.deserialize(self.get_raw(height))
+
+    def get_raw(self, height):
+        """Returns the stored record of the block at the given height (Block.serialize() bytes), or None."""
+        with self.lock:
+            if height < 0 or height >= self.count:
+                return None
+            segment, offset, length, _ = self._read_index_entry(height)
+            start = offset + RECORD_HEADER.size
+            view = self._segment_view(segment, start + length)
+            return view[start:start + length]
+
+    def get_by_hash(self, block_hash):
+        """Returns the block with the given hex hash, or None if it is not stored."""
+        with self.lock:
+            height = self._lookup_height(bytes.fromhex(block_hash))
+            return None if height is None else self.get(height)
+
+    def height_of(self, block_hash):
+        """Returns the height of the block with the given hex hash, or None."""
+        with self.lock:
+            return self._lookup_height(bytes.fromhex(block_hash))
+
+    def headers(self):
+        """Yields (hex hash, difficulty) for every height, read from the indexes alone."""
+        with self.lock:
+            count = self.count
+        for height in range(count):
+            with self.lock:
+                raw_hash = self._read_index_entry(height)[3]
+                difficulty = self.difficulties[height]
+            yield raw_hash.hex(), difficulty
+
+    def tip(self):
+        return self.get(self.count - 1)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, height):
+        if height < 0:
+            height += self.count
+        block = self.get(height)
+        if block is None:
+            raise IndexError("block height out of range")
+        return block
+
+    def __iter__(self):
+        for height in range(self.count):
+            yield self.get(height)
+
+    def close(self):
+        with self.lock:
+            for segment_map in self._segment_maps.values():
+                segment_map.close()
+            self._segment_maps.clear()
+            if self._index_map is not None:
+                self._index_map.close()
+                self._index_map = None
+            self._hashes_map.flush()
+            self._hashes_map.close()
+            self._hashes_file.close()
+            self._segment_file.close()
+            self._index_file.close()
+            self._difficulties_file.close()
@@ -0,0 +1,38 @@
+# tests/test_block_tree.py
+import threading
+from blockchain.block import Block
+from blockchain.block_tree import BlockTree
+from history.history_tracker import PatientHistoryTracker
+from network.node import NodeNetwork
+from proof_of_work import mine_block
+from reports.health_report import HealthReport
+from wallets.doctor_wallet import DoctorWallet
+
+DIFFICULTY = 2
+
+def genesis():
+    block = Block(0, [], "0", DIFFICULTY)
+    block.timestamp = 0
+    block.hash = block.compute_hash()
+    return block
+
+def test_block_below_network_difficulty_is_rejected():
+    node = NodeNetwork(num_miners=1, difficulty=DIFFICULTY)
+    node.blockchain = [genesis()]
+    report = HealthReport.generate("patient_1", DoctorWallet("doctor_1"))
+    # Difficulty 0: any hash "meets" it, so has_valid_proof() alone would pass
+    cheap = Block(1, [report], node.blockchain[0].hash, 0)
+    assert cheap.has_valid_proof()
+    assert not node.broadcast_block(cheap, lambda r: r.verify_signature(), PatientHistoryTracker())
+    assert len(node.blockchain) == 1
+
+    mined = mine_block(Block(1, [report], node.blockchain[0].hash, DIFFICULTY), DIFFICULTY, threading.Event())
+    assert node.broadcast_block(mined, lambda r: r.verify_signature(), PatientHistoryTracker())
+    assert node.blockchain[-1].hash == mined.hash
+
+def test_tree_marks_low_difficulty_blocks_invalid():
+    chain = [genesis()]
+    tree = BlockTree(chain, min_difficulty=DIFFICULTY)
+    assert tree.add(Block(1, [], chain[0].hash, DIFFICULTY - 1)).status == 'invalid'
+    assert tree.add(Block(5, [], "ab" * 32, 0)).status == 'invalid' # Not even held as an orphan
+    assert len(chain) == 1 and not tree.orphans
@@ -0,0 +1,40 @@
+# tests/test_encoding.py
+import pytest
+from mempool.mempool import Mempool
+from reports.health_report import HealthReport
+from utils.encoding import decode, encode
+from wallets.doctor_wallet import DoctorWallet
+
+def signed_report():
+    return HealthReport.generate("patient_1", DoctorWallet("doctor_1"))
+
+def test_round_trip():
+    value = {'a': [1, -5, 2.5, 'x', b'y', None, True, False, {'b': 300}], 'b': ()}
+    assert decode(encode(value)) == {'a': [1, -5, 2.5, 'x', b'y', None, True, False, {'b': 300}], 'b': []}
+
+@pytest.mark.parametrize('data', [
+    b'i\x80\x00',              # padded varint
+    b'm\x02\x01bN\x01aN',      # keys out of order
+    b'm\x02\x01aN\x01aN',      # duplicate key
+    b'NN',                     # trailing bytes
+    b's\x05ab',                # truncated string
+    b'i',                      # truncated varint
+])
+def test_decode_rejects_non_canonical_input(data):
+    with pytest.raises(ValueError):
+        decode(data)
+
+def test_report_with_extra_field_is_rejected():
+    report = signed_report()
+    data = report.to_bytes()
+    fields = decode(data, 1)
+    fields['zz_junk'] = 1
+    padded = data[:1] + encode(fields)
+    with pytest.raises(ValueError):
+        HealthReport.from_bytes(padded)
+
+    received = HealthReport.from_bytes(data)
+    assert received.digest() == report.digest()
+    mempool = Mempool(validate_on_admission=True)
+    assert mempool.add_report(received)
+    assert not mempool.add_report(HealthReport.from_bytes(data))
@@ -0,0 +1,104 @@
+# tests/test_p2p_sync.py
+import asyncio
+import threading
+from blockchain.block import Block
+from network.p2p_node import FETCH_BATCH, GETBLOCKS_LIMIT, P2PNode
+from proof_of_work import mine_block
+from Signatures import generate_keys, key_fingerprint, key_registry, serialize_public_key
+
+DIFFICULTY = 1
+
+def extend_chain(node, count):
+    """Mines `count` empty blocks onto the node's chain through its NodeNetwork."""
+    never = threading.Event()
+    for _ in range(count):
+        tip = node.chain[-1]
+        block = mine_block(Block(tip.index + 1, [], tip.hash, DIFFICULTY), DIFFICULTY, never)
+        assert node.network.broadcast_block(block, node._vote, node.history)
+
+async def sync_blocks(count, max_inflight_requests, max_queued_fetches=2 * GETBLOCKS_LIMIT, timeout=30.0):
+    source = P2PNode('source', difficulty=DIFFICULTY, max_inflight_requests=max_inflight_requests)
+    follower = P2PNode('follower', difficulty=DIFFICULTY, max_inflight_requests=max_inflight_requests,
+                       max_queued_fetches=max_queued_fetches)
+    await source.start()
+    await follower.start()
+    try:
+        extend_chain(source, count)
+        await follower.connect('127.0.0.1', source.port)
+        deadline = asyncio.get_running_loop().time() + timeout
+        while follower.chain[-1].hash != source.chain[-1].hash:
+            assert asyncio.get_running_loop().time() < deadline, \
+                f"follower stuck at height {follower.chain[-1].index} of {count}"
+            await asyncio.sleep(0.05)
+        return follower
+    finally:
+        await follower.stop()
+        await source.stop()
+
+def test_sync_more_blocks_than_request_slots_cover():
+    max_inflight_requests = 2
+    count = 5 * max_inflight_requests * FETCH_BATCH
+    follower = asyncio.run(sync_blocks(count, max_inflight_requests))
+    assert len(follower.chain) == count + 1
+    assert not follower.block_tree.orphans
+
+def test_sync_through_a_small_fetch_queue():
+    count = GETBLOCKS_LIMIT + 100
+    follower = asyncio.run(sync_blocks(count, max_inflight_requests=2, max_queued_fetches=4 * FETCH_BATCH))
+    assert len(follower.chain) == count + 1
+
+async def repeat_inv(repeats, ids, max_queued_fetches):
+    source = P2PNode('source', difficulty=DIFFICULTY)
+    follower = P2PNode('follower', difficulty=DIFFICULTY, max_inflight_requests=1,
+                       max_queued_fetches=max_queued_fetches)
+    await source.start()
+    await follower.start()
+    started = []
+    fetch = follower._fetch
+    def counting_fetch(peer, kind, batch):
+        started.append(len(batch))
+        return fetch(peer, kind, batch)
+    follower._fetch = counting_fetch
+    try:
+        await follower.connect('127.0.0.1', source.port)
+        peer = next(iter(follower.peers))
+        for _ in range(repeats):
+            await follower._on_inv(peer, {'type': 'inv', 'kind': 'report', 'ids': ids})
+        return sum(started), len(peer.queued)
+    finally:
+        await follower.stop()
+        await source.stop()
+
+def test_repeated_inv_queues_each_id_once():
+    ids = [f"{i:064x}" for i in range(3 * FETCH_BATCH)]
+    fetched, queued = asyncio.run(repeat_inv(100, ids, max_queued_fetches=1000))
+    assert fetched == queued == len(ids)
+
+def test_inv_beyond_the_fetch_queue_is_dropped():
+    ids = [f"{i:064x}" for i in range(1000)]
+    fetched, queued = asyncio.run(repeat_inv(3, ids, max_queued_fetches=100))
+    assert fetched == queued == 100
+
+async def deliver_keys(items, requested=()):
+    node = P2PNode('node', difficulty=DIFFICULTY)
+    node.loop = asyncio.get_running_loop()
+    futures = {fingerprint: node.loop.create_future() for fingerprint in requested}
+    node.inflight.update({('key', fingerprint): future for fingerprint, future in futures.items()})
+    await node._on_data(None, {'type': 'data', 'kind': 'key', 'items': items})
+    return {fingerprint: future.result() if future.done() else None for fingerprint, future in futures.items()}
+
+def new_key():
+    _, public_key = generate_keys()
+    return key_fingerprint(public_key), serialize_public_key(public_key)
+
+def test_unrequested_keys_are_not_registered():
+    fingerprint, pem = new_key()
+    asyncio.run(deliver_keys([pem]))
+    assert fingerprint not in key_registry
+
+def test_requested_key_resolves_its_request_only():
+    fingerprint, pem = new_key()
+    _, other_pem = new_key()
+    results = asyncio.run(deliver_keys([pem, other_pem], requested=[fingerprint]))
+    assert results == {fingerprint: pem}
+    assert fingerprint not in key_registry # Registered by _ensure_keys, not on arrival
@@ -0,0 +1,146 @@
+# utils/encoding.py
+"""
+Canonical, deterministic binary encoding used for hashing, signing and storage.
+
+Every value is a one-byte tag followed by its payload:
+
+    N              None
+    T / F          True / False
+    i <varint>     int (zigzag-encoded)
+    d <8 bytes>    float (IEEE 754 big-endian)
+    s <len> utf-8  str
+    b <len> raw    bytes
+    l <n> items    list or tuple
+    m <n> pairs    dict with str keys, sorted by key; keys are written as <len> utf-8
+
+Lengths and counts are unsigned LEB128 varints. The same value always encodes
+to the same bytes, independent of Python version or dict insertion order.
+decode() accepts only that encoding (minimal varints, map keys in strictly
+increasing order, no trailing bytes), so decoded bytes can be hashed as-is.
+"""
+import struct
+
+_FLOAT = struct.Struct('>d')
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            if byte == 0 and shift:
+                raise ValueError(f"Non-minimal varint ending at offset {offset - 1}")
+            return result, offset
+        shift += 7
+
+def _read_raw(data, offset):
+    length, offset = _read_varint(data, offset)
+    if offset + length > len(data):
+        raise ValueError(f"Truncated value at offset {offset}")
+    return bytes(data[offset:offset + length]), offset + length
+
+def _write_str(out, value):
+    raw = value.encode('utf-8')
+    _write_varint(out, len(raw))
+    out += raw
+
+def _encode_into(out, value):
+    if value is None:
+        out += b'N'
+    elif value is True:
+        out += b'T'
+    elif value is False:
+        out += b'F'
+    elif isinstance(value, int):
+        out += b'i'
+        _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif isinstance(value, float):
+        out += b'd'
+        out += _FLOAT.pack(value)
+    elif isinstance(value, str):
+        out += b's'
+        _write_str(out, value)
+    elif isinstance(value, (bytes, bytearray)):
+        out += b'b'
+        _write_varint(out, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out += b'l'
+        _write_varint(out, len(value))
+        for item in value:
+            _encode_into(out, item)
+    elif isinstance(value, dict):
+        out += b'm'
+        _write_varint(out, len(value))
+        for key in sorted(value):
+            if not isinstance(key, str):
+                raise TypeError(f"Map keys must be str, got {type(key).__name__}")
+            _write_str(out, key)
+            _encode_into(out, value[key])
+    else:
+        raise TypeError(f"Cannot encode value of type {type(value).__name__}")
+
+def encode(value):
+    """Returns the canonical binary encoding of value."""
+    out = bytearray()
+    _encode_into(out, value)
+    return bytes(out)
+
+def _decode_from(data, offset):
+    tag = data[offset]
+    offset += 1
+    if tag == 0x4E: # N
+        return None, offset
+    if tag == 0x54: # T
+        return True, offset
+    if tag == 0x46: # F
+        return False, offset
+    if tag == 0x69: # i
+        raw, offset = _read_varint(data, offset)
+        return (raw >> 1) if not raw & 1 else -((raw + 1) >> 1), offset
+    if tag == 0x64: # d
+        return _FLOAT.unpack_from(data, offset)[0], offset + _FLOAT.size
+    if tag in (0x73, 0x62): # s, b
+        raw, offset = _read_raw(data, offset)
+        return (raw.decode('utf-8') if tag == 0x73 else raw), offset
+    if tag == 0x6C: # l
+        count, offset = _read_varint(data, offset)
+        items = []
+        for _ in range(count):
+            item, offset = _decode_from(data, offset)
+            items.append(item)
+        return items, offset
+    if tag == 0x6D: # m
+        count, offset = _read_varint(data, offset)
+        result = {}
+        previous = None
+        for _ in range(count):
+            raw, offset = _read_raw(data, offset)
+            key = raw.decode('utf-8')
+            if previous is not None and key <= previous:
+                raise ValueError(f"Map key {key!r} is duplicated or out of order")
+            result[key], offset = _decode_from(data, offset)
+            previous = key
+        return result, offset
+    raise ValueError(f"Unknown encoding tag {tag!r} at offset {offset - 1}")
+
+def decode(data, offset=0):
+    """
+    Decodes the value that fills data from offset to the end. Raises
+    ValueError if the bytes are not exactly its canonical encoding.
+    """
+    try:
+        value, end = _decode_from(data, offset)
+    except (IndexError, struct.error):
+        raise ValueError("Truncated encoding")
+    if end != len(data):
+        raise ValueError(f"{len(data) - end} trailing bytes after the encoded value")
+    return value
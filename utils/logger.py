@@ -1,13 +1,78 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
 
+# All loggers hand records to one queue; a single background thread formats
+# and writes them, so callers never wait on terminal I/O. Messages are only
+# rendered if the logger's level lets them through, and then on the writer
+# thread, so expensive arguments (e.g. a Block) cost nothing on the caller.
+_queue = queue.SimpleQueue()
+_listener = None
+_level = logging.DEBUG
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting (and %-argument rendering) to the writer thread."""
+    def prepare(self, record):
+        return record
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line; extra={'fields': {...}} adds structured fields."""
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+_handler = DeferredQueueHandler(_queue)
+
+def configure_logging(level=logging.DEBUG, structured=False, stream=None):
+    """
+    Starts (or restarts) the background writer. structured=True switches the
+    output to JSON lines. Call before creating loggers to change the level
+    they start with; setup_logger also starts the writer with defaults.
+    """
+    global _listener, _level
+    if _listener is not None:
+        _listener.stop()
+    _level = level
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if structured:
+        handler.setFormatter(JsonLinesFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('[%(asctime)s] [%(name)s] %(message)s', datefmt='%H:%M:%S'))
+    _listener = logging.handlers.QueueListener(_queue, handler)
+    _listener.start()
+    for name in list(logging.Logger.manager.loggerDict):
+        logger = logging.getLogger(name)
+        if _handler in logger.handlers:
+            logger.setLevel(level)
+
+def shutdown_logging():
+    """Flushes everything still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
+
 def setup_logger(name):
+    if _listener is None:
+        configure_logging(_level)
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
-    handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter('[%(asctime)s] [%(name)s] %(message)s', datefmt='%H:%M:%S')
-    handler.setFormatter(formatter)
-    if not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
-        logger.addHandler(handler)
+    logger.setLevel(_level)
+    if _handler not in logger.handlers:
+        logger.addHandler(_handler)
     logger.propagate = False
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,309 @@
+# utils/metrics.py
+"""
+In-process metrics: counters, gauges and histograms kept in a registry and
+exposed in the Prometheus text format over HTTP (MetricsServer) and as JSON
+snapshots (MetricsRegistry.snapshot, SnapshotWriter).
+
+Recording a value is one uncontended lock and an add, so instrumentation can
+stay on in production; hot loops record once per unit of work (a mining
+attempt, a batch), never per iteration. Values that already live elsewhere
+(mempool depth, cache hit counts) are read through set_function() at
+collection time and cost nothing in between.
+"""
+import bisect
+import json
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds; suits signature checks (sub-millisecond) up to block votes (seconds)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _Value:
+    """A single counter or gauge value."""
+    __slots__ = ('_value', '_function', '_lock')
+
+    def __init__(self):
+        self._value = 0.0
+        self._function = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        """Reads the value from function() whenever it is collected."""
+        self._function = function
+
+    @property
+    def value(self):
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+class _HistogramValue:
+    """Bucketed observations with their count and sum."""
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @property
+    def value(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, buckets = 0, {}
+        for bound, bucket_count in zip(self.bounds + (math.inf,), counts):
+            cumulative += bucket_count
+            buckets[bound] = cumulative
+        return {'buckets': buckets, 'sum': total, 'count': count}
+
+class Metric:
+    """
+    A named metric, optionally split by labels. With no labelnames the
+    metric records directly (counter.inc()); otherwise pick a series with
+    labels() first (counter.labels(miner=3).inc()). Series are created on
+    first use and kept for the life of the process.
+    """
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}  # label values -> value object
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._series[()] = self._new_value()
+
+    def _new_value(self):
+        return _Value()
+
+    def labels(self, *values, **labels):
+        if labels:
+            values = tuple(labels[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                series = self._series.setdefault(key, self._new_value())
+        return series
+
+    def series(self):
+        """Returns [(labels dict, value)] for every series of this metric."""
+        with self._lock:
+            items = list(self._series.items())
+        return [(dict(zip(self.labelnames, key)), series.value) for key, series in items]
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_value(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+def _format_number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+class MetricsRegistry:
+    """
+    Holds metrics by name. counter(), gauge() and histogram() return the
+    existing metric when the name is already registered, so modules can
+    declare the metrics they use at import time.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda metric: metric.name)
+
+    def render_prometheus(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in metric.series():
+                if metric.kind == 'histogram':
+                    for bound, count in value['buckets'].items():
+                        lines.append(f"{metric.name}_bucket{_format_labels(labels, {'le': _format_number(bound)})} {count}")
+                    lines.append(f"{metric.name}_sum{_format_labels(labels)} {_format_number(value['sum'])}")
+                    lines.append(f"{metric.name}_count{_format_labels(labels)} {value['count']}")
+                else:
+                    lines.append(f"{metric.name}{_format_labels(labels)} {_format_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """
+        Returns {'timestamp', 'metrics': {name: {'type', 'help', 'series'}}};
+        each series is {'labels', 'value'}, and histogram values are
+        {'buckets': {upper bound (str): cumulative count}, 'sum', 'count'}.
+        """
+        metrics = {}
+        for metric in self.metrics():
+            series = []
+            for labels, value in metric.series():
+                if metric.kind == 'histogram':
+                    value = dict(value, buckets={_format_number(bound): count
+                                                 for bound, count in value['buckets'].items()})
+                series.append({'labels': labels, 'value': value})
+            metrics[metric.name] = {'type': metric.kind, 'help': metric.help, 'series': series}
+        return {'timestamp': time.time(), 'metrics': metrics}
+
+# Shared by every instrumented component in the process
+registry = MetricsRegistry()
+
+class MetricsServer:
+    """
+    Serves a registry over HTTP from a daemon thread: /metrics in the
+    Prometheus text format and /metrics.json as a snapshot. Binds to
+    localhost by default; port 0 picks a free port (see .port).
+    """
+    def __init__(self, registry=registry, host='127.0.0.1', port=9100):
+        self.registry = registry
+        self.host = host
+        self.requested_port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = registry.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(registry.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Scrapes are not worth a log line each
+
+        self._server = ThreadingHTTPServer((self.host, self.requested_port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server else None
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class SnapshotWriter(threading.Thread):
+    """Appends a JSON snapshot of the registry to `path`, one line every `interval` seconds."""
+    def __init__(self, path, interval=30.0, registry=registry):
+        super().__init__(name="MetricsSnapshotWriter", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopped = threading.Event()
+
+    def write_snapshot(self):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(self.registry.snapshot()) + '\n')
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write_snapshot()
+
+    def stop(self):
+        self.stopped.set()
@@ -1,16 +1,78 @@
 # wallets/doctor_wallet.py
-from Signatures import generate_keys, serialize_public_key
+import threading
+from Signatures import generate_keys, get_scheme, scheme_for_key, serialize_public_key, key_registry
 
 class DoctorWallet:
     """
     Represents a doctor's wallet, holding their private and public keys
-    for signing health reports.
+    for signing health reports. scheme picks the signature backend
+    (Signatures.DEFAULT_SCHEME if None).
+
+    Keys are created (or, with a keystore, loaded) the first time they are
+    needed, not when the wallet is built. With a keystore the doctor keeps the
+    same key, and so the same fingerprint, across restarts; a stored key's
+    type decides the scheme.
     """
-    def __init__(self, doctor_id):
+    def __init__(self, doctor_id, scheme=None, keystore=None):
         self.doctor_id = doctor_id
-        self.private_key, self.public_key = generate_keys()
+        self.keystore = keystore
+        self._requested_scheme = get_scheme(scheme).name
+        self._private_key = None
+        self._public_key = None
+        self._public_key_serialized = None
+        self._key_fingerprint = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_private_key(cls, doctor_id, private_key):
+        """Builds a wallet around an existing private key (e.g. one sent to a worker process)."""
+        wallet = cls(doctor_id, scheme=scheme_for_key(private_key).name)
+        wallet._set_keys(private_key, private_key.public_key())
+        return wallet
+
+    def _ensure_keys(self):
+        if self._private_key is not None:
+            return
+        with self._lock:
+            if self._private_key is not None:
+                return
+            if self.keystore is not None:
+                private_key, public_key = self.keystore.get_or_create(self.doctor_id, self._requested_scheme)
+            else:
+                private_key, public_key = generate_keys(self._requested_scheme)
+            self._set_keys(private_key, public_key)
+
+    def _set_keys(self, private_key, public_key):
         # Store serialized public key for easy inclusion in reports
-        self.public_key_serialized = serialize_public_key(self.public_key).decode()
+        self._public_key_serialized = serialize_public_key(public_key).decode()
+        # Register the key once; reports carry only this fingerprint
+        self._key_fingerprint = key_registry.register_key(public_key)
+        self._public_key = public_key
+        self._private_key = private_key # Set last: other threads check it without the lock
+
+    @property
+    def private_key(self):
+        self._ensure_keys()
+        return self._private_key
+
+    @property
+    def public_key(self):
+        self._ensure_keys()
+        return self._public_key
+
+    @property
+    def public_key_serialized(self):
+        self._ensure_keys()
+        return self._public_key_serialized
+
+    @property
+    def key_fingerprint(self):
+        self._ensure_keys()
+        return self._key_fingerprint
+
+    @property
+    def signature_scheme(self):
+        return scheme_for_key(self.private_key).name
 
     def get_public_key(self):
         """Returns the doctor's public key object."""
@@ -24,6 +86,9 @@ class DoctorWallet:
         """Returns the doctor's public key in a serialized (string) format."""
         return self.public_key_serialized
 
+    def get_key_fingerprint(self):
+        """Returns the fingerprint under which the public key is registered."""
+        return self.key_fingerprint
+
     def __str__(self):
         return f"DoctorWallet(ID: {self.doctor_id}, Public Key: {self.public_key_serialized[:10]}...)"
-
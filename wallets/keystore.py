@@ -0,0 +1,77 @@
+# wallets/keystore.py
+import os
+import threading
+from urllib.parse import quote
+from cryptography.hazmat.primitives import serialization
+from Signatures import generate_keys
+
+class KeyStore:
+    """
+    Saves private keys to disk, one file per owner id, so wallets keep the
+    same identity across restarts.
+
+    Without a passphrase keys are stored as unencrypted PKCS#8 DER (<id>.der),
+    which loads quickly. With a passphrase they are stored as encrypted
+    PKCS#8 PEM (<id>.pem). Both formats hold RSA and Ed25519 keys; the
+    signature scheme follows from the key type. Nothing is read until a key
+    is asked for, so opening a store costs the same however many keys it holds.
+    """
+    def __init__(self, directory, passphrase=None):
+        self.directory = directory
+        self.passphrase = passphrase.encode('utf-8') if isinstance(passphrase, str) else passphrase
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, owner_id):
+        # quote() keeps ids readable while making any id a safe file name
+        extension = 'pem' if self.passphrase else 'der'
+        return os.path.join(self.directory, f"{quote(owner_id, safe='')}.{extension}")
+
+    def load(self, owner_id):
+        """Returns the private key stored for owner_id, or None if there is none."""
+        path = self._path(owner_id)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        if self.passphrase:
+            return serialization.load_pem_private_key(data, password=self.passphrase)
+        return serialization.load_der_private_key(data, password=None)
+
+    def save(self, owner_id, private_key):
+        """Writes the key for owner_id atomically, readable only by this user."""
+        if self.passphrase:
+            data = private_key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.BestAvailableEncryption(self.passphrase)
+            )
+        else:
+            data = private_key.private_bytes(
+                encoding=serialization.Encoding.DER,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+        path = self._path(owner_id)
+        tmp_path = path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def get_or_create(self, owner_id, scheme=None):
+        """
+        Returns (private_key, public_key) for owner_id, generating and saving a
+        new key of the given scheme the first time the id is seen.
+        """
+        with self.lock:
+            private_key = self.load(owner_id)
+            if private_key is None:
+                private_key, _ = generate_keys(scheme)
+                self.save(owner_id, private_key)
+        return private_key, private_key.public_key()
+
+    def __contains__(self, owner_id):
+        return os.path.exists(self._path(owner_id))
@@ -1,9 +1,40 @@
+import threading
 from Signatures import generate_keys
 
 class PatientWallet:
-    def __init__(self, patient_id):
+    """
+    A patient's keypair. Keys are only generated (or loaded from the keystore,
+    if one is given) on first use, so creating wallets for every registered
+    patient costs no key generation at startup.
+    """
+    def __init__(self, patient_id, keystore=None):
         self.patient_id = patient_id
-        self.private_key, self.public_key = generate_keys()
+        self.keystore = keystore
+        self._private_key = None
+        self._public_key = None
+        self._lock = threading.Lock()
+
+    def _ensure_keys(self):
+        if self._private_key is not None:
+            return
+        with self._lock:
+            if self._private_key is None:
+                if self.keystore is not None:
+                    private_key, public_key = self.keystore.get_or_create(self.patient_id)
+                else:
+                    private_key, public_key = generate_keys()
+                self._public_key = public_key
+                self._private_key = private_key
+
+    @property
+    def private_key(self):
+        self._ensure_keys()
+        return self._private_key
+
+    @property
+    def public_key(self):
+        self._ensure_keys()
+        return self._public_key
 
     def get_public_key(self):
         return self.public_key